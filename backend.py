@@ -1,127 +1,1204 @@
-import pandas as pd
 import sqlite3
 import hashlib
-import matplotlib.pyplot as plt
 from dateutil.relativedelta import relativedelta
 import datetime
+import atexit
+import bisect
+import collections
+import contextvars
+import copy
+import functools
+import heapq
+import importlib
+import io
+import itertools
+import json
+import os
+import queue
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from sqlite3 import IntegrityError
+from pathlib import Path
 
-conn = sqlite3.connect('academia_db.db', check_same_thread=False)
-cursor = conn.cursor()
 
-# 2) Criação das tabelas
+class _ModuloTardio:
+    """
+    Substituto de um módulo pesado que só faz o import no primeiro acesso a um
+    atributo (ex.: pd.read_sql_query). A partir daí o nome global passa a
+    apontar para o módulo real.
+    """
 
-# Cria a tabela de clientes, com referências a plano, instrutor e treino
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS clientes (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT NOT NULL,
-    idade INTEGER NOT NULL,
-    sexo TEXT NOT NULL,
-    email TEXT UNIQUE NOT NULL,
-    telefone TEXT NOT NULL,
-    plano_id INTEGER NOT NULL,
-    instrutor_id INTEGER NOT NULL,
-    treino_id INTEGER,
-    FOREIGN KEY(instrutor_id) REFERENCES instrutores(id),
-    FOREIGN KEY(treino_id)    REFERENCES treinos(id),
-    FOREIGN KEY(plano_id)     REFERENCES planos(id)
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS instrutores (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT NOT NULL,
-    especialidade TEXT,
-    UNIQUE (nome, especialidade)
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS planos (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT NOT NULL,
-    preco_mensal REAL NOT NULL,
-    duracao_meses INTEGER NOT NULL,
-    UNIQUE (nome, preco_mensal, duracao_meses)
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS exercicios (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT NOT NULL,
-    grupo_muscular TEXT NOT NULL,
-    UNIQUE (nome, grupo_muscular)
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS treinos (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    cliente_id INTEGER NOT NULL,
-    instrutor_id INTEGER NOT NULL,
-    data_inicio TEXT,
-    data_fim TEXT,
-    plano_id INTEGER,
-    FOREIGN KEY(cliente_id)   REFERENCES clientes(id),
-    FOREIGN KEY(instrutor_id) REFERENCES instrutores(id),
-    FOREIGN KEY(plano_id)     REFERENCES planos(id),
-    UNIQUE (cliente_id, instrutor_id, data_inicio, data_fim, plano_id)
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS treino_exercicios (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    treino_id INTEGER NOT NULL,
-    treino TEXT,
-    exercicio_id INTEGER NOT NULL,
-    exercicio TEXT,
-    series INTEGER NOT NULL,
-    repeticoes INTEGER NOT NULL,
-    FOREIGN KEY(treino_id)    REFERENCES treinos(id),
-    FOREIGN KEY(exercicio_id) REFERENCES exercicios(id),
-    UNIQUE (treino_id, exercicio_id, series, repeticoes)
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS pagamentos (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    cliente_id INTEGER NOT NULL,
-    data_pagamento TEXT NOT NULL,
-    valor_pago REAL NOT NULL,
-    plano_id INTEGER NOT NULL,
-    FOREIGN KEY(cliente_id) REFERENCES clientes(id),
-    FOREIGN KEY(plano_id)   REFERENCES planos(id),
-    UNIQUE (cliente_id, data_pagamento, valor_pago, plano_id)
-);
-""")
-
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL
-    );
-''')
+    def __init__(self, nome, apelido):
+        self._nome = nome
+        self._apelido = apelido
 
-conn.commit()
+    def __getattr__(self, atributo):
+        modulo = importlib.import_module(self._nome)
+        globals()[self._apelido] = modulo
+        return getattr(modulo, atributo)
 
-# 3) Carregando os CSVs
-# Dados dos arquivos 
-df_clientes         = pd.read_csv('clientes_academia.csv',    sep=',', encoding='utf-8')
-df_instrutores      = pd.read_csv('instrutores.csv',         sep=',', encoding='utf-8')
-df_exercicios       = pd.read_csv('exercicios.csv',          sep=',', encoding='utf-8')
-df_planos           = pd.read_csv('planos.csv',              sep=',', encoding='utf-8')
-df_treinos          = pd.read_csv('treinos.csv',             sep=',', encoding='utf-8')
-df_treino_exercicios = pd.read_csv('treino_exercicios.csv', sep=',', encoding='utf-8')
-df_pagamentos       = pd.read_csv('pagamento_clientes.csv',  sep=',', encoding='utf-8')
+
+# pandas custa ~0,4 s para importar; só é carregado quando a primeira consulta precisa dele
+pd = _ModuloTardio("pandas", "pd")
+np = _ModuloTardio("numpy", "np")
+
+# 1) Gerenciamento de conexões
+# Todas as funções do backend pegam conexões de um pool limitado por processo:
+# - conexões de escrita em modo WAL, com busy_timeout, usadas com BEGIN IMMEDIATE
+# - conexões somente leitura (mode=ro) para as consultas
+# Assim vários processos do Streamlit podem compartilhar o mesmo arquivo sem
+# "database is locked" e sem vazar handles de arquivo.
+DB_PATH = os.environ.get("ACADEMIA_DB", "academia_db.db")
+
+BUSY_TIMEOUT_MS      = 5000   # Quanto o SQLite espera por um lock antes de devolver SQLITE_BUSY
+TAMANHO_POOL_LEITURA = 8      # Conexões somente leitura abertas ao mesmo tempo, por processo
+TAMANHO_POOL_ESCRITA = 1      # O SQLite só tem um escritor por vez; mais conexões só disputariam o lock
+ESPERA_POOL_SEG      = 30     # Tempo máximo esperando uma conexão livre no pool
+TENTATIVAS_OCUPADO   = 5      # Tentativas de uma operação que recebeu SQLITE_BUSY/LOCKED
+
+# Unidades (filiais): cada uma tem seu próprio arquivo SQLite, configurado em
+# ACADEMIA_UNIDADES="centro=dados/centro.db,norte=dados/norte.db" ou com
+# registrar_unidade(). Todas as funções do backend valem para a unidade do
+# escopo atual (with unidade("norte"): ...); fora de um escopo, para DB_PATH.
+# No escopo REDE, as funções marcadas com @federada consultam todas as unidades
+# em paralelo e juntam os agregados parciais; as demais exigem uma unidade.
+REDE = "*"
+
+def _ler_unidades(texto):
+    unidades = {}
+    for item in filter(None, (parte.strip() for parte in texto.split(","))):
+        nome, _, caminho = item.partition("=")
+        if not caminho.strip():
+            raise ValueError(f"ACADEMIA_UNIDADES: use nome=caminho (recebido '{item}').")
+        unidades[nome.strip()] = caminho.strip()
+    return unidades
+
+_unidades = _ler_unidades(os.environ.get("ACADEMIA_UNIDADES", ""))
+_unidade_atual = contextvars.ContextVar("unidade_atual", default=None)
+
+def registrar_unidade(nome, caminho):
+    """Adiciona (ou troca o arquivo de) uma unidade. Use inicializar_unidades() para criar as tabelas."""
+    if not nome or nome == REDE:
+        raise ValueError(f"Nome de unidade inválido: '{nome}'.")
+    _unidades[nome] = str(caminho)
+
+def unidades():
+    """Nomes das unidades configuradas (lista vazia = instalação com um único banco)."""
+    return list(_unidades)
+
+def unidade_atual():
+    """Unidade do escopo atual: um nome, REDE ou None (banco padrão, DB_PATH)."""
+    return _unidade_atual.get()
+
+@contextmanager
+def unidade(nome):
+    """
+    Escopo de unidade: dentro do bloco, todas as funções do backend leem e gravam
+    no banco dessa unidade (vale também para as threads de carregar_em_paralelo).
+    nome=None volta ao banco padrão; nome=REDE consulta a rede inteira.
+    """
+    if nome is not None and nome != REDE and nome not in _unidades:
+        raise ValueError(f"Unidade '{nome}' não configurada.")
+    token = _unidade_atual.set(nome)
+    try:
+        yield
+    finally:
+        _unidade_atual.reset(token)
+
+def _escopo_banco():
+    # Identifica o banco do escopo nas chaves de cache: o caminho do arquivo ou REDE
+    nome = _unidade_atual.get()
+    if nome is None:
+        return DB_PATH
+    return REDE if nome == REDE else _unidades[nome]
+
+def _caminho_banco():
+    caminho = _escopo_banco()
+    if caminho == REDE:
+        raise ValueError("Esta operação vale para uma unidade só: escolha uma unidade em vez da rede inteira.")
+    return caminho
+
+def _abrir_conexao(caminho, somente_leitura=False, instrumentada=False):
+    fabrica = _ConexaoInstrumentada if instrumentada else sqlite3.Connection
+    if somente_leitura:
+        uri = Path(caminho).absolute().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=fabrica)
+    else:
+        # isolation_level=None: as transações são abertas explicitamente com BEGIN IMMEDIATE
+        conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None, factory=fabrica)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    return conn
+
+
+class _PoolConexoes:
+    """Pool limitado de conexões para um arquivo de banco."""
+
+    def __init__(self, caminho, somente_leitura, tamanho, instrumentado=False):
+        self.caminho = caminho
+        self.somente_leitura = somente_leitura
+        self.tamanho = tamanho
+        self.instrumentado = instrumentado
+        self._livres = queue.LifoQueue()
+        self._abertas = 0
+        self._lock = threading.Lock()
+        self._encerrado = False
+
+    def _obter(self):
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._abertas < self.tamanho:
+                self._abertas += 1
+                criar = True
+            else:
+                criar = False
+        if criar:
+            try:
+                return _abrir_conexao(self.caminho, self.somente_leitura, self.instrumentado)
+            except Exception:
+                with self._lock:
+                    self._abertas -= 1
+                raise
+        try:
+            return self._livres.get(timeout=ESPERA_POOL_SEG)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"Nenhuma conexão livre para '{self.caminho}' após {ESPERA_POOL_SEG}s."
+            )
+
+    def _devolver(self, conn, descartar=False):
+        descartar = descartar or self._encerrado
+        if not descartar and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                descartar = True
+        if descartar:
+            conn.close()
+            with self._lock:
+                self._abertas -= 1
+        else:
+            self._livres.put(conn)
+
+    @contextmanager
+    def conexao(self):
+        inicio = time.perf_counter()
+        conn = self._obter()
+        if self.instrumentado:
+            conn.espera_ms = (time.perf_counter() - inicio) * 1000
+        descartar = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError as e:
+            # Conexões com erro de banco (arquivo corrompido, disco cheio...) não voltam ao pool
+            descartar = not isinstance(e, (sqlite3.IntegrityError, sqlite3.OperationalError))
+            raise
+        finally:
+            self._devolver(conn, descartar)
+
+    def fechar(self):
+        while True:
+            try:
+                conn = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._abertas -= 1
+
+    def encerrar(self):
+        """Fecha as conexões livres e as emprestadas quando voltarem (pool que não será mais usado)."""
+        self._encerrado = True
+        self.fechar()
+
+
+_pools = {}
+_lock_pools = threading.Lock()
+
+def _pool(somente_leitura, caminho=None):
+    instrumentado = _instrumentacao["ativa"]
+    caminho = caminho or _caminho_banco()
+    chave = (caminho, somente_leitura, instrumentado)
+    pool = _pools.get(chave)
+    if pool is None:
+        with _lock_pools:
+            pool = _pools.get(chave)
+            if pool is None:
+                tamanho = TAMANHO_POOL_LEITURA if somente_leitura else TAMANHO_POOL_ESCRITA
+                pool = _pools[chave] = _PoolConexoes(caminho, somente_leitura, tamanho, instrumentado)
+    return pool
+
+def fechar_conexoes():
+    """Fecha todas as conexões ociosas dos pools (usado ao encerrar o processo ou trocar de banco)."""
+    with _lock_pools:
+        for pool in _pools.values():
+            pool.fechar()
+    for leitor in list(_leitores_versoes.values()):
+        with leitor._lock:
+            leitor.fechar()
+
+def _banco_ocupado(erro):
+    nome = getattr(erro, "sqlite_errorname", "")
+    if nome in ("SQLITE_BUSY", "SQLITE_LOCKED") or nome.startswith("SQLITE_BUSY_"):
+        return True
+    mensagem = str(erro).lower()
+    return "locked" in mensagem or "busy" in mensagem
+
+def _restricao_violada(erro):
+    """
+    Decodifica o IntegrityError de uma UNIQUE ("UNIQUE constraint failed: t.a, t.b")
+    em (tabela, (colunas, ...)). Retorna None para as outras violações.
+    """
+    mensagem = str(erro)
+    if not mensagem.startswith("UNIQUE constraint failed: "):
+        return None
+    colunas = [c.strip().split(".") for c in mensagem.split(": ", 1)[1].split(",")]
+    return colunas[0][0], tuple(coluna for _, coluna in colunas)
+
+def _repetir_se_ocupado(func):
+    """
+    Reexecuta a função quando o banco devolve SQLITE_BUSY/SQLITE_LOCKED mesmo após
+    o busy_timeout, com espera exponencial. A função decorada deve fazer todas as
+    suas escritas dentro de um _transacao() ou _escrever(), para que cada tentativa
+    comece do zero. EscritaNaoConcluida (o escritor não respondeu a tempo) não é
+    repetida: cada cadastro a devolve no seu próprio formato de resposta.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for tentativa in range(TENTATIVAS_OCUPADO):
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if isinstance(e, EscritaNaoConcluida) or not _banco_ocupado(e) or tentativa == TENTATIVAS_OCUPADO - 1:
+                    raise
+                time.sleep(0.05 * (2 ** tentativa) * (1 + random.random()))
+    return wrapper
+
+@contextmanager
+def _leitura(ao_vivo=False):
+    """
+    Conexão somente leitura emprestada do pool. Dentro de um relatório @analitica
+    ela vem da cópia analítica do banco, a menos que ao_vivo=True.
+    """
+    caminho = None if ao_vivo else _lendo_copia.get()
+    with _pool(somente_leitura=True, caminho=caminho).conexao() as conn:
+        yield conn
+
+@contextmanager
+def _transacao(*tabelas):
+    """
+    Conexão de escrita dentro de uma transação BEGIN IMMEDIATE: faz commit ao sair
+    do bloco e rollback se houver exceção. Se a transação alterou alguma linha,
+    marca as tabelas informadas como escritas (invalidando os caches).
+    """
+    with _pool(somente_leitura=False).conexao() as conn:
+        alteracoes_antes = conn.total_changes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        if tabelas and conn.total_changes != alteracoes_antes:
+            _marcar_escrita(*tabelas)
+
+# ----------------------------------------FILA DE ESCRITA (GROUP COMMIT)---------------------------------------------------
+# Os cadastros não abrem mais uma transação cada um: entregam a operação ao escritor
+# único do banco, que junta tudo o que chegou enquanto o commit anterior acontecia
+# numa só transação (um commit para o grupo inteiro, em vez de um por cadastro).
+# Cada operação roda no seu próprio SAVEPOINT: se falhar, só ela é desfeita e a
+# exceção volta para quem a pediu; as outras seguem no mesmo commit. Quem chama
+# espera o resultado (um Future) e só retorna depois do commit, com as versões das
+# tabelas já marcadas — o rerun seguinte do Streamlit já enxerga o dado novo.
+ESCRITA_AGRUPADA = os.environ.get("ACADEMIA_ESCRITA_AGRUPADA", "1") not in ("", "0")
+MAXIMO_POR_GRUPO = 256   # Operações no máximo por transação
+ESPERA_GRUPO_MS  = 0     # Espera extra por mais operações antes de cada grupo (0 = só as que já estão na fila)
+ESPERA_ESCRITA_SEG = 30  # Tempo máximo que um cadastro espera o escritor antes de desistir
+
+class EscritaNaoConcluida(sqlite3.OperationalError):
+    """O escritor não devolveu o resultado da operação dentro de ESPERA_ESCRITA_SEG."""
+
+class _EscritorAgrupado:
+    """Thread escritora de um banco: consome a fila e grava cada grupo numa transação."""
+
+    def __init__(self, caminho):
+        import concurrent.futures  # só quando o primeiro cadastro é feito
+        self._futuro = concurrent.futures.Future
+        self.caminho = caminho
+        self.fila = queue.Queue()
+        self.grupos = 0
+        self.operacoes = 0
+        self.maior_grupo = 0
+        self.ultimo_grupo = 0
+        self.commit_ms = 0.0
+        self._lock = threading.Lock()
+        threading.Thread(target=self._rodar, name=f"escritor:{Path(caminho).name}", daemon=True).start()
+
+    def enviar(self, operacao, tabelas):
+        futuro = self._futuro()
+        # O contexto de quem pediu (unidade, página instrumentada) vale dentro da operação
+        self.fila.put((contextvars.copy_context(), operacao, tabelas, futuro))
+        return futuro
+
+    def _rodar(self):
+        while True:
+            grupo = [self.fila.get()]
+            if ESPERA_GRUPO_MS:
+                time.sleep(ESPERA_GRUPO_MS / 1000)
+            while len(grupo) < MAXIMO_POR_GRUPO:
+                try:
+                    grupo.append(self.fila.get_nowait())
+                except queue.Empty:
+                    break
+            # Quem desistiu de esperar (ESPERA_ESCRITA_SEG) cancelou o Future: a operação não roda
+            grupo = [item for item in grupo if item[3].set_running_or_notify_cancel()]
+            if not grupo:
+                continue
+            try:
+                self._gravar(grupo)
+            except BaseException as e:
+                # Nada pode derrubar a thread: quem ainda espera recebe o erro e a fila segue
+                for *_, futuro in grupo:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+
+    def _transacao_do_grupo(self, grupo):
+        saidas = []  # (ok, resultado ou exceção, tabelas alteradas)
+        with _pool(somente_leitura=False, caminho=self.caminho).conexao() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for contexto, operacao, tabelas, _ in grupo:
+                    alteracoes_antes = conn.total_changes
+                    conn.execute("SAVEPOINT operacao")
+                    try:
+                        resultado = contexto.run(operacao, conn)
+                    except Exception as e:
+                        if not conn.in_transaction:
+                            # O SQLite já desfez a transação inteira (SQLITE_FULL, interrupt...):
+                            # o savepoint não existe mais e o grupo todo se perdeu
+                            raise
+                        conn.execute("ROLLBACK TO operacao")
+                        conn.execute("RELEASE operacao")
+                        saidas.append((False, e, ()))
+                    else:
+                        conn.execute("RELEASE operacao")
+                        alterou = conn.total_changes != alteracoes_antes
+                        saidas.append((True, resultado, tabelas if alterou else ()))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        return saidas
+
+    def _gravar(self, grupo):
+        inicio = time.perf_counter()
+        for tentativa in range(TENTATIVAS_OCUPADO):
+            try:
+                saidas = self._transacao_do_grupo(grupo)
+                break
+            except Exception as e:
+                # Outro processo segurando o banco: o grupo inteiro é refeito do zero
+                if _banco_ocupado(e) and tentativa < TENTATIVAS_OCUPADO - 1:
+                    time.sleep(0.05 * (2 ** tentativa) * (1 + random.random()))
+                    continue
+                if len(grupo) > 1 and not _banco_ocupado(e):
+                    # Falha que derrubou a transação do grupo (COMMIT, disco cheio...): cada
+                    # operação é refeita sozinha, e só as que falharem de novo recebem o erro
+                    for item in grupo:
+                        self._gravar([item])
+                    return
+                for *_, futuro in grupo:
+                    futuro.set_exception(e)
+                return
+
+        alteradas = {tabela for _, _, tabelas in saidas for tabela in tabelas}
+        if alteradas:
+            _marcar_escrita(*sorted(alteradas), caminho=self.caminho)
+        with self._lock:
+            self.grupos += 1
+            self.operacoes += len(grupo)
+            self.ultimo_grupo = len(grupo)
+            self.maior_grupo = max(self.maior_grupo, len(grupo))
+            self.commit_ms += (time.perf_counter() - inicio) * 1000
+        for (*_, futuro), (ok, valor, _) in zip(grupo, saidas):
+            if ok:
+                futuro.set_result(valor)
+            else:
+                futuro.set_exception(valor)
+
+_escritores = {}  # caminho do banco -> _EscritorAgrupado
+_lock_escritores = threading.Lock()
+
+def _escritor(caminho):
+    escritor = _escritores.get(caminho)
+    if escritor is None:
+        with _lock_escritores:
+            escritor = _escritores.get(caminho)
+            if escritor is None:
+                escritor = _escritores[caminho] = _EscritorAgrupado(caminho)
+    return escritor
+
+def _escrever(operacao, *tabelas):
+    """
+    Roda operacao(conn) numa transação de escrita e retorna o que ela retornar (ou
+    relança a exceção dela), marcando `tabelas` como escritas se alguma linha mudou.
+    Com ESCRITA_AGRUPADA a operação entra na fila do escritor do banco e pode
+    dividir o commit com as de outras sessões; a operação não deve fazer commit.
+    Se o escritor não responder em ESPERA_ESCRITA_SEG, levanta EscritaNaoConcluida.
+    """
+    if not ESCRITA_AGRUPADA:
+        with _transacao(*tabelas) as conn:
+            return operacao(conn)
+    import concurrent.futures
+    futuro = _escritor(_caminho_banco()).enviar(operacao, tabelas)
+    try:
+        return futuro.result(timeout=ESPERA_ESCRITA_SEG)
+    except concurrent.futures.TimeoutError:
+        if futuro.cancel():
+            raise EscritaNaoConcluida(
+                f"A fila de escrita não atendeu em {ESPERA_ESCRITA_SEG}s; nada foi gravado, tente novamente.")
+        raise EscritaNaoConcluida(
+            f"A gravação passou de {ESPERA_ESCRITA_SEG}s e ainda não terminou; confira se o registro "
+            "entrou antes de repetir.")
+
+def estatisticas_escrita():
+    """
+    Uma linha por banco com escritor ativo: operações esperando na fila, grupos
+    gravados, operações, média e maior tamanho de grupo, último grupo e tempo
+    médio de cada grupo (ms).
+    """
+    linhas = []
+    for caminho, escritor in list(_escritores.items()):
+        with escritor._lock:
+            grupos = escritor.grupos
+            linhas.append({
+                "banco": caminho,
+                "fila": escritor.fila.qsize(),
+                "grupos": grupos,
+                "operacoes": escritor.operacoes,
+                "media_por_grupo": round(escritor.operacoes / grupos, 2) if grupos else 0.0,
+                "maior_grupo": escritor.maior_grupo,
+                "ultimo_grupo": escritor.ultimo_grupo,
+                "ms_por_grupo": round(escritor.commit_ms / grupos, 3) if grupos else 0.0,
+            })
+    return pd.DataFrame(linhas, columns=["banco", "fila", "grupos", "operacoes", "media_por_grupo",
+                                         "maior_grupo", "ultimo_grupo", "ms_por_grupo"])
+
+# ----------------------------------------INSTRUMENTAÇÃO SQL---------------------------------------------------
+# Opcional: com ACADEMIA_INSTRUMENTAR=1 (ou ativar_instrumentacao()) toda consulta
+# feita pelas conexões dos pools é medida — função do backend que a chamou, SQL,
+# formato dos parâmetros, linhas, tempo e espera por conexão — e os tempos ficam
+# em janelas móveis para os percentis. Com ACADEMIA_TRACE=arquivo.jsonl cada
+# consulta também vira uma linha JSON. Desligada, as conexões são sqlite3 puras.
+JANELA_PERCENTIS  = 1000   # Últimas medições guardadas por (função, SQL)
+MAIS_LENTAS_GUARDADAS = 50
+
+_instrumentacao = {
+    "ativa": os.environ.get("ACADEMIA_INSTRUMENTAR", "") not in ("", "0"),
+    "trace": os.environ.get("ACADEMIA_TRACE") or None,
+}
+_pagina_atual = contextvars.ContextVar("pagina_atual", default=None)
+_lock_medicoes = threading.Lock()
+_medicoes = {}        # (funcao, sql) -> deque de ms
+_resumo_medicoes = {} # (funcao, sql) -> {"n", "total_ms", "linhas", "espera_ms"}
+_por_pagina = {}      # página -> {"consultas", "total_ms", "espera_ms"}
+_mais_lentas = []     # heap de (ms, sequência, registro)
+_arquivo_trace = None
+_sequencia_trace = itertools.count()
+_ARQUIVO_BACKEND = os.path.abspath(__file__)
+
+
+def _formato_parametros(parametros, lote=False):
+    if lote:
+        tamanho = len(parametros) if hasattr(parametros, "__len__") else "?"
+        return f"lote[{tamanho}]"
+    if not parametros:
+        return "nenhum"
+    return f"{type(parametros).__name__}[{len(parametros)}]"
+
+
+# Funções do próprio backend que só repassam a consulta (a instrumentação e os gerenciadores de conexão)
+_QUADROS_IGNORADOS = {"execute", "executemany", "fetchone", "fetchmany", "fetchall", "__next__", "close",
+                      "__del__", "_abrir_registro", "_fechar_registro", "_medir", "_leitura", "_transacao",
+                      "conexao"}
+
+def _funcao_chamadora():
+    """Nome da função do backend mais próxima na pilha (fora da instrumentação)."""
+    quadro = sys._getframe(2)
+    while quadro is not None:
+        codigo = quadro.f_code
+        if codigo.co_filename == _ARQUIVO_BACKEND and codigo.co_name not in _QUADROS_IGNORADOS:
+            return codigo.co_name
+        quadro = quadro.f_back
+    return "?"
+
+
+def _registrar_consulta(registro):
+    global _arquivo_trace
+    chave = (registro["funcao"], registro["sql"])
+    with _lock_medicoes:
+        _medicoes.setdefault(chave, collections.deque(maxlen=JANELA_PERCENTIS)).append(registro["ms"])
+        resumo = _resumo_medicoes.setdefault(chave, {"n": 0, "total_ms": 0.0, "linhas": 0, "espera_ms": 0.0})
+        resumo["n"] += 1
+        resumo["total_ms"] += registro["ms"]
+        resumo["linhas"] += max(registro["linhas"], 0)
+        resumo["espera_ms"] += registro["espera_ms"]
+
+        pagina = _por_pagina.setdefault(registro["pagina"], {"consultas": 0, "total_ms": 0.0, "espera_ms": 0.0})
+        pagina["consultas"] += 1
+        pagina["total_ms"] += registro["ms"]
+        pagina["espera_ms"] += registro["espera_ms"]
+
+        item = (registro["ms"], next(_sequencia_trace), registro)
+        if len(_mais_lentas) < MAIS_LENTAS_GUARDADAS:
+            heapq.heappush(_mais_lentas, item)
+        elif item[0] > _mais_lentas[0][0]:
+            heapq.heapreplace(_mais_lentas, item)
+
+        if _instrumentacao["trace"]:
+            if _arquivo_trace is None or _arquivo_trace.name != _instrumentacao["trace"]:
+                if _arquivo_trace is not None:
+                    _arquivo_trace.close()
+                _arquivo_trace = open(_instrumentacao["trace"], "a", encoding="utf-8", buffering=1)
+            _arquivo_trace.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+
+class _CursorInstrumentado(sqlite3.Cursor):
+    """
+    Cursor que mede cada execute/executemany. Em SELECT o tempo inclui a leitura
+    das linhas; o registro é fechado quando o cursor se esgota, é fechado,
+    reexecutado ou coletado.
+    """
+    _registro = None
+
+    def _abrir_registro(self, sql, formato, inicio):
+        conn = self.connection
+        self._registro = {
+            "momento": datetime.datetime.now().isoformat(timespec="milliseconds"),
+            "funcao": _funcao_chamadora(),
+            "pagina": _pagina_atual.get(),
+            "sql": " ".join(sql.split()),
+            "parametros": formato,
+            "linhas": 0,
+            "ms": (time.perf_counter() - inicio) * 1000,
+            "espera_ms": getattr(conn, "espera_ms", 0.0),
+        }
+        conn.espera_ms = 0.0  # a espera pelo pool conta só para a primeira consulta do empréstimo
+        if self.description is None:  # não é SELECT: não há linhas a ler
+            self._registro["linhas"] = self.rowcount
+            self._fechar_registro()
+
+    def _fechar_registro(self):
+        registro, self._registro = self._registro, None
+        if registro is not None:
+            registro["ms"] = round(registro["ms"], 3)
+            registro["espera_ms"] = round(registro["espera_ms"], 3)
+            _registrar_consulta(registro)
+
+    def _medir(self, inicio, linhas, esgotou):
+        if self._registro is not None:
+            self._registro["ms"] += (time.perf_counter() - inicio) * 1000
+            self._registro["linhas"] += linhas
+            if esgotou:
+                self._fechar_registro()
+
+    def execute(self, sql, parametros=()):
+        self._fechar_registro()
+        inicio = time.perf_counter()
+        super().execute(sql, parametros)
+        self._abrir_registro(sql, _formato_parametros(parametros), inicio)
+        return self
+
+    def executemany(self, sql, parametros):
+        self._fechar_registro()
+        inicio = time.perf_counter()
+        super().executemany(sql, parametros)
+        self._abrir_registro(sql, _formato_parametros(parametros, lote=True), inicio)
+        return self
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        self._medir(inicio, linha is not None, linha is None)
+        return linha
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        tamanho = self.arraysize if size is None else size
+        linhas = super().fetchmany(tamanho)
+        self._medir(inicio, len(linhas), len(linhas) < tamanho)
+        return linhas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._medir(inicio, len(linhas), True)
+        return linhas
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            linha = super().__next__()
+        except StopIteration:
+            self._medir(inicio, 0, True)
+            raise
+        self._medir(inicio, 1, False)
+        return linha
+
+    def close(self):
+        self._fechar_registro()
+        super().close()
+
+    def __del__(self):
+        self._fechar_registro()
+
+
+class _ConexaoInstrumentada(sqlite3.Connection):
+    """Conexão cujos cursores (inclusive os de conn.execute) são _CursorInstrumentado."""
+    espera_ms = 0.0
+
+    def cursor(self, factory=_CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+
+def ativar_instrumentacao(trace=None):
+    """
+    Liga a medição das consultas. `trace` é um arquivo .jsonl opcional que recebe
+    uma linha por consulta. Os pools passam a abrir conexões instrumentadas; as
+    conexões comuns ociosas são fechadas.
+    """
+    _instrumentacao["ativa"] = True
+    _instrumentacao["trace"] = trace
+    fechar_conexoes()
+
+def desativar_instrumentacao():
+    """Desliga a medição (as estatísticas já coletadas continuam disponíveis)."""
+    global _arquivo_trace
+    _instrumentacao["ativa"] = False
+    _instrumentacao["trace"] = None
+    fechar_conexoes()
+    with _lock_medicoes:
+        if _arquivo_trace is not None:
+            _arquivo_trace.close()
+            _arquivo_trace = None
+
+def instrumentacao_ativa():
+    return _instrumentacao["ativa"]
+
+@contextmanager
+def pagina_instrumentada(nome):
+    """Atribui à página `nome` as consultas feitas dentro do bloco (totais por página)."""
+    token = _pagina_atual.set(nome)
+    try:
+        yield
+    finally:
+        _pagina_atual.reset(token)
+
+def limpar_estatisticas():
+    with _lock_medicoes:
+        _medicoes.clear()
+        _resumo_medicoes.clear()
+        _por_pagina.clear()
+        _mais_lentas.clear()
+
+def _percentil(ordenados, p):
+    if not ordenados:
+        return None
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+def estatisticas_consultas():
+    """
+    DataFrame com uma linha por (função, SQL): execuções, tempo total, p50/p95/p99
+    e máximo da janela móvel (ms), média de linhas e espera total por conexão.
+    """
+    with _lock_medicoes:
+        itens = [(chave, sorted(tempos), dict(_resumo_medicoes[chave])) for chave, tempos in _medicoes.items()]
+    linhas = []
+    for (funcao, sql), tempos, resumo in itens:
+        linhas.append({
+            "funcao": funcao, "sql": sql, "execucoes": resumo["n"],
+            "total_ms": round(resumo["total_ms"], 2),
+            "p50_ms": _percentil(tempos, 50), "p95_ms": _percentil(tempos, 95),
+            "p99_ms": _percentil(tempos, 99), "max_ms": tempos[-1],
+            "linhas_media": round(resumo["linhas"] / resumo["n"], 1),
+            "espera_ms": round(resumo["espera_ms"], 2),
+        })
+    colunas = ["funcao", "sql", "execucoes", "total_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms",
+               "linhas_media", "espera_ms"]
+    return pd.DataFrame(linhas, columns=colunas).sort_values("total_ms", ascending=False, ignore_index=True)
+
+def consultas_mais_lentas(n=20):
+    """DataFrame com as `n` execuções individuais mais lentas desde a última limpeza."""
+    with _lock_medicoes:
+        registros = [registro for _, _, registro in heapq.nlargest(n, _mais_lentas)]
+    return pd.DataFrame(registros, columns=["momento", "pagina", "funcao", "ms", "espera_ms",
+                                            "linhas", "parametros", "sql"])
+
+def totais_por_pagina():
+    """DataFrame com consultas, tempo total e espera total por página do front-end."""
+    with _lock_medicoes:
+        linhas = [{"pagina": pagina or "(fora de página)", **valores} for pagina, valores in _por_pagina.items()]
+    df = pd.DataFrame(linhas, columns=["pagina", "consultas", "total_ms", "espera_ms"])
+    return df.round(2).sort_values("total_ms", ascending=False, ignore_index=True)
+
+def _plt():
+    # matplotlib é importado só quando o primeiro gráfico é gerado (custa ~0,5 s no import)
+    import matplotlib
+    if matplotlib.get_backend().lower() != "agg":
+        matplotlib.use("Agg")  # Os gráficos só são rasterizados em bytes, sem janela
+    import matplotlib.pyplot as plt
+    return plt
 
 def get_connection():
-    return sqlite3.connect("academia_db.db", check_same_thread=False) 
+    """
+    Conexão avulsa (fora do pool) para scripts e manutenção, já com busy_timeout.
+    Quem abre é responsável por fechar; o backend usa _leitura() e _transacao().
+    """
+    conn = sqlite3.connect(_caminho_banco(), check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    return conn
+
+# Versão de cada tabela: os caches comparam essas versões para saber se ainda
+# estão válidos. Ela tem duas partes:
+# - a compartilhada, gravada no próprio banco (tabela versoes, incrementada por
+#   gatilhos em toda escrita): vale para todos os processos que usam o arquivo;
+# - a local, um contador do processo incrementado por _marcar_escrita, para o
+#   que não está no banco (ex.: a cópia analítica) e para forçar uma releitura.
+# Cada banco (unidade) tem suas próprias versões.
+_versoes_tabelas = {}  # (caminho do banco, tabela) -> versão local
+_lock_versoes = threading.Lock()
+
+class _VersoesBanco:
+    """
+    Leitor da tabela versoes de um banco. Uma conexão própria consulta o PRAGMA
+    data_version (que muda quando outra conexão, de qualquer processo, faz
+    commit no arquivo); a tabela só é relida quando ele muda, então conferir a
+    versão custa uma instrução trivial na maioria das chamadas.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._conn = None
+        self._data_version = None
+        self._versoes = {}
+        self._lock = threading.Lock()
+
+    def ler(self):
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = _abrir_conexao(self.caminho, somente_leitura=True)
+                data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                if data_version != self._data_version:
+                    self._versoes = dict(self._conn.execute("SELECT tabela, versao FROM versoes"))
+                    self._data_version = data_version
+            except sqlite3.OperationalError:
+                # Banco ainda não criado/migrado: sem versões compartilhadas até a migração
+                self.fechar()
+                return {}
+            return self._versoes
+
+    def fechar(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn, self._data_version, self._versoes = None, None, {}
+
+_leitores_versoes = {}  # caminho do banco -> _VersoesBanco
+
+def _versoes_banco(caminho):
+    leitor = _leitores_versoes.get(caminho)
+    if leitor is None:
+        with _lock_versoes:
+            leitor = _leitores_versoes.setdefault(caminho, _VersoesBanco(caminho))
+    return leitor.ler()
+
+# Tabelas mantidas por gatilhos: mudam junto com a tabela de origem
+_TABELAS_DERIVADAS = {"pagamentos": ("receita_cubo",)}
+
+def _marcar_escrita(*tabelas, caminho=None):
+    caminho = caminho or _caminho_banco()
+    with _lock_versoes:
+        for tabela in tabelas:
+            for afetada in (tabela,) + _TABELAS_DERIVADAS.get(tabela, ()):
+                _versoes_tabelas[caminho, afetada] = _versoes_tabelas.get((caminho, afetada), 0) + 1
+    if tabelas and TABELA_COPIA not in tabelas:
+        _contar_escrita(caminho)
+
+def _versao_tabelas(*tabelas):
+    # No escopo REDE a versão junta as de todas as unidades: qualquer escrita em uma delas invalida
+    caminho = _escopo_banco()
+    caminhos = list(_unidades.values()) if caminho == REDE else [caminho]
+    compartilhadas = {c: _versoes_banco(c) for c in caminhos}
+    with _lock_versoes:
+        return tuple((compartilhadas[c].get(tabela, 0), _versoes_tabelas.get((c, tabela), 0))
+                     for c in caminhos for tabela in tabelas)
+
+# ----------------------------------------CACHE DE CONSULTAS---------------------------------------------------
+# Cache compartilhado (por processo, entre todas as sessões) das funções de leitura.
+# Cada função declara as tabelas de que depende com @em_cache(...); a chave inclui a
+# função, os parâmetros, o banco e a versão dessas tabelas — lida antes da consulta,
+# então uma escrita concorrente nunca deixa um resultado antigo com a versão nova.
+# Toda escrita incrementa as versões no banco (gatilhos da tabela versoes), inclusive
+# as feitas por outro processo: depois de um cadastro a próxima leitura de qualquer
+# processo já vai ao banco. O cache descarta as entradas menos
+# usadas quando passa do limite de entradas ou de memória.
+TAMANHO_CACHE_CONSULTAS = 256      # Entradas guardadas no máximo
+MEMORIA_CACHE_CONSULTAS = 256e6    # Bytes (aproximados) guardados no máximo
+
+_cache_consultas = OrderedDict()   # chave -> (resultado, bytes)
+_lock_cache_consultas = threading.Lock()
+_uso_cache_consultas = {"acertos": 0, "faltas": 0, "bytes": 0}
+
+def _hashavel(valor):
+    # Listas/dicts/sets de parâmetros viram tuplas, para poderem fazer parte da chave
+    if isinstance(valor, (list, tuple)):
+        return tuple(_hashavel(v) for v in valor)
+    if isinstance(valor, dict):
+        return tuple(sorted((k, _hashavel(v)) for k, v in valor.items()))
+    if isinstance(valor, (set, frozenset)):
+        return tuple(sorted(_hashavel(v) for v in valor))
+    return valor
+
+def _tamanho_aproximado(resultado):
+    if hasattr(resultado, "memory_usage"):  # DataFrame / Series
+        uso = resultado.memory_usage(index=True)
+        return int(uso.sum() if hasattr(uso, "sum") else uso)
+    if hasattr(resultado, "dados"):  # Pagina
+        return _tamanho_aproximado(resultado.dados)
+    return sys.getsizeof(resultado)
+
+def _copia(resultado):
+    # Quem chama pode alterar o DataFrame devolvido (ex.: criar colunas): cada chamada recebe uma cópia
+    if isinstance(resultado, (list, dict, set)) or hasattr(resultado, "memory_usage"):
+        return resultado.copy()
+    return resultado
+
+def _descartar_excesso():
+    while _cache_consultas and (len(_cache_consultas) > TAMANHO_CACHE_CONSULTAS
+                                or _uso_cache_consultas["bytes"] > MEMORIA_CACHE_CONSULTAS):
+        _, (_, tamanho) = _cache_consultas.popitem(last=False)
+        _uso_cache_consultas["bytes"] -= tamanho
+
+def em_cache(*tabelas):
+    """
+    Decorador de leitura com cache: o resultado é reaproveitado enquanto nenhuma
+    das `tabelas` for escrita. Parâmetros que não podem fazer parte da chave
+    desligam o cache só naquela chamada.
+    """
+    def decorador(func):
+        @functools.wraps(func)
+        def com_cache(*args, **kwargs):
+            try:
+                chamada = (func.__module__, func.__qualname__, _escopo_banco(),
+                           _hashavel(args), _hashavel(kwargs))
+                hash(chamada)
+            except TypeError:
+                return func(*args, **kwargs)
+            chave = chamada + (_versao_tabelas(*tabelas),)
+
+            with _lock_cache_consultas:
+                if chave in _cache_consultas:
+                    _cache_consultas.move_to_end(chave)
+                    _uso_cache_consultas["acertos"] += 1
+                    return _copia(_cache_consultas[chave][0])
+                _uso_cache_consultas["faltas"] += 1
+
+            resultado = func(*args, **kwargs)
+            tamanho = _tamanho_aproximado(resultado)
+            if tamanho <= MEMORIA_CACHE_CONSULTAS:
+                with _lock_cache_consultas:
+                    # Versões antigas da mesma chamada nunca mais serão pedidas
+                    antiga = next((c for c in _cache_consultas if c[:-1] == chamada), None)
+                    if antiga is not None:
+                        _uso_cache_consultas["bytes"] -= _cache_consultas.pop(antiga)[1]
+                    _cache_consultas[chave] = (resultado, tamanho)
+                    _uso_cache_consultas["bytes"] += tamanho
+                    _descartar_excesso()
+            return _copia(resultado)
+
+        com_cache.tabelas = tabelas
+        com_cache.sem_cache = func
+        return com_cache
+    return decorador
+
+def limpar_cache_consultas():
+    with _lock_cache_consultas:
+        _cache_consultas.clear()
+        _uso_cache_consultas.update(acertos=0, faltas=0, bytes=0)
+
+def estatisticas_cache_consultas():
+    """Entradas, memória aproximada (MB), acertos, faltas e taxa de acerto (%) do cache de consultas."""
+    with _lock_cache_consultas:
+        acertos, faltas = _uso_cache_consultas["acertos"], _uso_cache_consultas["faltas"]
+        return {
+            "entradas": len(_cache_consultas),
+            "memoria_mb": round(_uso_cache_consultas["bytes"] / 1e6, 1),
+            "acertos": acertos,
+            "faltas": faltas,
+            "taxa_acerto": round(100 * acertos / (acertos + faltas), 1) if acertos + faltas else 0.0,
+        }
+
+# ----------------------------------------CONSULTAS FEDERADAS (REDE)---------------------------------------------------
+# No escopo REDE, uma função @federada roda em todas as unidades ao mesmo tempo —
+# cada unidade tem seu arquivo e seu pool, então nada disputa o mesmo lock — e
+# os resultados parciais são juntados por `mesclar`. O custo do painel da rede
+# passa a ser o da unidade mais lenta, não a soma de todas.
+THREADS_REDE = 8  # Unidades consultadas ao mesmo tempo
+
+def _na_unidade(nome, func, *args, **kwargs):
+    with unidade(nome):
+        return func(*args, **kwargs)
+
+def federada(mesclar):
+    """
+    Decorador: fora do escopo REDE chama a função normalmente; no escopo REDE
+    roda a função em cada unidade, em paralelo, e retorna mesclar(partes), com
+    as partes na ordem de unidades(). Use por baixo de @em_cache, para a rede
+    também ficar em cache (invalidado por escritas em qualquer unidade).
+    """
+    def decorador(func):
+        @functools.wraps(func)
+        def na_rede(*args, **kwargs):
+            if _unidade_atual.get() != REDE:
+                return func(*args, **kwargs)
+            if not _unidades:
+                raise ValueError("Nenhuma unidade configurada para consultar a rede.")
+            # Executor próprio: pode ser chamado de dentro de carregar_em_paralelo sem esperar por si mesmo
+            executor = _executor("consulta_rede", THREADS_REDE)
+            futuros = [executor.submit(contextvars.copy_context().run, _na_unidade, nome, func, *args, **kwargs)
+                       for nome in _unidades]
+            for futuro in futuros:
+                futuro.exception()  # espera todas, inclusive as que falharam
+            return mesclar([futuro.result() for futuro in futuros])
+        return na_rede
+    return decorador
+
+def _somar_partes(*medidas):
+    """mesclar de agregados em DataFrame: soma as `medidas` agrupando pelas demais colunas."""
+    def mesclar(partes):
+        # Partes vazias (unidade sem dados) viriam com colunas object e estragariam os tipos da soma
+        df = pd.concat([parte for parte in partes if not parte.empty] or partes[:1], ignore_index=True)
+        chaves = [coluna for coluna in df.columns if coluna not in medidas]
+        if not chaves:
+            return df[list(medidas)].sum().to_frame().T
+        return df.groupby(chaves, as_index=False, sort=True, dropna=False)[list(medidas)].sum()
+    return mesclar
+
+# ----------------------------------------CÓPIA ANALÍTICA---------------------------------------------------
+# Os relatórios pesados (listas completas de treinos e pagamentos, coortes, clientes
+# ativos, inadimplência) leem de uma cópia somente leitura do banco, feita com a
+# API de backup online do SQLite: ela copia uma fotografia consistente sem bloquear
+# quem grava (WAL). Assim uma varredura longa nunca disputa o arquivo em que a
+# recepção está gravando. A cópia é refeita em segundo plano a cada
+# INTERVALO_COPIA_SEG (se o banco mudou, inclusive por outro processo) ou depois
+# de ESCRITAS_POR_COPIA escritas, e nunca é lida com
+# mais de IDADE_MAXIMA_COPIA_SEG: se o agendador atrasar, a própria leitura refaz
+# a cópia antes. Cada processo tem as suas cópias (<banco>.analitico-<pid>-<n>.db,
+# ao lado do banco), apagadas ao sair. ACADEMIA_COPIA_ANALITICA=0 desliga tudo:
+# os relatórios voltam a ler o banco ao vivo.
+COPIA_ANALITICA        = os.environ.get("ACADEMIA_COPIA_ANALITICA", "1") not in ("", "0")
+INTERVALO_COPIA_SEG    = 60    # Atualização agendada
+ESCRITAS_POR_COPIA     = 200   # Ou depois de tantas escritas (transações) no banco
+IDADE_MAXIMA_COPIA_SEG = 120   # Limite de defasagem garantido para os relatórios
+TABELA_COPIA = "copia_analitica"  # Pseudo-tabela para os caches: a versão muda a cada cópia nova
+
+_lendo_copia = contextvars.ContextVar("lendo_copia", default=None)
+
+class CopiaAnalitica:
+    """Cópia somente leitura de um banco, trocada por uma nova a cada atualização."""
+
+    def __init__(self, origem):
+        self.origem = origem
+        self.arquivo = None
+        self.geracao = 0
+        self.criada_em = None      # time.monotonic() do início da última cópia
+        self.criada_as = None      # datetime do início da última cópia (para exibir)
+        self.escritas = 0          # Escritas na origem desde o início da última cópia
+        self.segundos = None       # Duração da última cópia
+        self.assinatura = None     # Tamanho/mtime do banco e do -wal no início da última cópia
+        self._arquivos = []        # Cópias ainda no disco, da mais antiga para a atual
+        self._lock = threading.RLock()
+
+    def idade(self):
+        return None if self.criada_em is None else time.monotonic() - self.criada_em
+
+    def _mudou(self):
+        # Escritas deste processo ou de outro (o arquivo do banco ou o -wal mudou)
+        return self.escritas > 0 or _assinatura_banco(self.origem) != self.assinatura
+
+    def vencida(self):
+        idade = self.idade()
+        if idade is None or self.escritas >= ESCRITAS_POR_COPIA:
+            return True
+        if idade < INTERVALO_COPIA_SEG:
+            return False
+        if not self._mudou():
+            self.criada_em = time.monotonic()  # Banco igual: a cópia continua em dia
+            return False
+        return True
+
+    def atualizar(self):
+        with self._lock:
+            inicio, criada_as = time.monotonic(), datetime.datetime.now()
+            escritas, assinatura = self.escritas, _assinatura_banco(self.origem)
+            origem = Path(self.origem)
+            destino = origem.with_name(f"{origem.stem}.analitico-{os.getpid()}-{self.geracao + 1}.db")
+            alvo = sqlite3.connect(destino)
+            try:
+                with _pool(somente_leitura=True, caminho=self.origem).conexao() as fonte:
+                    fonte.backup(alvo)  # Uma etapa só: fotografia consistente do banco
+                alvo.execute("PRAGMA journal_mode = DELETE")  # Lida em mode=ro, sem -wal/-shm
+            except BaseException:
+                alvo.close()
+                _apagar_arquivo(destino)
+                raise
+            alvo.close()
+
+            self.arquivo, self.geracao = str(destino), self.geracao + 1
+            self.criada_em, self.criada_as, self.assinatura = inicio, criada_as, assinatura
+            self.escritas -= escritas
+            self.segundos = time.monotonic() - inicio
+            _marcar_escrita(TABELA_COPIA, caminho=self.origem)
+
+            # A cópia anterior fica mais um ciclo (um relatório pode estar no meio dela)
+            self._arquivos.append(self.arquivo)
+            while len(self._arquivos) > 2:
+                _descartar_copia(self._arquivos.pop(0))
+
+    def garantir(self):
+        """Caminho da cópia atual, refeita antes se passou do limite de defasagem."""
+        idade = self.idade()
+        if idade is None or idade > IDADE_MAXIMA_COPIA_SEG:
+            with self._lock:
+                idade = self.idade()  # outra thread pode ter acabado de atualizar
+                if idade is None or (idade > IDADE_MAXIMA_COPIA_SEG and self._mudou()):
+                    self.atualizar()
+                elif idade > IDADE_MAXIMA_COPIA_SEG:
+                    self.criada_em = time.monotonic()  # Banco igual: a cópia continua em dia
+        return self.arquivo
+
+_copias = {}  # caminho do banco -> CopiaAnalitica
+_lock_copias = threading.Lock()
+_aviso_copias = threading.Event()
+_agendador_copias = None
+
+def _assinatura_banco(caminho):
+    assinatura = []
+    for arquivo in (caminho, f"{caminho}-wal"):
+        try:
+            info = os.stat(arquivo)
+            assinatura.append((info.st_size, info.st_mtime_ns))
+        except OSError:
+            assinatura.append(None)
+    return tuple(assinatura)
+
+def _apagar_arquivo(caminho):
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass  # Já apagado, ou ainda aberto (Windows): fica para a limpeza ao sair
+
+def _descartar_copia(arquivo):
+    with _lock_pools:
+        pools = [_pools.pop(chave) for chave in list(_pools) if chave[0] == arquivo]
+    for pool in pools:
+        pool.encerrar()
+    _apagar_arquivo(arquivo)
+
+def _agendar_copias():
+    while True:
+        _aviso_copias.wait(INTERVALO_COPIA_SEG / 4)
+        _aviso_copias.clear()
+        for copia in list(_copias.values()):
+            if copia.vencida():
+                try:
+                    copia.atualizar()
+                except Exception:
+                    pass  # A próxima leitura tenta de novo e, se falhar, o erro aparece para ela
+
+def _limpar_copias():
+    for copia in list(_copias.values()):
+        for arquivo in copia._arquivos:
+            _descartar_copia(arquivo)
+
+def _copia_do_banco(caminho):
+    global _agendador_copias
+    copia = _copias.get(caminho)
+    if copia is None:
+        with _lock_copias:
+            copia = _copias.get(caminho)
+            if copia is None:
+                copia = _copias[caminho] = CopiaAnalitica(caminho)
+                if _agendador_copias is None:
+                    atexit.register(_limpar_copias)
+                    _agendador_copias = threading.Thread(target=_agendar_copias, name="copia_analitica", daemon=True)
+                    _agendador_copias.start()
+    return copia
+
+def _contar_escrita(caminho):
+    copia = _copias.get(caminho)
+    if copia is not None:
+        copia.escritas += 1
+        if copia.escritas >= ESCRITAS_POR_COPIA:
+            _aviso_copias.set()
+    if not COPIA_ANALITICA:
+        _marcar_escrita(TABELA_COPIA, caminho=caminho)  # Relatórios leem ao vivo: invalidam a cada escrita
+
+def analitica(func):
+    """
+    Decorador de relatórios: dentro da função, _leitura() usa a cópia analítica do
+    banco do escopo (no máximo IDADE_MAXIMA_COPIA_SEG defasada). Use por cima de
+    @em_cache(TABELA_COPIA), para o cache acompanhar as trocas de cópia.
+    """
+    @functools.wraps(func)
+    def na_copia(*args, **kwargs):
+        if not COPIA_ANALITICA or _lendo_copia.get() is not None:
+            return func(*args, **kwargs)
+        arquivo = _copia_do_banco(_caminho_banco()).garantir()
+        token = _lendo_copia.set(arquivo)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _lendo_copia.reset(token)
+    return na_copia
+
+def atualizar_copia_analitica():
+    """Refaz agora a cópia analítica do banco do escopo atual."""
+    _copia_do_banco(_caminho_banco()).atualizar()
+
+def estado_copia_analitica():
+    """Situação da cópia analítica do banco do escopo (None se ainda não foi criada)."""
+    copia = _copias.get(_caminho_banco())
+    if copia is None or copia.arquivo is None:
+        return None
+    return {
+        "arquivo": copia.arquivo,
+        "geracao": copia.geracao,
+        "criada_as": copia.criada_as,
+        "idade_seg": round(copia.idade(), 1),
+        "escritas_pendentes": copia.escritas,
+        "segundos_copia": round(copia.segundos, 3),
+        "limite_seg": IDADE_MAXIMA_COPIA_SEG,
+    }
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -129,95 +1206,1006 @@ def hash_password(password):
 
 # Função para verificar se o usuário e a senha estão corretos
 def verificar_usuario(username, password):
-    cursor.execute("SELECT password FROM users WHERE username = ?", (username,))
-    result = cursor.fetchone()
+    with _leitura() as conn:
+        result = conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
     if result:
         # Compara a senha armazenada (em hash) com o hash da senha fornecida
         return result[0] == hash_password(password)
     return False
 
+@_repetir_se_ocupado
 def registrar_usuario(username, password):
+    senha = hash_password(password)
+
+    # Insere o usuário com a senha criptografada; se o username já existe, a UNIQUE
+    # faz o INSERT não gravar nada e o RETURNING volta vazio
+    def operacao(conn):
+        return conn.execute("""
+            INSERT INTO users (username, password) VALUES (?, ?)
+            ON CONFLICT (username) DO NOTHING
+            RETURNING id
+        """, (username, senha)).fetchall()
+
     try:
-        # Insere o usuário com a senha criptografada no banco
-        cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hash_password(password)))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        # Caso o usuário já exista ou ocorra algum erro de integridade, retorna False
+        return bool(_escrever(operacao, "users"))
+    except EscritaNaoConcluida:
         return False
 
+# Usuários com acesso às páginas administrativas (ex.: Diagnóstico), separados por vírgula.
+# Vazio por padrão: como qualquer um pode se registrar, o admin é definido por quem implanta.
+USUARIOS_ADMIN = {nome.strip() for nome in os.environ.get("ACADEMIA_ADMINS", "").split(",") if nome.strip()}
+
+def usuario_admin(username):
+    return username in USUARIOS_ADMIN
+
 # Função que filtra os registros novos (não repetidos) que ainda não existem na tabela do banco
-def filter_novos(df, cols, tabela):
+def filter_novos(df, cols, tabela, conn=None):
     # Remove duplicatas no DataFrame com base nas colunas informadas
     df = df.drop_duplicates(subset=cols, keep='first')
     sel = ", ".join(cols)
     sql = f"SELECT {sel} FROM {tabela}"
-    existentes = pd.read_sql_query(sql, conn)
-    # Converte os registros em tuplas
-    tuplas_exist = set(tuple(x) for x in existentes.values)
-    # Cria uma máscara para filtrar apenas os registros que ainda não existem no banco
-    mask = ~df[cols].apply(lambda row: tuple(row), axis=1).isin(tuplas_exist)
+    if conn is None:
+        with _leitura() as conn_leitura:
+            existentes = pd.read_sql_query(sql, conn_leitura)
+    else:
+        existentes = pd.read_sql_query(sql, conn)
+    # Cria uma máscara (vetorizada, por hash das tuplas) para filtrar apenas os registros
+    # que ainda não existem no banco. Para cargas grandes use importar_csv().
+    chaves_df = pd.MultiIndex.from_frame(df[cols])
+    chaves_existentes = pd.MultiIndex.from_frame(existentes[cols])
+    mask = ~chaves_df.isin(chaves_existentes)
     return df[mask]
 
-# 5) Inserção em cada tabela, só com novos
-# Verifica se há novos clientes (baseado no campo 'email') que ainda não estão na tabela 'clientes'
-novos = filter_novos(df_clientes, ['email'], 'clientes')
-if not novos.empty:
-    # Se existirem novos, insere na tabela 'clientes'
-    novos.to_sql('clientes', conn, if_exists='append', index=False)
-    conn.commit()
-
-# Verifica se há novos instrutores (comparando 'nome' e 'especialidade')
-novos = filter_novos(df_instrutores, ['nome','especialidade'], 'instrutores')
-if not novos.empty:
-    # Se existirem novos, insere na tabela 'instrutores'
-    novos.to_sql('instrutores', conn, if_exists='append', index=False)
-    conn.commit()
-
-# Verifica se há novos planos (comparando nome, preço e duração)
-novos = filter_novos(df_planos, ['nome','preco_mensal','duracao_meses'], 'planos')
-if not novos.empty:
-    # Insere os planos que ainda não estão registrados no banco
-    novos.to_sql('planos', conn, if_exists='append', index=False)
-    conn.commit()
-
-# Verifica se há novos exercícios (comparando nome e grupo muscular)
-novos = filter_novos(df_exercicios, ['nome','grupo_muscular'], 'exercicios')
-if not novos.empty:
-    # Insere os exercícios novos
-    novos.to_sql('exercicios', conn, if_exists='append', index=False)
-    conn.commit()
-
-# Verifica se há treinos novos (comparando cliente, instrutor, data, e plano)
-novos = filter_novos(df_treinos,
-                     ['cliente_id','instrutor_id','data_inicio','data_fim','plano_id'],
-                     'treinos')
-if not novos.empty:
-    # Verifica se há treinos novos (comparando cliente, instrutor, data, e plano)
-    novos.to_sql('treinos', conn, if_exists='append', index=False)
-    conn.commit()
-
-# Verifica se há novos exercícios vinculados a treinos (por treino, exercício, série e repetições)
-novos = filter_novos(df_treino_exercicios,
-                     ['treino_id','exercicio_id','series','repeticoes'],
-                     'treino_exercicios')
-if not novos.empty:
-    # Insere os novos vínculos de exercícios com treinos
-    novos.to_sql('treino_exercicios', conn, if_exists='append', index=False)
-    conn.commit()
-
-# Verifica se há novos pagamentos (por cliente, data, valor e plano)
-novos = filter_novos(df_pagamentos,
-                     ['cliente_id','data_pagamento','valor_pago','plano_id'],
-                     'pagamentos')
-if not novos.empty:
-    # Insere os pagamentos que ainda não estão no banco
-    novos.to_sql('pagamentos', conn, if_exists='append', index=False)
-    conn.commit()
+# 2) Criação das tabelas
+def _criar_tabelas(cursor):
+    # Cria a tabela de clientes, com referências a plano, instrutor e treino
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS clientes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        idade INTEGER NOT NULL,
+        sexo TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        telefone TEXT NOT NULL,
+        plano_id INTEGER NOT NULL,
+        instrutor_id INTEGER NOT NULL,
+        treino_id INTEGER,
+        FOREIGN KEY(instrutor_id) REFERENCES instrutores(id),
+        FOREIGN KEY(treino_id)    REFERENCES treinos(id),
+        FOREIGN KEY(plano_id)     REFERENCES planos(id)
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS instrutores (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        especialidade TEXT,
+        UNIQUE (nome, especialidade)
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS planos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        preco_mensal REAL NOT NULL,
+        duracao_meses INTEGER NOT NULL,
+        UNIQUE (nome, preco_mensal, duracao_meses)
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS exercicios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        grupo_muscular TEXT NOT NULL,
+        UNIQUE (nome, grupo_muscular)
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS treinos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cliente_id INTEGER NOT NULL,
+        instrutor_id INTEGER NOT NULL,
+        data_inicio TEXT,
+        data_fim TEXT,
+        plano_id INTEGER,
+        FOREIGN KEY(cliente_id)   REFERENCES clientes(id),
+        FOREIGN KEY(instrutor_id) REFERENCES instrutores(id),
+        FOREIGN KEY(plano_id)     REFERENCES planos(id),
+        UNIQUE (cliente_id, instrutor_id, data_inicio, data_fim, plano_id)
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS treino_exercicios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        treino_id INTEGER NOT NULL,
+        treino TEXT,
+        exercicio_id INTEGER NOT NULL,
+        exercicio TEXT,
+        series INTEGER NOT NULL,
+        repeticoes INTEGER NOT NULL,
+        FOREIGN KEY(treino_id)    REFERENCES treinos(id),
+        FOREIGN KEY(exercicio_id) REFERENCES exercicios(id),
+        UNIQUE (treino_id, exercicio_id, series, repeticoes)
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS pagamentos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cliente_id INTEGER NOT NULL,
+        data_pagamento TEXT NOT NULL,
+        valor_pago REAL NOT NULL,
+        plano_id INTEGER NOT NULL,
+        FOREIGN KEY(cliente_id) REFERENCES clientes(id),
+        FOREIGN KEY(plano_id)   REFERENCES planos(id),
+        UNIQUE (cliente_id, data_pagamento, valor_pago, plano_id)
+    );
+    """)
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        );
+    ''')
+
+# 2.1) Migrações de esquema
+# Cada migração roda uma única vez, em ordem, dentro de uma transação própria; a
+# versão aplicada fica em PRAGMA user_version. Para mudar o esquema, acrescente
+# uma nova entrada no fim de _MIGRACOES (nunca altere uma que já foi publicada).
+
+# tabela -> (colunas de data, colunas da chave UNIQUE que inclui essas datas)
+_DATAS_NORMALIZADAS = {
+    "pagamentos": (("data_pagamento",), ("cliente_id", "data_pagamento", "valor_pago", "plano_id")),
+    "treinos": (("data_inicio", "data_fim"), ("cliente_id", "instrutor_id", "data_inicio", "data_fim", "plano_id")),
+}
+
+def _normalizar_datas(cursor):
+    # Grava todas as datas como 'YYYY-MM-DD' (ex.: '2025-06-03 00:00:00' -> '2025-06-03'),
+    # para que as consultas comparem a coluna direto, sem date()/strftime(), e usem índice.
+    # Valores que não são datas (date() devolve NULL) ficam como estão. Uma linha cuja
+    # versão normalizada já existe (mesma chave UNIQUE) é o mesmo registro gravado duas
+    # vezes: sai do banco, com os itens de treino passados para a linha que fica, e vai
+    # para datas_duplicadas, onde pode ser conferida.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS datas_duplicadas (
+        tabela      TEXT    NOT NULL,
+        id          INTEGER NOT NULL,
+        mantido_id  INTEGER NOT NULL,
+        registro    TEXT    NOT NULL,  -- a linha removida, em JSON
+        removido_em TEXT    NOT NULL DEFAULT (datetime('now'))
+    );
+    """)
+    for tabela, (datas, chave) in _DATAS_NORMALIZADAS.items():
+        normalizadas = {coluna: f"COALESCE(date({coluna}), {coluna})" for coluna in datas}
+        fora_do_formato = " OR ".join(f"{coluna} <> date({coluna})" for coluna in datas)
+        # A grande maioria não colide e vai num UPDATE só; o que sobra são as colisões
+        cursor.execute(f"""
+            UPDATE OR IGNORE {tabela}
+            SET {", ".join(f"{coluna} = {expressao}" for coluna, expressao in normalizadas.items())}
+            WHERE {fora_do_formato}
+        """)
+        colunas = [linha[1] for linha in cursor.execute(f"PRAGMA table_info({tabela})").fetchall()]
+        restantes = cursor.execute(f"""
+            SELECT {", ".join(normalizadas.get(coluna, coluna) for coluna in chave)}, json_object({
+                ", ".join(f"'{coluna}', {coluna}" for coluna in colunas)}), id
+            FROM {tabela} WHERE {fora_do_formato} ORDER BY id
+        """).fetchall()
+        for *valores, registro, id_linha in restantes:
+            mantido = cursor.execute(
+                f"SELECT id FROM {tabela} WHERE {' AND '.join(f'{coluna} = ?' for coluna in chave)}",
+                valores).fetchone()
+            if mantido is None:
+                continue
+            if tabela == "treinos":
+                # Itens iguais aos que a linha mantida já tem ficam de fora pelo UNIQUE
+                cursor.execute("UPDATE OR IGNORE treino_exercicios SET treino_id = ? WHERE treino_id = ?",
+                               (mantido[0], id_linha))
+                cursor.execute("DELETE FROM treino_exercicios WHERE treino_id = ?", (id_linha,))
+            cursor.execute(f"DELETE FROM {tabela} WHERE id = ?", (id_linha,))
+            cursor.execute("INSERT INTO datas_duplicadas (tabela, id, mantido_id, registro) VALUES (?, ?, ?, ?)",
+                           (tabela, id_linha, mantido[0], registro))
+
+def _criar_indices(cursor):
+    # treinos.cliente_id já é coberto pelo índice UNIQUE (cliente_id, instrutor_id, ...),
+    # assim como pagamentos.cliente_id; não é preciso um índice próprio para eles.
+    for sql in (
+        "CREATE INDEX IF NOT EXISTS idx_clientes_nome         ON clientes (nome)",
+        "CREATE INDEX IF NOT EXISTS idx_clientes_plano        ON clientes (plano_id)",
+        "CREATE INDEX IF NOT EXISTS idx_clientes_instrutor    ON clientes (instrutor_id)",
+        "CREATE INDEX IF NOT EXISTS idx_treinos_data_fim      ON treinos (data_fim, cliente_id)",
+        "CREATE INDEX IF NOT EXISTS idx_treinos_data_inicio   ON treinos (data_inicio, cliente_id)",
+        "CREATE INDEX IF NOT EXISTS idx_pagamentos_data       ON pagamentos (data_pagamento, valor_pago)",
+    ):
+        cursor.execute(sql)
+
+# O cubo inteiro calculado dos pagamentos (carga inicial e reconstrução)
+_CARGA_CUBO_RECEITA = """
+    INSERT INTO receita_cubo (mes, plano_id, instrutor_id, total, quantidade)
+    SELECT substr(p.data_pagamento, 1, 7), p.plano_id, IFNULL(c.instrutor_id, 0),
+           SUM(p.valor_pago), COUNT(*)
+    FROM pagamentos p
+    LEFT JOIN clientes c ON c.id = p.cliente_id
+    GROUP BY 1, 2, 3
+"""
+
+def _criar_cubo_receita(cursor):
+    # Cubo de receita pré-agregado por mês x plano x instrutor (instrutor do cliente;
+    # 0 quando o cliente não existe). Os gatilhos mantêm o cubo em dia a cada
+    # INSERT/DELETE/UPDATE em pagamentos, inclusive nas cargas por CSV.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS receita_cubo (
+        mes          TEXT    NOT NULL,
+        plano_id     INTEGER NOT NULL,
+        instrutor_id INTEGER NOT NULL,
+        total        REAL    NOT NULL,
+        quantidade   INTEGER NOT NULL,
+        PRIMARY KEY (mes, plano_id, instrutor_id)
+    ) WITHOUT ROWID;
+    """)
+
+    somar = """
+        INSERT INTO receita_cubo (mes, plano_id, instrutor_id, total, quantidade)
+        VALUES (substr(NEW.data_pagamento, 1, 7), NEW.plano_id,
+                IFNULL((SELECT instrutor_id FROM clientes WHERE id = NEW.cliente_id), 0),
+                NEW.valor_pago, 1)
+        ON CONFLICT (mes, plano_id, instrutor_id) DO UPDATE SET
+            total      = total + excluded.total,
+            quantidade = quantidade + 1;
+    """
+    subtrair = """
+        UPDATE receita_cubo
+        SET total = total - OLD.valor_pago, quantidade = quantidade - 1
+        WHERE mes = substr(OLD.data_pagamento, 1, 7)
+          AND plano_id = OLD.plano_id
+          AND instrutor_id = IFNULL((SELECT instrutor_id FROM clientes WHERE id = OLD.cliente_id), 0);
+        DELETE FROM receita_cubo
+        WHERE mes = substr(OLD.data_pagamento, 1, 7) AND plano_id = OLD.plano_id AND quantidade <= 0;
+    """
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_receita_cubo_insert AFTER INSERT ON pagamentos BEGIN {somar} END;")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_receita_cubo_delete AFTER DELETE ON pagamentos BEGIN {subtrair} END;")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_receita_cubo_update AFTER UPDATE ON pagamentos BEGIN {subtrair} {somar} END;")
+
+    # Carga inicial com os pagamentos que já existem
+    cursor.execute("DELETE FROM receita_cubo")
+    cursor.execute(_CARGA_CUBO_RECEITA)
+
+# Índices de busca textual (FTS5): tabela de origem -> (tabela FTS, colunas indexadas,
+# pesos de cada coluna no bm25). O rowid da tabela FTS é o id do registro de origem.
+FONTES_BUSCA = {
+    "clientes":    ("busca_clientes",    ("nome", "email", "telefone"), (10.0, 2.0, 1.0)),
+    "exercicios":  ("busca_exercicios",  ("nome", "grupo_muscular"),    (10.0, 2.0)),
+    "instrutores": ("busca_instrutores", ("nome", "especialidade"),     (10.0, 2.0)),
+}
+
+# O telefone é indexado só com dígitos, com e sem o DDD: "(11) 91234-5678" vira os
+# tokens "11912345678" e "912345678", para a busca achar o número digitado das duas formas
+_DIGITOS_SQL = "replace(replace(replace(replace(replace(replace({}, '(', ''), ')', ''), '-', ''), ' ', ''), '.', ''), '+', '')"
+
+def _valores_busca(colunas, origem):
+    valores = []
+    for coluna in colunas:
+        if coluna == "telefone":
+            digitos = _DIGITOS_SQL.format(f"{origem}{coluna}")
+            valores.append(f"{digitos} || ' ' || substr({digitos}, 3)")
+        else:
+            valores.append(f"{origem}{coluna}")
+    return ", ".join(valores)
+
+def _criar_busca(cursor):
+    # unicode61 com remove_diacritics 2 ignora acentos no índice e na consulta
+    # ("joao" acha "João"). Os índices de prefixo de 1 a 6 letras deixam as buscas
+    # "começa com" lerem só o início da lista de cada termo (sem eles o FTS5 junta
+    # a lista inteira de todos os termos com aquele prefixo): com 1 milhão de
+    # clientes custam ~50% a mais de espaço e deixam a busca 3 a 10x mais rápida.
+    # Os gatilhos mantêm cada índice em dia com a tabela de origem, inclusive nas
+    # cargas por CSV.
+    for tabela, (fts, colunas, pesos) in FONTES_BUSCA.items():
+        lista = ", ".join(colunas)
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {lista}, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3 4 5 6'
+            )
+        """)
+        # ORDER BY rank passa a usar os pesos da tabela (nome vale mais que o resto)
+        cursor.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', 'bm25({', '.join(map(str, pesos))})')")
+
+        inserir = f"INSERT INTO {fts} (rowid, {lista}) VALUES (NEW.id, {_valores_busca(colunas, 'NEW.')});"
+        apagar = f"DELETE FROM {fts} WHERE rowid = OLD.id;"
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {tabela} BEGIN {inserir} END;")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {tabela} BEGIN {apagar} END;")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE ON {tabela} BEGIN {apagar} {inserir} END;")
+
+        # Carga inicial com os registros que já existem
+        cursor.execute(f"DELETE FROM {fts}")
+        cursor.execute(f"INSERT INTO {fts} (rowid, {lista}) SELECT id, {_valores_busca(colunas, '')} FROM {tabela}")
+
+def _criar_modelos_treino(cursor):
+    # Modelo de treino: uma lista nomeada e ordenada de (exercício, séries, repetições)
+    # que o instrutor aplica de uma vez a vários treinos
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS modelos_treino (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT UNIQUE NOT NULL
+    );
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS modelo_exercicios (
+        modelo_id    INTEGER NOT NULL,
+        ordem        INTEGER NOT NULL,
+        exercicio_id INTEGER NOT NULL,
+        series       INTEGER NOT NULL,
+        repeticoes   INTEGER NOT NULL,
+        PRIMARY KEY (modelo_id, ordem),
+        FOREIGN KEY(modelo_id)    REFERENCES modelos_treino(id),
+        FOREIGN KEY(exercicio_id) REFERENCES exercicios(id)
+    ) WITHOUT ROWID;
+    """)
+
+def _criar_versoes(cursor):
+    # Versão de cada tabela compartilhada por todos os processos que abrem o arquivo:
+    # os gatilhos a incrementam na mesma transação da escrita (inclusive as feitas
+    # por gatilhos, como as do cubo de receita, e as cargas por CSV). Tabelas
+    # criadas em migrações futuras precisam ganhar os seus gatilhos também.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS versoes (
+        tabela TEXT PRIMARY KEY,
+        versao INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    """)
+    for tabela in TABELAS:
+        cursor.execute("INSERT OR IGNORE INTO versoes (tabela, versao) VALUES (?, 0)", (tabela,))
+        incrementar = f"UPDATE versoes SET versao = versao + 1 WHERE tabela = '{tabela}';"
+        for evento in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_versao_{tabela}_{evento.lower()} "
+                           f"AFTER {evento} ON {tabela} BEGIN {incrementar} END;")
+
+def _criar_pendencias_snapshot(cursor):
+    # Meses do snapshot Parquet que mudaram desde a última exportação: cada escrita
+    # nas tabelas de fatos marca o mês da linha antes e depois dela (um UPDATE que
+    # muda a data mexe em dois meses) e incrementa a versão da pendência, para a
+    # exportação só dar baixa no que não mudou de novo enquanto ela rodava.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS snapshot_pendente (
+        tabela TEXT    NOT NULL,
+        mes    TEXT    NOT NULL,
+        versao INTEGER NOT NULL,
+        PRIMARY KEY (tabela, mes)
+    ) WITHOUT ROWID;
+    """)
+
+    def marcar(tabela, mes):
+        return f"""
+            INSERT INTO snapshot_pendente (tabela, mes, versao) VALUES ('{tabela}', COALESCE({mes}, 'sem-data'), 1)
+            ON CONFLICT (tabela, mes) DO UPDATE SET versao = versao + 1;"""
+
+    mes_treino = "(SELECT substr(data_inicio, 1, 7) FROM treinos WHERE id = {}.treino_id)"
+    gatilhos = {
+        "pagamentos": lambda linha: marcar("pagamentos", f"substr({linha}.data_pagamento, 1, 7)"),
+        "treinos": lambda linha: marcar("treinos", f"substr({linha}.data_inicio, 1, 7)"),
+        "treino_exercicios": lambda linha: marcar("treino_exercicios", mes_treino.format(linha)),
+    }
+    for tabela, marcar_linha in gatilhos.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_snapshot_{tabela}_insert AFTER INSERT ON {tabela} "
+                       f"BEGIN {marcar_linha('NEW')} END;")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_snapshot_{tabela}_delete AFTER DELETE ON {tabela} "
+                       f"BEGIN {marcar_linha('OLD')} END;")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_snapshot_{tabela}_update AFTER UPDATE ON {tabela} "
+                       f"BEGIN {marcar_linha('OLD')} {marcar_linha('NEW')} END;")
+
+    # Os itens herdam o mês do treino: mudar a data ou apagar o treino os move de partição
+    itens_do_treino = "(SELECT 1 FROM treino_exercicios WHERE treino_id = OLD.id)"
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_snapshot_treinos_itens_update
+        AFTER UPDATE OF data_inicio ON treinos WHEN EXISTS {itens_do_treino}
+        BEGIN {marcar("treino_exercicios", "substr(OLD.data_inicio, 1, 7)")}
+              {marcar("treino_exercicios", "substr(NEW.data_inicio, 1, 7)")} END;""")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_snapshot_treinos_itens_delete
+        AFTER DELETE ON treinos WHEN EXISTS {itens_do_treino}
+        BEGIN {marcar("treino_exercicios", "substr(OLD.data_inicio, 1, 7)")}
+              {marcar("treino_exercicios", "NULL")} END;""")
+
+def _criar_cubo_receita_por_cliente(cursor):
+    # O cubo usa o instrutor atual do cliente: trocar o instrutor (ou apagar o
+    # cliente, que leva a receita para o instrutor 0) move os totais dos pagamentos
+    # dele de uma célula para a outra, mês a mês e plano a plano.
+    def mover(de, para, cliente):
+        return f"""
+            UPDATE receita_cubo
+            SET total = receita_cubo.total - p.total, quantidade = receita_cubo.quantidade - p.quantidade
+            FROM (SELECT substr(data_pagamento, 1, 7) AS mes, plano_id, SUM(valor_pago) AS total, COUNT(*) AS quantidade
+                  FROM pagamentos WHERE cliente_id = {cliente} GROUP BY 1, 2) AS p
+            WHERE receita_cubo.mes = p.mes AND receita_cubo.plano_id = p.plano_id
+              AND receita_cubo.instrutor_id = IFNULL({de}, 0);
+            DELETE FROM receita_cubo WHERE instrutor_id = IFNULL({de}, 0) AND quantidade <= 0;
+            INSERT INTO receita_cubo (mes, plano_id, instrutor_id, total, quantidade)
+            SELECT substr(data_pagamento, 1, 7), plano_id, IFNULL({para}, 0), SUM(valor_pago), COUNT(*)
+            FROM pagamentos WHERE cliente_id = {cliente} GROUP BY 1, 2
+            ON CONFLICT (mes, plano_id, instrutor_id) DO UPDATE SET
+                total      = total + excluded.total,
+                quantidade = quantidade + excluded.quantidade;"""
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_receita_cubo_cliente_instrutor
+        AFTER UPDATE OF instrutor_id ON clientes WHEN IFNULL(OLD.instrutor_id, 0) != IFNULL(NEW.instrutor_id, 0)
+        BEGIN {mover("OLD.instrutor_id", "NEW.instrutor_id", "NEW.id")} END;""")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_receita_cubo_cliente_delete
+        AFTER DELETE ON clientes WHEN IFNULL(OLD.instrutor_id, 0) != 0
+        BEGIN {mover("OLD.instrutor_id", "NULL", "OLD.id")} END;""")
+
+    # Clientes que já trocaram de instrutor antes dos gatilhos: o cubo é refeito
+    cursor.execute("DELETE FROM receita_cubo")
+    cursor.execute(_CARGA_CUBO_RECEITA)
+
+# (versão, descrição, função que recebe o cursor)
+_MIGRACOES = [
+    (1, "tabelas iniciais", _criar_tabelas),
+    (2, "datas normalizadas como YYYY-MM-DD", _normalizar_datas),
+    (3, "índices secundários de clientes, treinos e pagamentos", _criar_indices),
+    (4, "cubo de receita por mês x plano x instrutor", _criar_cubo_receita),
+    (5, "busca textual (FTS5) em clientes, exercícios e instrutores", _criar_busca),
+    (6, "modelos de treino", _criar_modelos_treino),
+    (7, "versões das tabelas compartilhadas entre processos", _criar_versoes),
+    (8, "meses do snapshot Parquet alterados desde a última exportação", _criar_pendencias_snapshot),
+    (9, "cubo de receita acompanha a troca de instrutor do cliente", _criar_cubo_receita_por_cliente),
+    # Bancos migrados antes de a 2 tratar as colisões ainda podem ter datas fora do formato
+    (10, "datas que colidiam na normalização", _normalizar_datas),
+]
+
+def versao_esquema():
+    """Retorna a versão de esquema aplicada ao banco (0 para um banco novo)."""
+    with _leitura() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+@_repetir_se_ocupado
+def migrar_banco():
+    """
+    Aplica as migrações pendentes, em ordem. Seguro para rodar em qualquer banco
+    existente e por vários processos ao mesmo tempo: a versão é relida dentro da
+    transação (BEGIN IMMEDIATE), então cada migração é aplicada uma única vez.
+    Retorna a lista de (versão, descrição) aplicadas nesta chamada.
+    """
+    aplicadas = []
+    for versao, descricao, migracao in _MIGRACOES:
+        with _transacao(*TABELAS) as conn:
+            atual = conn.execute("PRAGMA user_version").fetchone()[0]
+            if atual >= versao:
+                continue
+            migracao(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {versao}")
+        aplicadas.append((versao, descricao))
+    if aplicadas:
+        with _transacao() as conn:
+            conn.execute("PRAGMA optimize")
+    return aplicadas
+
+# 3) Carregando os CSVs
+# Dados dos arquivos 
+def _ler_csv(arquivo):
+    return pd.read_csv(arquivo, sep=',', encoding='utf-8-sig')
+
+# 4) Inserção em cada tabela, só com novos
+# Colunas aceitas na carga de cada tabela: (coluna, tipo, obrigatória)
+_COLUNAS_CARGA = {
+    "clientes": [("nome", "texto", True), ("idade", "inteiro", True), ("sexo", "texto", True),
+                 ("email", "texto", True), ("telefone", "texto", True), ("plano_id", "inteiro", True),
+                 ("instrutor_id", "inteiro", True), ("treino_id", "inteiro", False)],
+    "instrutores": [("nome", "texto", True), ("especialidade", "texto", False)],
+    "planos": [("nome", "texto", True), ("preco_mensal", "real", True), ("duracao_meses", "inteiro", True)],
+    "exercicios": [("nome", "texto", True), ("grupo_muscular", "texto", True)],
+    "treinos": [("cliente_id", "inteiro", True), ("instrutor_id", "inteiro", True), ("data_inicio", "data", False),
+                ("data_fim", "data", False), ("plano_id", "inteiro", False)],
+    "treino_exercicios": [("treino_id", "inteiro", True), ("treino", "texto", False), ("exercicio_id", "inteiro", True),
+                          ("exercicio", "texto", False), ("series", "inteiro", True), ("repeticoes", "inteiro", True)],
+    "pagamentos": [("cliente_id", "inteiro", True), ("data_pagamento", "data", True),
+                   ("valor_pago", "real", True), ("plano_id", "inteiro", True)],
+}
+
+# Colunas que identificam um registro já existente (as mesmas UNIQUE das tabelas)
+_CHAVES_CARGA = {
+    "clientes":          ["email"],
+    "instrutores":       ["nome", "especialidade"],
+    "planos":            ["nome", "preco_mensal", "duracao_meses"],
+    "exercicios":        ["nome", "grupo_muscular"],
+    "treinos":           ["cliente_id", "instrutor_id", "data_inicio", "data_fim", "plano_id"],
+    "treino_exercicios": ["treino_id", "exercicio_id", "series", "repeticoes"],
+    "pagamentos":        ["cliente_id", "data_pagamento", "valor_pago", "plano_id"],
+}
+
+# CSVs importados por inicializar_banco(), na ordem das dependências
+CSVS_INICIAIS = [
+    ("clientes_academia.csv",  "clientes"),
+    ("instrutores.csv",        "instrutores"),
+    ("planos.csv",             "planos"),
+    ("exercicios.csv",         "exercicios"),
+    ("treinos.csv",            "treinos"),
+    ("treino_exercicios.csv",  "treino_exercicios"),
+    ("pagamento_clientes.csv", "pagamentos"),
+]
+
+TAMANHO_LOTE_CARGA = 50_000
+
+@dataclass
+class ResultadoImportacao:
+    """Relatório de uma carga de CSV."""
+    tabela: str
+    arquivos: list
+    lidas: int = 0
+    inseridas: int = 0
+    ignoradas: int = 0     # já existiam no banco ou repetidas no próprio arquivo
+    rejeitadas: int = 0    # campo obrigatório vazio, número ou data inválidos
+    segundos: float = 0.0
+
+    @property
+    def linhas_por_segundo(self):
+        return self.lidas / self.segundos if self.segundos else 0.0
+
+def _colunas_obrigatorias(tabela):
+    return {coluna for coluna, _, obrigatoria in _COLUNAS_CARGA[tabela] if obrigatoria}
+
+def _validar_lote(lote, colunas):
+    """
+    Converte as colunas do lote (lidas como texto) para o tipo da tabela, de forma
+    vetorizada, e devolve (lote_convertido, máscara_de_linhas_válidas).
+    """
+    validas = pd.Series(True, index=lote.index)
+    convertido = {}
+    for coluna, tipo, obrigatoria in colunas:
+        bruto = lote[coluna] if coluna in lote else pd.Series(None, index=lote.index, dtype=object)
+        vazio = bruto.isna()
+        if tipo == "texto":
+            valor = bruto.astype(object)
+            invalido = pd.Series(False, index=lote.index)
+        elif tipo == "data":
+            datas = pd.to_datetime(bruto, errors="coerce", format="ISO8601")
+            valor = datas.dt.strftime("%Y-%m-%d").astype(object)
+            invalido = datas.isna() & ~vazio
+        else:
+            numeros = pd.to_numeric(bruto, errors="coerce")
+            invalido = numeros.isna() & ~vazio
+            if tipo == "inteiro":
+                invalido |= numeros.notna() & (numeros % 1 != 0)
+                valor = numeros.where(~invalido).astype("Int64").astype(object)
+            else:
+                valor = numeros.astype(object)
+        validas &= ~invalido
+        if obrigatoria:
+            validas &= ~vazio
+        convertido[coluna] = valor.where(valor.notna(), None)
+    return pd.DataFrame(convertido), validas
+
+def _inserir_lote(conn, tabela, registros, colunas):
+    """
+    Grava o lote numa tabela temporária de staging e insere na tabela final só os
+    registros que ainda não existem (anti-join pela chave + INSERT OR IGNORE para
+    as repetições dentro do próprio lote). Devolve quantas linhas foram inseridas.
+    """
+    staging = f"_carga_{tabela}"
+    lista = ", ".join(colunas)
+    conn.execute(f"DROP TABLE IF EXISTS temp.{staging}")
+    conn.execute(f"CREATE TEMP TABLE {staging} AS SELECT {lista} FROM main.{tabela} WHERE 0")
+    conn.executemany(
+        f"INSERT INTO temp.{staging} ({lista}) VALUES ({', '.join('?' * len(colunas))})",
+        registros,
+    )
+    chave = _CHAVES_CARGA[tabela]
+    filtro = ""
+    if not set(chave) <= _colunas_obrigatorias(tabela):
+        # A UNIQUE não barra chaves com NULL (NULL <> NULL); o anti-join com IS barra
+        condicao = " AND ".join(f"t.{c} IS s.{c}" for c in chave)
+        filtro = f"WHERE NOT EXISTS (SELECT 1 FROM main.{tabela} t WHERE {condicao})"
+    # Ordenar pela chave faz a inserção no índice UNIQUE percorrer a árvore em sequência
+    cursor = conn.execute(f"""
+        INSERT OR IGNORE INTO main.{tabela} ({lista})
+        SELECT {", ".join(f"s.{c}" for c in colunas)}
+        FROM temp.{staging} s
+        {filtro}
+        ORDER BY {", ".join(f"s.{c}" for c in chave)}
+    """)
+    inseridas = cursor.rowcount
+    conn.execute(f"DROP TABLE temp.{staging}")
+    return inseridas
+
+@_repetir_se_ocupado
+def _gravar_lote(tabela, registros, colunas):
+    with _transacao(tabela) as conn:
+        return _inserir_lote(conn, tabela, registros, colunas)
+
+def importar_csv(arquivos, tabela, tamanho_lote=TAMANHO_LOTE_CARGA):
+    """
+    Carga em massa de um ou mais CSVs na tabela informada.
+    Lê os arquivos em lotes (sem carregar tudo na memória), valida e converte
+    cada lote de forma vetorizada e grava cada lote em uma transação própria,
+    inserindo só os registros novos. Retorna um ResultadoImportacao com linhas
+    lidas, inseridas, ignoradas (já existentes) e rejeitadas (inválidas).
+    """
+    if tabela not in _COLUNAS_CARGA:
+        raise ValueError(f"Tabela '{tabela}' não aceita carga por CSV.")
+    if isinstance(arquivos, (str, os.PathLike)):
+        arquivos = [arquivos]
+
+    especificacao = _COLUNAS_CARGA[tabela]
+    obrigatorias = _colunas_obrigatorias(tabela)
+    aceitas = {coluna for coluna, _, _ in especificacao}
+    # Texto e datas chegam como str; colunas numéricas são convertidas pelo parser em C
+    # (se houver valor inválido a coluna vem como texto e _validar_lote rejeita a linha)
+    textuais = {coluna: str for coluna, tipo, _ in especificacao if tipo in ("texto", "data")}
+    resultado = ResultadoImportacao(tabela=tabela, arquivos=[str(a) for a in arquivos])
+    inicio = time.perf_counter()
+
+    for arquivo in arquivos:
+        leitor = pd.read_csv(
+            arquivo, sep=',', encoding='utf-8-sig', dtype=textuais,
+            usecols=lambda coluna: coluna in aceitas, chunksize=tamanho_lote,
+        )
+        for lote in leitor:
+            faltando = obrigatorias - set(lote.columns)
+            if faltando:
+                raise ValueError(f"{arquivo}: colunas obrigatórias ausentes: {', '.join(sorted(faltando))}")
+            colunas = [coluna for coluna, _, _ in especificacao if coluna in lote.columns]
+            convertido, validas = _validar_lote(lote, especificacao)
+            convertido = convertido.loc[validas, colunas]
+
+            registros = list(zip(*(convertido[c].tolist() for c in colunas)))
+            inseridas = 0
+            if registros:
+                inseridas = _gravar_lote(tabela, registros, colunas)
+
+            resultado.lidas += len(lote)
+            resultado.rejeitadas += int((~validas).sum())
+            resultado.inseridas += inseridas
+            resultado.ignoradas += len(registros) - inseridas
+
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+TABELAS = ("clientes", "instrutores", "planos", "exercicios",
+           "treinos", "treino_exercicios", "pagamentos", "users", "receita_cubo",
+           "modelos_treino", "modelo_exercicios")
+
+def inicializar_banco(carregar_csvs=True):
+    """
+    Ponto de entrada explícito de inicialização: aplica as migrações de esquema
+    pendentes e, se carregar_csvs for True, importa dos CSVs os registros que
+    ainda não estão no banco. Importar o backend não toca no banco nem lê
+    arquivos; o front-end chama esta função uma vez por processo (ou rode
+    `python backend.py`). Retorna a lista de ResultadoImportacao das cargas feitas.
+    """
+    migrar_banco()
+
+    resultados = []
+    if carregar_csvs:
+        for arquivo, tabela in CSVS_INICIAIS:
+            resultados.append(importar_csv(arquivo, tabela))
+    return resultados
+
+# Dados de referência comuns a toda a rede, copiados para cada unidade nova
+CSVS_REFERENCIA_UNIDADES = [("planos.csv", "planos"), ("exercicios.csv", "exercicios")]
+
+def inicializar_unidades():
+    """
+    Aplica as migrações no banco de cada unidade configurada (criando o arquivo
+    se ainda não existir) e carrega os planos e exercícios padrão da rede.
+    Retorna {unidade: lista de ResultadoImportacao}.
+    """
+    resultados = {}
+    for nome in _unidades:
+        with unidade(nome):
+            migrar_banco()
+            resultados[nome] = [importar_csv(arquivo, tabela) for arquivo, tabela in CSVS_REFERENCIA_UNIDADES]
+    return resultados
+
+# ----------------------------------------BUSCA DE CLIENTES---------------------------------------------------
+LIMITE_BUSCA_CLIENTES = 20
+
+_ACENTOS = re.compile(r"[\u0300-\u036f]")
+_NAO_DIGITOS = re.compile(r"\D")
+_PALAVRAS = re.compile(r"\w+")
+
+def _normalizar_busca(texto):
+    """Minúsculas e sem acentos, para a busca não depender de como o nome foi digitado."""
+    texto = str(texto or "").casefold()
+    if texto.isascii():
+        return texto
+    return _ACENTOS.sub("", unicodedata.normalize("NFKD", texto))
+
+def _so_digitos(texto):
+    return _NAO_DIGITOS.sub("", str(texto or ""))
+
+
+class IndiceClientes:
+    """
+    Índice em memória sobre nome, email e telefone dos clientes: a lista ordenada
+    das palavras já normalizadas (minúsculas, sem acentos, telefone só com
+    dígitos), cada uma com os ids dos clientes em que aparece. "Começa com" vira
+    uma busca binária na lista, e o custo da busca depende de quantas palavras
+    casam, não de quantos clientes existem. Guarda também o nome normalizado de
+    cada id (para ordenar) e o mapa id -> nome de exibição.
+
+    Montá-lo com 100 mil clientes leva ~1 s; por isso, quando a tabela clientes
+    muda, atualizado() gera a versão nova mexendo só nas palavras dos clientes
+    que entraram, mudaram ou saíram.
+    """
+
+    def __init__(self, registros):
+        self.rotulos = {}
+        self._registros = {}
+        self._nomes = {}
+        self._nomes_normalizados = {}  # os nomes se repetem muito: cada um é normalizado uma vez
+        ids_por_palavra = collections.defaultdict(list)
+
+        for registro in registros:
+            for palavra in self._incluir(registro):  # repetidas só repetem o id, que vira conjunto na busca
+                ids_por_palavra[palavra].append(registro["id"])
+
+        self._palavras = sorted(ids_por_palavra)
+        self._ids = [ids_por_palavra[palavra] for palavra in self._palavras]
+
+    def _palavras_do_cliente(self, registro):
+        """(nome normalizado, palavras do cliente no índice)."""
+        nome, email = registro["nome"], registro.get("email")
+        normalizado = self._nomes_normalizados.get(nome)
+        if normalizado is None:
+            texto = _normalizar_busca(nome)
+            normalizado = self._nomes_normalizados[nome] = (texto, tuple(set(texto.split())))
+        palavras = list(normalizado[1])
+        if email:
+            # O email entra inteiro e quebrado em palavras ("ana.silva@x.com" -> ana, silva, x, com)
+            email = _normalizar_busca(email)
+            palavras.append(email)
+            palavras += _PALAVRAS.findall(email)
+        telefone = _so_digitos(registro.get("telefone"))
+        if telefone:
+            # Com e sem o DDD: "9123" acha "(11) 91234-5678"
+            palavras += (telefone, telefone[2:]) if len(telefone) >= 10 else (telefone,)
+        return normalizado[0], palavras
+
+    def _incluir(self, registro):
+        # Guarda o registro, o nome para ordenar e o rótulo; devolve as palavras a indexar
+        id_cliente = registro["id"]
+        self._nomes[id_cliente], palavras = self._palavras_do_cliente(registro)
+        self._registros[id_cliente] = registro
+        self.rotulos[id_cliente] = (f"{registro['nome']} — {registro['email']}"
+                                    if registro.get("email") else registro["nome"])
+        return palavras
+
+    def atualizado(self, registros):
+        """
+        Novo índice para `registros` (a tabela clientes inteira, como no construtor)
+        aproveitando este: só as palavras dos clientes novos, alterados ou excluídos
+        são trocadas. Este índice não muda, pois pode estar em uso por outra busca.
+        """
+        novos = {registro["id"]: registro for registro in registros}
+        saidas = [registro for id_cliente, registro in self._registros.items() if novos.get(id_cliente) != registro]
+        entradas = [registro for id_cliente, registro in novos.items() if self._registros.get(id_cliente) != registro]
+        if len(saidas) + len(entradas) > len(novos) // 10:
+            return IndiceClientes(registros)
+
+        indice = copy.copy(self)
+        indice.rotulos, indice._nomes, indice._registros = dict(self.rotulos), dict(self._nomes), dict(self._registros)
+        indice._palavras, indice._ids = list(self._palavras), list(self._ids)
+        for registro in saidas:
+            id_cliente = registro["id"]
+            del indice.rotulos[id_cliente], indice._nomes[id_cliente], indice._registros[id_cliente]
+            for palavra in set(self._palavras_do_cliente(registro)[1]):
+                posicao = bisect.bisect_left(indice._palavras, palavra)
+                ids = [outro for outro in indice._ids[posicao] if outro != id_cliente]
+                if ids:
+                    indice._ids[posicao] = ids  # lista nova: a antiga segue com o índice anterior
+                else:
+                    del indice._palavras[posicao], indice._ids[posicao]
+        for registro in entradas:
+            for palavra in set(indice._incluir(registro)):
+                posicao = bisect.bisect_left(indice._palavras, palavra)
+                if posicao < len(indice._palavras) and indice._palavras[posicao] == palavra:
+                    indice._ids[posicao] = indice._ids[posicao] + [registro["id"]]
+                else:
+                    indice._palavras.insert(posicao, palavra)
+                    indice._ids.insert(posicao, [registro["id"]])
+        return indice
+
+    def _com_prefixo(self, prefixo):
+        # As palavras que começam com o prefixo ficam contíguas na lista ordenada
+        inicio = bisect.bisect_left(self._palavras, prefixo)
+        fim = bisect.bisect_left(self._palavras, prefixo + "\U0010ffff", inicio)
+        return set(itertools.chain.from_iterable(self._ids[inicio:fim]))
+
+    def buscar(self, termo, limite=LIMITE_BUSCA_CLIENTES):
+        """
+        Até `limite` clientes com uma palavra do nome, email ou telefone começando
+        com cada termo digitado. Primeiro quem começa com o texto buscado, depois
+        o resto; empates por nome.
+        """
+        consulta = " ".join(_normalizar_busca(termo).split())
+        if not any(ch.isalpha() for ch in consulta) and _so_digitos(consulta):
+            termos = [_so_digitos(consulta)]  # "(11) 9123-4567": telefone foi indexado só com dígitos
+        else:
+            termos = consulta.split()
+        if not termos:
+            return []
+
+        # O termo mais longo costuma casar menos: os outros só filtram o que sobrou
+        termos = sorted(set(termos), key=len, reverse=True)
+        ids = self._com_prefixo(termos[0])
+        for termo_restante in termos[1:]:
+            if not ids:
+                break
+            ids &= self._com_prefixo(termo_restante)
+
+        def ordem(id_cliente):
+            nome = self._nomes[id_cliente]
+            return (not nome.startswith(consulta), nome, id_cliente)
+
+        return [self._registros[id_cliente] for id_cliente in heapq.nsmallest(limite, ids, key=ordem)]
+
+# ----------------------------------------CATÁLOGO DE REFERÊNCIA---------------------------------------------------
+class CatalogoReferencia:
+    """
+    Dados de referência em memória — planos, instrutores, exercícios e o índice
+    nome -> cliente — para que formulários e dropdowns não leiam as tabelas
+    inteiras a cada envio. Cada parte guarda a versão da sua tabela e só é
+    recarregada quando essa tabela muda; as buscas por nome são O(1).
+    """
+
+    _CONSULTAS = {
+        "planos":      "SELECT id, nome, preco_mensal, duracao_meses FROM planos ORDER BY id",
+        "instrutores": "SELECT id, nome, especialidade FROM instrutores ORDER BY id",
+        "exercicios":  "SELECT id, nome, grupo_muscular FROM exercicios ORDER BY id",
+        "clientes":    "SELECT id, nome, email, telefone, plano_id, instrutor_id FROM clientes ORDER BY id",
+    }
+
+    def __init__(self):
+        self._partes = {}   # tabela -> (versão, registros, {nome: registro}, {id: registro})
+        self._indice_clientes = (None, None)  # (parte de clientes usada, IndiceClientes)
+        self._lock = threading.Lock()
+
+    def _carregar(self, tabela):
+        versao = _versao_tabelas(tabela)  # lida antes da consulta: nunca marca dado velho como novo
+        with _leitura(ao_vivo=True) as conn:  # nunca da cópia analítica: a versão é a do banco ao vivo
+            cursor = conn.execute(self._CONSULTAS[tabela])
+            colunas = [d[0] for d in cursor.description]
+            registros = [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
+        por_nome, por_id = {}, {}
+        for registro in registros:
+            por_nome.setdefault(registro["nome"], registro)  # nome repetido: vale o de menor id
+            por_id[registro["id"]] = registro
+        parte = (versao, registros, por_nome, por_id)
+        with self._lock:
+            self._partes[tabela] = parte
+        return parte
+
+    def _parte(self, tabela):
+        if tabela not in self._CONSULTAS:
+            raise ValueError(f"Tabela '{tabela}' não faz parte do catálogo.")
+        parte = self._partes.get(tabela)
+        if parte is None or parte[0] != _versao_tabelas(tabela):
+            parte = self._carregar(tabela)
+        return parte
+
+    def registros(self, tabela):
+        """Lista de dicts com os registros da tabela, em ordem de id."""
+        return list(self._parte(tabela)[1])
+
+    def nomes(self, tabela):
+        """Nomes distintos da tabela, na ordem de cadastro (para dropdowns)."""
+        return list(self._parte(tabela)[2])
+
+    def buscar(self, tabela, nome):
+        """
+        Registro (dict) com esse nome, ou None. Um nome que não está no catálogo
+        não provoca recarga: o que outro processo gravar já muda a versão da tabela.
+        """
+        return self._parte(tabela)[2].get(nome)
+
+    def por_id(self, tabela, id_registro):
+        """Registro (dict) com esse id, ou None."""
+        return self._parte(tabela)[3].get(id_registro)
+
+    def indice_clientes(self):
+        """IndiceClientes da versão atual da tabela clientes (atualizado só quando ela muda)."""
+        parte = self._parte("clientes")
+        base, indice = self._indice_clientes
+        if base is not parte:
+            indice = IndiceClientes(parte[1]) if indice is None else indice.atualizado(parte[1])
+            with self._lock:
+                self._indice_clientes = (parte, indice)
+        return indice
+
+
+_catalogos = {}  # caminho do banco -> CatalogoReferencia
+_lock_catalogos = threading.Lock()
+
+def catalogo():
+    """Retorna o catálogo de referência do banco do escopo atual, compartilhado pelo processo."""
+    caminho = _caminho_banco()
+    cat = _catalogos.get(caminho)
+    if cat is None:
+        with _lock_catalogos:
+            cat = _catalogos.setdefault(caminho, CatalogoReferencia())
+    return cat
+
+def buscar_clientes(termo, limite=LIMITE_BUSCA_CLIENTES):
+    """Busca clientes por parte do nome, email ou telefone; retorna até `limite` registros (dicts)."""
+    return catalogo().indice_clientes().buscar(termo, limite)
+
+LIMITE_BUSCA = 10
+CANDIDATOS_BUSCA = 200       # Registros mais relevantes (bm25) lidos por índice
+MINIMO_DIGITOS_TELEFONE = 6  # Buscas só com números procuram o telefone a partir deste tamanho
+
+def _consulta_fts(termo):
+    """
+    Converte o texto digitado numa consulta FTS5: cada palavra vira um prefixo
+    entre aspas ("ana sil" -> "ana"* "sil"*, todas obrigatórias). Só dígitos e
+    sinais de telefone viram um prefixo da coluna telefone (ou None, se curto demais).
+    """
+    texto = _normalizar_busca(termo)
+    if not any(ch.isalpha() for ch in texto) and _so_digitos(texto):
+        digitos = _so_digitos(texto)
+        return f'telefone : "{digitos}"*' if len(digitos) >= MINIMO_DIGITOS_TELEFONE else None
+    return " ".join(f'"{palavra}"*' for palavra in re.findall(r"\w+", texto)) or None
+
+def _candidatos_busca(conn, tabela, consulta):
+    """
+    Os CANDIDATOS_BUSCA registros mais relevantes de um índice, como (tabela, id,
+    nome, detalhe, bm25). O ORDER BY rank LIMIT fica dentro do FTS5, que guarda só
+    os melhores enquanto percorre os resultados, mesmo numa busca ampla ("a", "silva").
+    """
+    fts, colunas, _ = FONTES_BUSCA[tabela]
+    linhas = conn.execute(
+        f"SELECT rowid, nome, {colunas[1]}, rank FROM {fts} WHERE {fts} MATCH ? ORDER BY rank LIMIT ?",
+        (consulta, CANDIDATOS_BUSCA),
+    ).fetchall()
+    return [(tabela, id_registro, nome, detalhe, relevancia) for id_registro, nome, detalhe, relevancia in linhas]
+
+def buscar(termo, limite=LIMITE_BUSCA, tabelas=tuple(FONTES_BUSCA)):
+    """
+    Busca global nos índices FTS5 de clientes, exercícios e instrutores (sem
+    acentos, por início de palavra; só números procuram o telefone). Retorna até
+    `limite` dicts {"tipo", "id", "nome", "detalhe"} — detalhe é o email, o grupo
+    muscular ou a especialidade. Primeiro quem tem o nome começando com o texto
+    buscado, depois quem tem todas as palavras no nome, depois o resto (achado
+    pelo email, telefone ou grupo); dentro de cada faixa pelo bm25 e pelo nome.
+    """
+    consulta = _consulta_fts(termo)
+    if consulta is None:
+        return []
+    if consulta.startswith("telefone :"):
+        tabelas = [tabela for tabela in tabelas if "telefone" in FONTES_BUSCA[tabela][1]]
+
+    with _leitura() as conn:
+        candidatos = [c for tabela in tabelas for c in _candidatos_busca(conn, tabela, consulta)]
+
+    texto = " ".join(_normalizar_busca(termo).split())
+    palavras = texto.split()
+
+    def ordem(candidato):
+        nome = _normalizar_busca(candidato[2])
+        if nome.startswith(texto):
+            faixa = 0
+        elif all(any(p.startswith(t) for p in nome.split()) for t in palavras):
+            faixa = 1
+        else:
+            faixa = 2
+        return (faixa, candidato[4], nome, candidato[1])
+
+    return [{"tipo": tipo, "id": id_registro, "nome": nome, "detalhe": detalhe}
+            for tipo, id_registro, nome, detalhe, _ in heapq.nsmallest(limite, candidatos, key=ordem)]
+
+def rotulos_clientes():
+    """Mapa id -> nome de exibição ("Nome — email") de todos os clientes."""
+    return catalogo().indice_clientes().rotulos
 
 #----------------------------------------pergunta 1 e 2---------------------------------------------------#
+@em_cache("clientes", "planos")
 def clientes_planos(nome_plano):
-    conn = sqlite3.connect('academia_db.db') #Estabelece uma conexão direta com o banco de dados
     query = '''
         SELECT c.nome AS Cliente, p.nome AS Plano
         FROM clientes c
@@ -225,19 +2213,20 @@ def clientes_planos(nome_plano):
         WHERE p.nome = ?  
         ORDER BY c.nome
     '''
-    df = pd.read_sql_query(query, conn, params=(nome_plano,)) #Executa a consulta pelo valor passado na variável
-    conn.close()
+    with _leitura() as conn: # Conexão somente leitura do pool
+        df = pd.read_sql_query(query, conn, params=(nome_plano,)) #Executa a consulta pelo valor passado na variável
     return df
 #----------------------------------------pergunta 3---------------------------------------------------#
 
+@em_cache("clientes")
 def carregar_clientes():
-    conn = get_connection()  # Abre conexão com o banco de dados
-    df_clientes = pd.read_sql_query("SELECT id, nome FROM clientes", conn)  # Lê os dados de clientes (id e nome)
-    conn.close() # Fecha a conexão.
+    with _leitura() as conn:  # Empresta uma conexão de leitura do pool (devolvida ao sair do bloco)
+        df_clientes = pd.read_sql_query("SELECT id, nome FROM clientes", conn)  # Lê os dados de clientes (id e nome)
     return df_clientes  # Retorna um DataFrame com os clientes
 
+@analitica
+@em_cache(TABELA_COPIA)
 def listar_treinos_com_exercicios():
-    conn = get_connection()
     query = """
         SELECT 
             t.id AS Treino_ID,
@@ -256,15 +2245,16 @@ def listar_treinos_com_exercicios():
         JOIN exercicios e ON e.id = te.exercicio_id
         ORDER BY c.nome, t.data_inicio
     """
-    df = pd.read_sql_query(query, conn, parse_dates=["data_inicio", "data_fim"])
-    conn.close()
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn, parse_dates=["data_inicio", "data_fim"])
     return df
 
+@analitica
+@em_cache(TABELA_COPIA)
 def carregar_pagamentos():
     """
     Agora carrega diretamente do banco SQLite, trazendo cliente_id, data_pagamento, valor_pago, plano_id.
     """
-    conn = get_connection()
     query = """
         SELECT 
             cliente_id,
@@ -273,8 +2263,8 @@ def carregar_pagamentos():
             plano_id
         FROM pagamentos
     """
-    df = pd.read_sql_query(query, conn, parse_dates=["data_pagamento"])  # Converte a coluna data_pagamento para datetime
-    conn.close()
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn, parse_dates=["data_pagamento"])  # Converte a coluna data_pagamento para datetime
     return df
 
 
@@ -307,26 +2297,149 @@ def calcular_resumo_pagamentos(df_pagamentos, df_clientes):
     df_resumo["total_pago"] = df_resumo["total_pago"].fillna(0.0)  # Clientes sem pagamento ficam com total 0
     return df_resumo
 
-df_pagamentos = carregar_pagamentos() # Carrega os pagamentos da base de dados
-df_clientes = carregar_clientes()  # Carrega os clientes da base de dados
-df_resumo = calcular_resumo_pagamentos(df_pagamentos, df_clientes) # Gera o resumo de pagamentos
+# ----------------------------------------PAGINAÇÃO NO SERVIDOR---------------------------------------------------
+TAMANHO_PAGINA = 50
+
+@dataclass
+class Pagina:
+    """
+    Uma página de resultados. `proximo` é a chave de ordenação da última linha
+    (passe-a em `apos=` para buscar a página seguinte); None quando acabou.
+    `total` é a quantidade de linhas que atendem aos filtros, em todas as páginas.
+    """
+    dados: object
+    total: int
+    proximo: tuple = None
+
+
+def _filtros_sql(condicoes):
+    """Monta o WHERE a partir de (trecho_sql, valor), ignorando os filtros None."""
+    usados = [(trecho, valor) for trecho, valor in condicoes if valor is not None]
+    where = " AND ".join(trecho for trecho, _ in usados)
+    return (f"WHERE {where}" if where else ""), [valor for _, valor in usados]
+
+
+@em_cache("treinos", "clientes", "instrutores", "treino_exercicios", "exercicios")
+def listar_treinos_paginado(cliente_id=None, instrutor_id=None, data_inicio=None, data_fim=None,
+                            grupo_muscular=None, apos=None, tamanho=TAMANHO_PAGINA):
+    """
+    Versão paginada de listar_treinos_com_exercicios: os filtros vão para o SQL e
+    a paginação é por chave (cliente, data de início, id da linha), então buscar a
+    página N custa o mesmo que buscar a primeira. Datas filtram data_inicio.
+    """
+    where, parametros = _filtros_sql([
+        ("t.cliente_id = ?",       cliente_id),
+        ("t.instrutor_id = ?",     instrutor_id),
+        ("t.data_inicio >= ?",     None if data_inicio is None else str(data_inicio)),
+        ("t.data_inicio <= ?",     None if data_fim is None else str(data_fim)),
+        ("e.grupo_muscular = ?",   grupo_muscular),
+    ])
+    origem = f"""
+        FROM treinos t
+        JOIN clientes c ON c.id = t.cliente_id
+        JOIN instrutores i ON i.id = t.instrutor_id
+        JOIN treino_exercicios te ON te.treino_id = t.id
+        JOIN exercicios e ON e.id = te.exercicio_id
+        {where}
+    """
+    chave = "c.nome, COALESCE(t.data_inicio, ''), te.id"
+    condicao_pagina = ""
+    parametros_pagina = list(parametros)
+    if apos is not None:
+        condicao_pagina = f"{'AND' if where else 'WHERE'} ({chave}) > (?, ?, ?)"
+        parametros_pagina += list(apos)
+
+    query = f"""
+        SELECT
+            t.id AS Treino_ID,
+            c.nome AS Cliente,
+            i.nome AS Instrutor,
+            date(t.data_inicio) AS data_inicio,
+            date(t.data_fim)   AS data_fim,
+            e.nome AS Exercicio,
+            e.grupo_muscular AS Grupo_Muscular,
+            te.series,
+            te.repeticoes,
+            COALESCE(t.data_inicio, '') AS _chave_data,
+            te.id AS _chave_id
+        {origem}
+        {condicao_pagina}
+        ORDER BY {chave}
+        LIMIT ?
+    """
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn, params=parametros_pagina + [tamanho],
+                               parse_dates=["data_inicio", "data_fim"])
+        total = conn.execute(f"SELECT COUNT(*) {origem}", parametros).fetchone()[0]
+
+    proximo = None
+    if len(df) == tamanho:
+        ultima = df.iloc[-1]
+        proximo = (ultima["Cliente"], ultima["_chave_data"], int(ultima["_chave_id"]))
+    return Pagina(df.drop(columns=["_chave_data", "_chave_id"]), total, proximo)
 
-df_pagamentos = carregar_pagamentos()
 
-# Adiciona coluna de "Ano_Mês"
-df_pagamentos["ano_mes"] = df_pagamentos["data_pagamento"].dt.to_period("M")
+@em_cache("clientes", "pagamentos")
+def resumo_pagamentos_paginado(cliente_id=None, instrutor_id=None, data_inicio=None, data_fim=None,
+                               apos=None, tamanho=TAMANHO_PAGINA):
+    """
+    Versão paginada de calcular_resumo_pagamentos (todos os clientes, com total
+    pago e último pagamento), ordenada por cliente_id. Os totais de cada cliente
+    saem do índice único de pagamentos, que começa por cliente_id; o período
+    (data_inicio/data_fim) restringe os pagamentos somados.
+    """
+    where, parametros = _filtros_sql([
+        ("c.id = ?",           cliente_id),
+        ("c.instrutor_id = ?", instrutor_id),
+    ])
+    periodo, parametros_pag = _filtros_sql([
+        ("p.data_pagamento >= ?",  None if data_inicio is None else str(data_inicio)),
+        ("p.data_pagamento <= ?",  None if data_fim is None else str(data_fim)),
+    ])
+    where_pag = "WHERE p.cliente_id = c.id" + periodo.replace("WHERE", " AND", 1)
 
-# Agrupa por "ano_mes" e soma os pagamentos
-df_pagamentos_por_mes = (
-    df_pagamentos.groupby("ano_mes")["valor_pago"]
-    .sum()
-    .reset_index()
-)
+    condicao_pagina = ""
+    parametros_pagina = list(parametros)
+    if apos is not None:
+        condicao_pagina = f"{'AND' if where else 'WHERE'} c.id > ?"
+        parametros_pagina.append(apos[0])
 
-# Converte a coluna "ano_mes" para string
-df_pagamentos_por_mes["ano_mes"] = df_pagamentos_por_mes["ano_mes"].astype(str)
+    query = f"""
+        SELECT
+            c.id AS cliente_id,
+            c.nome AS cliente_nome,
+            (SELECT COALESCE(SUM(p.valor_pago), 0.0) FROM pagamentos p {where_pag}) AS total_pago,
+            (SELECT date(MAX(p.data_pagamento))      FROM pagamentos p {where_pag}) AS ultimo_pagamento
+        FROM clientes c
+        {where}
+        {condicao_pagina}
+        ORDER BY c.id
+        LIMIT ?
+    """
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn,
+                               params=parametros_pag * 2 + parametros_pagina + [tamanho],
+                               parse_dates=["ultimo_pagamento"])
+        total = conn.execute(f"SELECT COUNT(*) FROM clientes c {where}", parametros).fetchone()[0]
+
+    proximo = (int(df["cliente_id"].iloc[-1]),) if len(df) == tamanho else None
+    return Pagina(df, total, proximo)
+
+def _pagamentos_com_ano_mes():
+    df_pagamentos = carregar_pagamentos()
+
+    # Adiciona coluna de "Ano_Mês"
+    df_pagamentos["ano_mes"] = df_pagamentos["data_pagamento"].dt.to_period("M")
+    return df_pagamentos
+
+def _calcular_pagamentos_por_mes():
+    # Lido do cubo de receita: custa o mesmo com 10 mil ou 10 milhões de pagamentos
+    df_pagamentos_por_mes = receita_cubo(["mes"])
+    return df_pagamentos_por_mes.rename(columns={"mes": "ano_mes", "total": "valor_pago"})[["ano_mes", "valor_pago"]]
 
 def grafico_pagamentos():
+    plt = _plt()
+    df_pagamentos_por_mes = _calcular_pagamentos_por_mes()
     fig, ax = plt.subplots(figsize=(10, 6))
     ax.bar(df_pagamentos_por_mes["ano_mes"], df_pagamentos_por_mes["valor_pago"], color="#9fc131")
     ax.set_xlabel("Mês")
@@ -336,49 +2449,42 @@ def grafico_pagamentos():
     return fig
 
 #----------------------------------------pergunta 4---------------------------------------------------#
+@em_cache("clientes", "instrutores")
 def clientes_instrutor(instrutor):
-    conn = get_connection()  # Abre conexão com o banco
-    df_filtro_instrutor = pd.read_sql_query('''
-        SELECT i.nome AS instrutor, COUNT(*) As Contagem
-            FROM clientes c
-            JOIN instrutores i ON c.instrutor_id = i.id
-            WHERE i.nome = ?    
-            GROUP BY i.nome
-    ''', conn, params=(instrutor,))
+    with _leitura() as conn:  # Conexão do pool, sempre devolvida ao sair do bloco
+        df_filtro_instrutor = pd.read_sql_query('''
+            SELECT i.nome AS instrutor, COUNT(*) As Contagem
+                FROM clientes c
+                JOIN instrutores i ON c.instrutor_id = i.id
+                WHERE i.nome = ?    
+                GROUP BY i.nome
+        ''', conn, params=(instrutor,))
     return df_filtro_instrutor  # Retorna os dados como um DataFrame
 
+@em_cache("clientes", "instrutores")
+@federada(_somar_partes("quantidade"))
 def clientes_por_instrutor_com_vazios():
-    conn = sqlite3.connect("academia_db.db", check_same_thread=False)   # Abre conexão com o banco
     query = '''
         SELECT i.nome AS instrutor, COUNT(*) AS quantidade
         FROM clientes c
         LEFT JOIN instrutores i ON c.instrutor_id = i.id
         GROUP BY i.nome
     '''
-    df = pd.read_sql_query(query, conn)
+    with _leitura() as conn:  # Conexão do pool, sempre devolvida ao sair do bloco
+        df = pd.read_sql_query(query, conn)
 
     df["instrutor"] = df["instrutor"].fillna("Sem instrutor")
     return df
 
-df_instrutores = clientes_por_instrutor_com_vazios()
-
+@em_cache("instrutores")
 def carregar_instrutores():
-    conn = get_connection()
     query = "SELECT id, nome FROM instrutores"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn)
     return df
     
 def grafico_instrutores():
-    conn = get_connection()
-    query = '''
-        SELECT i.nome AS instrutor, COUNT(*) AS quantidade
-        FROM clientes c
-        LEFT JOIN instrutores i ON c.instrutor_id = i.id
-        GROUP BY i.nome
-    '''
-    df_instrutores = pd.read_sql_query(query, conn)
-    conn.close()
+    df_instrutores = clientes_por_instrutor_com_vazios()
 
     if df_instrutores.empty:
         return "Sem dados para exibir."
@@ -388,6 +2494,7 @@ def grafico_instrutores():
 
    
 
+    plt = _plt()
     fig, ax = plt.subplots(figsize=(6, 6), facecolor="black")
     wedges, texts, autotexts = ax.pie(
         df_instrutores['quantidade'],
@@ -420,205 +2527,329 @@ def grafico_instrutores():
 
 #----------------------------------------pergunta 5---------------------------------------------------#
 #Criação de uma função de registro de cliente
+@_repetir_se_ocupado
 def novo_cliente(nome, idade, sexo, email, telefone, plano_nome, instrutor_nome):
-    conn = get_connection()
-    cursor = conn.cursor()
+    # IDs de plano e instrutor vêm do catálogo em memória
+    plano = catalogo().buscar("planos", plano_nome)
+    instrutor = catalogo().buscar("instrutores", instrutor_nome)
+    if plano is None or instrutor is None:
+        faltando = f"Plano '{plano_nome}'" if plano is None else f"Instrutor '{instrutor_nome}'"
+        return {"status": "erro", "mensagem": f"Erro: {faltando} não encontrado."}
+    plano_id, instrutor_id = plano["id"], instrutor["id"]
 
-    # Verificar se já existe cliente com o mesmo nome ou e-mail
-    query = """
-        SELECT id, nome, email
-        FROM clientes
-        WHERE nome = ? OR email = ?
-    """
-    cursor.execute(query, (nome, email))
-    resultado = cursor.fetchone()
-
-    if resultado:
-        cliente_existente_nome = resultado[1]
-        cliente_existente_email = resultado[2]
-        mensagem = "Erro: já existe um cliente com "
-
-        if nome == cliente_existente_nome and email == cliente_existente_email:
-            mensagem += f"o mesmo nome ('{nome}') e e-mail ('{email}')."
-        elif nome == cliente_existente_nome:
-            mensagem += f"o mesmo nome ('{nome}')."
-        elif email == cliente_existente_email:
-            mensagem += f"o mesmo e-mail ('{email}')."
-        
-        conn.close()
+    def operacao(conn):
+        # Uma instrução só: o e-mail é barrado pela UNIQUE da coluna e o nome pelo
+        # NOT EXISTS (via idx_clientes_nome). O nome não pode ser UNIQUE: a carga
+        # por CSV deduplica pelo e-mail e aceita homônimos, que já existem nos
+        # bancos. Como roda dentro da transação de escrita, dois cadastros iguais
+        # enviados ao mesmo tempo nunca entram os dois.
+        try:
+            inserido = conn.execute("""
+                INSERT INTO clientes (nome, idade, sexo, email, telefone, plano_id, instrutor_id)
+                SELECT ?, ?, ?, ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM clientes WHERE nome = ?)
+                RETURNING id
+            """, (nome, idade, sexo, email, telefone, plano_id, instrutor_id, nome)).fetchall()
+        except sqlite3.IntegrityError as e:
+            if _restricao_violada(e) != ("clientes", ("email",)):
+                raise
+            inserido = None
+
+        if inserido:
+            return {
+                "status": "sucesso",
+                "mensagem": f"Cliente '{nome}' inserido com sucesso!"
+            }
+
+        # Conflito: RETURNING vazio = nome repetido; IntegrityError = e-mail repetido.
+        # Só no caminho de erro, uma busca pelo e-mail (UNIQUE) diz se repete os dois.
+        repetido = f"o mesmo e-mail ('{email}')." if inserido is None else f"o mesmo nome ('{nome}')."
+        if conn.execute("SELECT 1 FROM clientes WHERE email = ? AND nome = ?", (email, nome)).fetchone():
+            repetido = f"o mesmo nome ('{nome}') e e-mail ('{email}')."
         return {
             "status": "erro",
-            "mensagem": mensagem
+            "mensagem": "Erro: já existe um cliente com " + repetido
         }
-    else:
-        planos = pd.read_sql_query("SELECT id, nome, duracao_meses FROM planos", conn)
-        instrutores = pd.read_sql_query("SELECT id, nome FROM instrutores", conn)
 
-        plano_id = int(planos[planos['nome'] == plano_nome]['id'].values[0])
-        instrutor_id = int(instrutores[instrutores['nome'] == instrutor_nome]['id'].values[0])
+    try:
+        return _escrever(operacao, "clientes")
+    except EscritaNaoConcluida as e:
+        return {"status": "erro", "mensagem": str(e)}
+
+
+def _cliente_do_formulario(cliente_nome, cliente_id=None):
+    """Registro do cliente pelo id, se informado, ou pelo nome (o de menor id entre homônimos)."""
+    if cliente_id is not None:
+        return catalogo().por_id("clientes", int(cliente_id))
+    return catalogo().buscar("clientes", cliente_nome) if cliente_nome else None
+
+@_repetir_se_ocupado
+def novo_pagamento(cliente_nome, plano_nome, data, cliente_id=None):
+    # Obter IDs (catálogo em memória, sem ler as tabelas). Com cliente_id o cliente
+    # vem pelo id, que distingue homônimos; o nome fica só para as mensagens.
+    cliente = _cliente_do_formulario(cliente_nome, cliente_id)
+    plano = catalogo().buscar("planos", plano_nome)
+    if cliente is None:
+        return {"status": "erro", "mensagem": f"Cliente '{cliente_nome or cliente_id}' não encontrado."}
+    cliente_nome = cliente["nome"]
+    if plano is None:
+        return {"status": "erro", "mensagem": f"Plano '{plano_nome}' não encontrado."}
+
+    cliente_id = cliente["id"]
+    plano_id = plano["id"]
+    valor_plano = float(plano["preco_mensal"])
+    data_pagamento = str(data)
+
+    def operacao(conn):
+        # Insere só se o cliente não tem pagamento nessa data, numa instrução só: o
+        # NOT EXISTS percorre o prefixo (cliente_id, data_pagamento) da UNIQUE
+        inserido = conn.execute("""
+            INSERT INTO pagamentos (cliente_id, plano_id, valor_pago, data_pagamento)
+            SELECT ?, ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM pagamentos WHERE cliente_id = ? AND data_pagamento = ?)
+            RETURNING id
+        """, (cliente_id, plano_id, valor_plano, data_pagamento, cliente_id, data_pagamento)).fetchall()
+
+        if not inserido:
+            return {
+                "status": "erro",
+                "mensagem": f"Já existe um pagamento registrado para o cliente '{cliente_nome}' na data {data_pagamento}."
+            }
 
-        cursor.execute(
-            "INSERT INTO clientes (nome, idade, sexo, email, telefone, plano_id, instrutor_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (nome, idade, sexo, email, telefone, plano_id, instrutor_id)
-        )
-        conn.commit()
-        conn.close()
         return {
             "status": "sucesso",
-            "mensagem": f"Cliente '{nome}' inserido com sucesso!"
+            "mensagem": f"Pagamento do cliente {cliente_nome} inserido com sucesso! Valor: {valor_plano} | Data: {data_pagamento}"
         }
 
+    try:
+        return _escrever(operacao, "pagamentos")
+    except EscritaNaoConcluida as e:
+        return {"status": "erro", "mensagem": str(e)}
 
-def novo_pagamento(cliente_nome, plano_nome, data):
-    conn = get_connection()
-    cursor = conn.cursor()
+TAMANHO_LOTE_VERIFICACAO = 400  # pares (cliente_id, data) por consulta de duplicados
 
-    # Obter IDs
-    clientes = pd.read_sql_query("SELECT id, nome FROM clientes", conn)
-    planos = pd.read_sql_query("SELECT id, nome, preco_mensal FROM planos", conn)
+@_repetir_se_ocupado
+def registrar_pagamentos_lote(entradas):
+    """
+    Registra vários pagamentos de uma vez. `entradas` é uma lista de
+    (cliente_nome, plano_nome, data) — tuplas ou dicts com as chaves cliente,
+    plano e data. Um dict com "cliente_id" identifica o cliente pelo id (o que
+    distingue homônimos); o nome, então, é só para exibir.
 
-    cliente_id = int(clientes[clientes['nome'] == cliente_nome]['id'].values[0])
-    plano_id = int(planos[planos['nome'] == plano_nome]['id'].values[0])
-    valor_plano = float(planos[planos['nome'] == plano_nome]['preco_mensal'].values[0])
-    data_pagamento = str(data)
+    Os nomes são resolvidos pelo catálogo, os duplicados (mesmo cliente na mesma
+    data, no banco ou repetidos no próprio lote) são verificados com uma consulta
+    por conjunto e tudo é inserido com um único executemany numa só transação.
+    Retorna o resumo e o status de cada linha, na ordem das entradas.
+    """
+    linhas = []
+    validos = {}  # (cliente_id, data) -> índice da primeira linha válida
 
-    # Verificar se já existe um pagamento para esse cliente na mesma data
-    cursor.execute("""
-        SELECT id FROM pagamentos
-        WHERE cliente_id = ? AND data_pagamento = ?
-    """, (cliente_id, data_pagamento))
-    pagamento_existente = cursor.fetchone()
+    for i, entrada in enumerate(entradas):
+        cliente_id = None
+        if isinstance(entrada, dict):
+            cliente_nome, plano_nome, data = (entrada.get("cliente"), entrada.get("plano"), entrada.get("data"))
+            cliente_id = entrada.get("cliente_id")
+        else:
+            cliente_nome, plano_nome, data = entrada
+
+        cliente = _cliente_do_formulario(cliente_nome, cliente_id)
+        plano = catalogo().buscar("planos", plano_nome) if plano_nome else None
+        if cliente_nome is None and cliente is not None:
+            cliente_nome = cliente["nome"]
+        linha = {"linha": i, "cliente_id": None if cliente is None else cliente["id"], "cliente": cliente_nome,
+                 "plano": plano_nome, "data": None if data is None else str(data), "status": "erro"}
+        linhas.append(linha)
+
+        if cliente is None and cliente_nome is None and cliente_id is None:
+            linha["mensagem"] = "Cliente não informado."
+        elif cliente is None:
+            linha["mensagem"] = f"Cliente '{cliente_nome or cliente_id}' não encontrado."
+        elif plano is None:
+            linha["mensagem"] = f"Plano '{plano_nome}' não encontrado."
+        elif data is None or str(data).strip() == "":
+            linha["mensagem"] = "Data do pagamento não informada."
+        elif (cliente["id"], linha["data"]) in validos:
+            linha["mensagem"] = f"Pagamento repetido no lote (linha {validos[(cliente['id'], linha['data'])]})."
+        else:
+            validos[(cliente["id"], linha["data"])] = i
+            linha["registro"] = (cliente["id"], plano["id"], float(plano["preco_mensal"]), linha["data"])
+
+    def operacao(conn):
+        # Pagamentos que já existem no banco, numa consulta por bloco de pares
+        pares = list(validos)
+        existentes = set()
+        for inicio in range(0, len(pares), TAMANHO_LOTE_VERIFICACAO):
+            bloco = pares[inicio:inicio + TAMANHO_LOTE_VERIFICACAO]
+            marcadores = ", ".join(["(?, ?)"] * len(bloco))
+            existentes.update(conn.execute(
+                f"""
+                SELECT cliente_id, data_pagamento FROM pagamentos
+                WHERE (cliente_id, data_pagamento) IN (VALUES {marcadores})
+                """,
+                [valor for par in bloco for valor in par],
+            ).fetchall())
 
-    if pagamento_existente:
-        conn.close()
-        return {
-            "status": "erro",
-            "mensagem": f"Já existe um pagamento registrado para o cliente '{cliente_nome}' na data {data_pagamento}."
-        }
+        conn.executemany(
+            "INSERT INTO pagamentos (cliente_id, plano_id, valor_pago, data_pagamento) VALUES (?, ?, ?, ?)",
+            [linhas[i]["registro"] for par, i in validos.items() if par not in existentes],
+        )
+        return existentes
 
-    # Inserir novo pagamento
-    cursor.execute(
-        "INSERT INTO pagamentos (cliente_id, plano_id, valor_pago, data_pagamento) VALUES (?, ?, ?, ?)",
-        (cliente_id, plano_id, valor_plano, data_pagamento)
-    )
-    conn.commit()
-    conn.close()
+    # A operação não mexe nas linhas: se o grupo for refeito, ela roda de novo igual
+    try:
+        existentes = _escrever(operacao, "pagamentos")
+    except EscritaNaoConcluida as e:
+        for linha in linhas:
+            if linha.pop("registro", None) is not None:
+                linha["mensagem"] = str(e)
+        return {"status": "erro", "mensagem": str(e), "inseridos": 0, "linhas": linhas}
+    inseridos = 0
+    for par, i in validos.items():
+        linha = linhas[i]
+        registro = linha.pop("registro")
+        if par in existentes:
+            linha["mensagem"] = (f"Já existe um pagamento registrado para o cliente "
+                                 f"'{linha['cliente']}' na data {linha['data']}.")
+        else:
+            inseridos += 1
+            linha["status"] = "sucesso"
+            linha["mensagem"] = f"Pagamento inserido. Valor: {registro[2]} | Data: {registro[3]}"
 
     return {
-        "status": "sucesso",
-        "mensagem": f"Pagamento do cliente {cliente_nome} inserido com sucesso! Valor: {valor_plano} | Data: {data_pagamento}"
+        "status": "sucesso" if inseridos == len(linhas) else "erro",
+        "mensagem": f"{inseridos} de {len(linhas)} pagamentos inseridos.",
+        "inseridos": inseridos,
+        "linhas": linhas,
     }
 
-def novo_treino(cliente_nome, data):
+@_repetir_se_ocupado
+def novo_treino(cliente_nome, data, cliente_id=None):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        # Obter dados dos clientes e planos
-        clientes = pd.read_sql_query("SELECT id, nome, instrutor_id, plano_id FROM clientes", conn)
-        planos = pd.read_sql_query("SELECT id, nome, duracao_meses FROM planos", conn)
-
-        # Verifica se cliente existe
-        cliente_row = clientes[clientes['nome'] == cliente_nome]
-        if cliente_row.empty:
-            return f"Erro: Cliente '{cliente_nome}' não encontrado."
+        # Verifica se cliente existe (catálogo em memória; pelo id, se informado)
+        cliente = _cliente_do_formulario(cliente_nome, cliente_id)
+        if cliente is None:
+            return {"status": "error",
+            "message": f"Erro: Cliente '{cliente_nome or cliente_id}' não encontrado."}
+        cliente_nome = cliente['nome']
 
-        cliente_id = int(cliente_row['id'].values[0])
-        instrutor_id = int(cliente_row['instrutor_id'].values[0])
-        plano_id = int(cliente_row['plano_id'].values[0])
+        cliente_id = cliente['id']
+        instrutor_id = cliente['instrutor_id']
+        plano_id = cliente['plano_id']
 
         # Verifica se plano é válido
-        plano_row = planos[planos['id'] == plano_id]
-        if plano_row.empty:
-            return f"Erro: Plano associado ao cliente não encontrado."
+        plano = catalogo().por_id("planos", plano_id)
+        if plano is None:
+            return {"status": "error",
+            "message": "Erro: Plano associado ao cliente não encontrado."}
 
-        duracao = int(plano_row['duracao_meses'].values[0])
+        duracao = int(plano['duracao_meses'])
 
         data_inicial = data
         data_final = data + relativedelta(months=duracao)
 
-        # Verifica se já existe treino com mesmo cliente e mesmas datas
-        cursor.execute(
-            """
-            SELECT COUNT(*) FROM treinos 
-            WHERE cliente_id = ? AND data_inicio = ? AND data_fim = ?
-            """,
-            (cliente_id, data_inicial, data_final)
-        )
-        treino_existente = cursor.fetchone()[0] > 0
+        def operacao(conn):
+            # Inserção segura: só entra se o cliente não tem treino com as mesmas datas
+            # (NOT EXISTS pelo prefixo cliente_id da UNIQUE), numa instrução só. A
+            # UNIQUE inclui instrutor e plano, e a carga por CSV aceita treinos nas
+            # mesmas datas com outro instrutor: (cliente, datas) não pode ser UNIQUE.
+            inserido = conn.execute(
+                """
+                INSERT INTO treinos (cliente_id, instrutor_id, data_inicio, data_fim, plano_id)
+                SELECT ?, ?, ?, ?, ?
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM treinos
+                    WHERE cliente_id = ? AND data_inicio = ? AND data_fim = ?
+                )
+                RETURNING id
+                """,
+                (cliente_id, instrutor_id, data_inicial, data_final, plano_id, cliente_id, data_inicial, data_final)
+            ).fetchall()
 
-        if treino_existente:
-            return {"status": "error",
-            "message": "Erro: Um treino com a mesma data já existe para esse cliente."}
+            if not inserido:
+                return {"status": "error",
+                "message": "Erro: Um treino com a mesma data já existe para esse cliente."}
 
-        # Inserção segura
-        cursor.execute(
-            "INSERT INTO treinos (cliente_id, instrutor_id, data_inicio, data_fim, plano_id) VALUES (?, ?, ?, ?, ?)",
-            (cliente_id, instrutor_id, data_inicial, data_final, plano_id)
-        )
-        conn.commit()
+            return {
+                "status": "success",
+                "message": f"Treino do cliente {cliente_nome} inserido com sucesso! Data inicial: {data_inicial} | Data final: {data_final}"
+            }
 
-        return {
-            "status": "success",
-            "message": f"Treino do cliente {cliente_nome} inserido com sucesso! Data inicial: {data_inicial} | Data final: {data_final}"
-        }
+        return _escrever(operacao, "treinos")
 
-    except Exception as e:
+    except sqlite3.OperationalError as e:
+        if _banco_ocupado(e):
+            raise  # Deixa o _repetir_se_ocupado tentar de novo
         return {"status": "error",
             "message": f"Erro durante inserção do treino: {str(e)}"}
 
-    finally:
-        if 'conn' in locals():
-            conn.close()
+    except Exception as e:
+        return {"status": "error",
+            "message": f"Erro durante inserção do treino: {str(e)}"}
 
+@_repetir_se_ocupado
 def novo_exercicio(nome_exercicio, grupo_muscular):
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "INSERT INTO exercicios (nome, grupo_muscular) VALUES (?, ?)",
-            (nome_exercicio, grupo_muscular)
-        )
-        conn.commit()  # Salva a transação no banco
-        message = f"Exercício '{nome_exercicio}' inserido com sucesso!"
-    except sqlite3.IntegrityError:  # Caso o exercício já exista ou erro de integridade
+        def operacao(conn):
+            # A UNIQUE (nome, grupo_muscular) decide: conflito = RETURNING vazio
+            return conn.execute(
+                "INSERT INTO exercicios (nome, grupo_muscular) VALUES (?, ?) ON CONFLICT DO NOTHING RETURNING id",
+                (nome_exercicio, grupo_muscular)
+            ).fetchall()
+        if _escrever(operacao, "exercicios"):  # Volta depois do commit do grupo
+            message = f"Exercício '{nome_exercicio}' inserido com sucesso!"
+        else:
+            message = f"Exercício '{nome_exercicio}' já existe no grupo {grupo_muscular}."
+    except sqlite3.IntegrityError:  # Outro erro de integridade (ex.: campo obrigatório vazio)
         message = "Exercício já existe ou ocorreu um erro ao inserir."
-    conn.close()
+    except EscritaNaoConcluida as e:
+        message = f"Erro ao inserir o exercício: {e}"
     return message
 
 
 # Função para inserir um novo exercício em um treino específico
+@_repetir_se_ocupado
 def novo_treino_exercicio(treino_data, tipo_treino, exercicio_nome, series, repeticoes):
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Carrega todos os treinos e exercícios para localizar os IDs com base nas informações fornecidas
-    treinos = pd.read_sql_query ("SELECT id, data_inicio FROM treinos", conn)
-    exercicios = pd.read_sql_query ("SELECT id, nome FROM exercicios", conn)
+    exercicio = catalogo().buscar("exercicios", exercicio_nome)
+    if exercicio is None:
+        return f"Exercício '{exercicio_nome}' não encontrado."
+    exercicio_id = exercicio["id"]
 
-    # Encontra o ID do treino a partir da data
-    treino_id = int(treinos[treinos['data_inicio'] == treino_data]['id'].values[0])
-    exercicio_id = int(exercicios[exercicios['nome'] == exercicio_nome]['id'].values[0])
+    def operacao(conn):
+        # Encontra o ID do treino a partir da data (índice de data_inicio) e insere
+        # na mesma instrução; RETURNING vazio = nenhum treino nessa data
+        try:
+            inserido = conn.execute(
+                """
+                INSERT INTO treino_exercicios (treino_id, treino, exercicio_id, exercicio, series, repeticoes)
+                SELECT id, ?, ?, ?, ?, ? FROM treinos WHERE data_inicio = ? ORDER BY id LIMIT 1
+                RETURNING treino_id
+                """,
+                (tipo_treino, exercicio_id, exercicio_nome, series, repeticoes, str(treino_data))
+            ).fetchall()
+        except sqlite3.IntegrityError as e:
+            if _restricao_violada(e) != ("treino_exercicios", ("treino_id", "exercicio_id", "series", "repeticoes")):
+                raise
+            return f"Exercício '{exercicio_nome}' já está no treino de {treino_data} com essas séries e repetições."
+        if not inserido:
+            return f"Treino com data {treino_data} não encontrado."
+        return f"Treino Exercícios inserido com sucesso!"
 
-    # Insere o novo registro na tabela treino_exercicios
-    cursor.execute(
-        "INSERT INTO treino_exercicios (treino_id,treino,exercicio_id,exercicio,series,repeticoes) VALUES (?, ?, ?, ?, ?, ?)",
-        (treino_id, tipo_treino, exercicio_id, exercicio_nome, series, repeticoes)
-    )
-    conn.commit()
-    conn.close()
-
-    return f"Treino Exercícios inserido com sucesso!"
+    try:
+        return _escrever(operacao, "treino_exercicios")
+    except EscritaNaoConcluida as e:
+        return f"Erro ao inserir o exercício no treino: {e}"
 
+@em_cache("clientes")
 def get_clientes():
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT id, nome FROM clientes ORDER BY nome", conn)
-    conn.close()
+    with _leitura() as conn:
+        df = pd.read_sql_query("SELECT id, nome FROM clientes ORDER BY nome", conn)
     return df
 
 # Gera gráfico de pizza com a distribuição de tipos de treino entre os clientes
-def grafico_treinos_por_cliente():
-    conn = get_connection()
+# Quantidade de exercícios prescritos por grupo muscular
+@em_cache("treino_exercicios", "exercicios")
+@federada(_somar_partes("quantidade"))
+def exercicios_por_grupo_muscular():
     query = """
         SELECT 
             e.grupo_muscular AS Grupo_Muscular,
@@ -627,8 +2858,12 @@ def grafico_treinos_por_cliente():
         JOIN exercicios e ON te.exercicio_id = e.id
         GROUP BY e.grupo_muscular
     """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn)
+    return df
+
+def grafico_treinos_por_cliente():
+    df = exercicios_por_grupo_muscular()
 
     if df.empty:
         return "Sem dados para exibir."
@@ -641,6 +2876,7 @@ def grafico_treinos_por_cliente():
     colors = ['#4B368A','#042940', '#005C53', '#9FC131', '#D6D58E', '#70B328']
 
     # Criação do gráfico de pizza (pie) com fundo preto
+    plt = _plt()
     fig, ax = plt.subplots(figsize=(6, 6), facecolor="black")
     wedges, texts, autotexts = ax.pie(
         sizes,
@@ -670,17 +2906,23 @@ def grafico_treinos_por_cliente():
     return fig
 
 
-# Gera gráfico de pizza com a quantidade de clientes por plano
-def grafico_clientes_por_plano():
-    conn = get_connection()
+# Quantidade de clientes por plano
+@em_cache("clientes", "planos")
+@federada(_somar_partes("total"))
+def clientes_por_plano():
     query = '''
         SELECT p.nome AS plano, COUNT(*) AS total
         FROM clientes c
         JOIN planos p ON c.plano_id = p.id
         GROUP BY p.nome
     '''
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn)
+    return df
+
+# Gera gráfico de pizza com a quantidade de clientes por plano
+def grafico_clientes_por_plano():
+    df = clientes_por_plano()
 
     if df.empty:
         return "Sem dados para exibir."
@@ -689,6 +2931,7 @@ def grafico_clientes_por_plano():
     colors = ['#042940', '#005C53', '#9FC131', '#D6D58E']
     explode = [0.02] * len(df)
 
+    plt = _plt()
     fig, ax = plt.subplots(figsize=(6, 6), facecolor="black")
     wedges, texts, autotexts = ax.pie(
         df['total'],
@@ -718,153 +2961,431 @@ def grafico_clientes_por_plano():
 
     return fig
 
-# Retorna os treinos de um cliente específico com nome informado
-def get_treinos_por_cliente(nome_cliente):
+# Retorna os treinos de um cliente específico com nome (ou id) informado
+@em_cache("treinos", "clientes")
+def get_treinos_por_cliente(nome_cliente, cliente_id=None):
     """
     Retorna um DataFrame com as colunas [id, data_inicio] 
-    de todos os treinos existentes para o cliente cujo nome é nome_cliente.
+    de todos os treinos existentes para o cliente cujo nome é nome_cliente, ou
+    só os do cliente_id, se informado (homônimos têm treinos separados).
     """
-    conn = get_connection()
-    query = """
+    if cliente_id is not None:
+        filtro, parametro = "t.cliente_id = ?", int(cliente_id)
+    else:
+        filtro, parametro = "t.cliente_id IN (SELECT id FROM clientes WHERE nome = ?)", nome_cliente
+    query = f"""
         SELECT
             t.id,
             date(t.data_inicio) AS data_inicio
         FROM treinos t
-        JOIN clientes c ON c.id = t.cliente_id
-        WHERE c.nome = ?
+        WHERE {filtro}
         ORDER BY t.data_inicio DESC
     """
     # parse_dates para garantir que data_inicio seja uma datetime
-    df = pd.read_sql_query(query, conn, params=(nome_cliente,), parse_dates=["data_inicio"])
-    conn.close()
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn, params=(parametro,), parse_dates=["data_inicio"])
     return df
 
+@em_cache("exercicios")
 def get_exercicios():
     """
     Retorna um DataFrame com as colunas [id, nome] de todos os exercícios cadastrados,
     ordenados por nome.
     """
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT id, nome FROM exercicios ORDER BY nome", conn)
-    conn.close()
+    with _leitura() as conn:
+        df = pd.read_sql_query("SELECT id, nome FROM exercicios ORDER BY nome", conn)
     return df
 
+@_repetir_se_ocupado
 def adicionar_exercicio_treino(treino_id, nome_exercicio, series, repeticoes):
     """
     Insere um registro em treino_exercicios relacionando um exercício já cadastrado
     a um treino existente. 
     Retorna um dict com status e mensagem.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # 1) Busca o ID do exercício pelo nome
-    cursor.execute("SELECT id FROM exercicios WHERE nome = ?", (nome_exercicio,))
-    result = cursor.fetchone()
-    if not result:
-        conn.close()
+    # 1) Busca o ID do exercício pelo nome (catálogo em memória)
+    exercicio = catalogo().buscar("exercicios", nome_exercicio)
+    if exercicio is None:
         return {"status": "erro", "mensagem": f"Exercício '{nome_exercicio}' não encontrado."}
-    exercicio_id = result[0]
+    exercicio_id = exercicio["id"]
 
-    # 2) Tenta inserir em treino_exercicios
     try:
-        cursor.execute(
-            """
-            INSERT INTO treino_exercicios 
-                (treino_id, treino, exercicio_id, exercicio, series, repeticoes)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (
-                treino_id,
-                "",  # campo 'treino' (texto) ficará vazio; você pode alterar conforme quiser
-                exercicio_id,
-                nome_exercicio,
-                series,
-                repeticoes
+        def operacao(conn):
+            cursor = conn.cursor()
+
+            # 2) Tenta inserir em treino_exercicios
+            cursor.execute(
+                """
+                INSERT INTO treino_exercicios 
+                    (treino_id, treino, exercicio_id, exercicio, series, repeticoes)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    treino_id,
+                    "",  # campo 'treino' (texto) ficará vazio; você pode alterar conforme quiser
+                    exercicio_id,
+                    nome_exercicio,
+                    series,
+                    repeticoes
+                )
             )
-        )
-        conn.commit()
+        _escrever(operacao, "treino_exercicios")
         return {"status": "sucesso", "mensagem": "Exercício atribuído ao treino com sucesso!"}
-    except sqlite3.IntegrityError:
+    except EscritaNaoConcluida as e:
+        return {"status": "erro", "mensagem": str(e)}
+    except sqlite3.IntegrityError as e:
+        if _restricao_violada(e) is None:
+            return {"status": "erro", "mensagem": f"Erro de integridade ao atribuir o exercício: {e}"}
         return {"status": "erro", "mensagem": "Este exercício já está atribuído a este treino."}
-    finally:
-        conn.close()
+
+# ----------------------------------------MODELOS DE TREINO---------------------------------------------------
+@em_cache("modelos_treino", "modelo_exercicios", "exercicios")
+def listar_modelos_treino():
+    """
+    Retorna um DataFrame com as colunas [modelo, ordem, exercicio, grupo_muscular,
+    series, repeticoes] de todos os modelos de treino, na ordem de cada modelo.
+    Modelos sem exercícios aparecem numa linha com os campos do exercício vazios.
+    """
+    query = """
+        SELECT m.nome AS modelo, me.ordem, e.nome AS exercicio, e.grupo_muscular,
+               me.series, me.repeticoes
+        FROM modelos_treino m
+        LEFT JOIN modelo_exercicios me ON me.modelo_id = m.id
+        LEFT JOIN exercicios e ON e.id = me.exercicio_id
+        ORDER BY m.nome, me.ordem
+    """
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn)
+    return df
+
+@_repetir_se_ocupado
+def salvar_modelo_treino(nome, itens):
+    """
+    Cria o modelo `nome` ou substitui os exercícios dele. `itens` é uma lista de
+    (exercicio_nome, series, repeticoes) — tuplas ou dicts com essas chaves —,
+    na ordem em que devem entrar no treino. Retorna um dict com status e mensagem.
+    """
+    nome = str(nome or "").strip()
+    if not nome:
+        return {"status": "erro", "mensagem": "Informe o nome do modelo."}
+
+    registros, problemas = [], []
+    for ordem, item in enumerate(itens, start=1):
+        if isinstance(item, dict):
+            exercicio_nome, series, repeticoes = item.get("exercicio"), item.get("series"), item.get("repeticoes")
+        else:
+            exercicio_nome, series, repeticoes = item
+        exercicio = catalogo().buscar("exercicios", exercicio_nome) if exercicio_nome else None
+        if exercicio is None:
+            problemas.append(f"linha {ordem}: exercício '{exercicio_nome}' não encontrado")
+            continue
+        try:
+            series, repeticoes = int(series), int(repeticoes)
+        except (TypeError, ValueError):
+            series = repeticoes = 0
+        if series < 1 or repeticoes < 1:
+            problemas.append(f"linha {ordem}: séries e repetições devem ser inteiros positivos")
+            continue
+        registros.append((ordem, exercicio["id"], series, repeticoes))
+    if problemas:
+        return {"status": "erro", "mensagem": "Modelo não salvo — " + "; ".join(problemas) + "."}
+    if not registros:
+        return {"status": "erro", "mensagem": "O modelo precisa de pelo menos um exercício."}
+
+    def operacao(conn):
+        # Cria o modelo ou reaproveita o id do que já tem esse nome
+        modelo_id = conn.execute("""
+            INSERT INTO modelos_treino (nome) VALUES (?)
+            ON CONFLICT (nome) DO UPDATE SET nome = excluded.nome
+            RETURNING id
+        """, (nome,)).fetchall()[0][0]
+        conn.execute("DELETE FROM modelo_exercicios WHERE modelo_id = ?", (modelo_id,))
+        conn.executemany(
+            "INSERT INTO modelo_exercicios (modelo_id, ordem, exercicio_id, series, repeticoes) VALUES (?, ?, ?, ?, ?)",
+            [(modelo_id,) + registro for registro in registros],
+        )
+
+    try:
+        _escrever(operacao, "modelos_treino", "modelo_exercicios")
+    except EscritaNaoConcluida as e:
+        return {"status": "erro", "mensagem": str(e)}
+    return {"status": "sucesso", "mensagem": f"Modelo '{nome}' salvo com {len(registros)} exercícios."}
+
+@_repetir_se_ocupado
+def excluir_modelo_treino(nome):
+    """Apaga o modelo e a lista de exercícios dele (os treinos já montados não mudam)."""
+    def operacao(conn):
+        conn.execute("DELETE FROM modelo_exercicios WHERE modelo_id IN (SELECT id FROM modelos_treino WHERE nome = ?)", (nome,))
+        return conn.execute("DELETE FROM modelos_treino WHERE nome = ?", (nome,)).rowcount
+
+    try:
+        if not _escrever(operacao, "modelos_treino", "modelo_exercicios"):
+            return {"status": "erro", "mensagem": f"Modelo '{nome}' não encontrado."}
+    except EscritaNaoConcluida as e:
+        return {"status": "erro", "mensagem": str(e)}
+    return {"status": "sucesso", "mensagem": f"Modelo '{nome}' excluído."}
+
+@em_cache("treinos", "clientes")
+def treinos_vigentes(data, instrutor_id=None):
+    """
+    Retorna um DataFrame com as colunas [id, cliente, data_inicio, data_fim] dos
+    treinos em andamento na data (início <= data <= fim), opcionalmente só os de
+    um instrutor, ordenados pelo nome do cliente — os alvos de aplicar_modelo_treino.
+    """
+    where, parametros = _filtros_sql([
+        ("t.data_inicio <= ?", str(data)),
+        ("t.data_fim >= ?",    str(data)),
+        ("t.instrutor_id = ?", instrutor_id),
+    ])
+    query = f"""
+        SELECT t.id, c.nome AS cliente, date(t.data_inicio) AS data_inicio, date(t.data_fim) AS data_fim
+        FROM treinos t
+        JOIN clientes c ON c.id = t.cliente_id
+        {where}
+        ORDER BY c.nome, t.data_inicio
+    """
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn, params=parametros)
+    return df
+
+@_repetir_se_ocupado
+def aplicar_modelo_treino(nome_modelo, treino_ids, tipo_treino=""):
+    """
+    Adiciona todos os exercícios do modelo a cada um dos treinos, numa única
+    transação: os treinos e os exercícios que eles já têm são lidos por conjunto
+    (uma consulta por bloco de ids), o que já existe pela chave UNIQUE de
+    treino_exercicios (treino, exercício, séries, repetições) é pulado e o resto
+    entra num único executemany. Retorna o resumo e o status de cada
+    (treino, exercício): "sucesso" (adicionado), "ignorado" (já estava) ou "erro"
+    (treino não encontrado).
+    """
+    ids = list(dict.fromkeys(int(treino_id) for treino_id in treino_ids))
+    if not ids:
+        return {"status": "erro", "mensagem": "Selecione pelo menos um treino.", "adicionados": 0, "ignorados": 0, "linhas": []}
+
+    def operacao(conn):
+        # Tudo é recalculado aqui dentro: se a transação for refeita, o resultado é o mesmo
+        modelo = conn.execute("SELECT id FROM modelos_treino WHERE nome = ?", (nome_modelo,)).fetchone()
+        if modelo is None:
+            return None
+        itens = conn.execute("""
+            SELECT me.exercicio_id, e.nome, me.series, me.repeticoes
+            FROM modelo_exercicios me
+            JOIN exercicios e ON e.id = me.exercicio_id
+            WHERE me.modelo_id = ?
+            ORDER BY me.ordem
+        """, (modelo[0],)).fetchall()
+
+        encontrados, existentes = set(), set()
+        for inicio in range(0, len(ids), TAMANHO_LOTE_VERIFICACAO):
+            bloco = ids[inicio:inicio + TAMANHO_LOTE_VERIFICACAO]
+            marcadores = ", ".join("?" * len(bloco))
+            encontrados.update(linha[0] for linha in conn.execute(
+                f"SELECT id FROM treinos WHERE id IN ({marcadores})", bloco))
+            existentes.update(conn.execute(f"""
+                SELECT treino_id, exercicio_id, series, repeticoes FROM treino_exercicios
+                WHERE treino_id IN ({marcadores})
+            """, bloco).fetchall())
+
+        linhas, registros = [], []
+        for treino_id in ids:
+            if treino_id not in encontrados:
+                linhas.append({"treino_id": treino_id, "exercicio": None, "series": None, "repeticoes": None,
+                               "status": "erro", "mensagem": "Treino não encontrado."})
+                continue
+            for exercicio_id, exercicio_nome, series, repeticoes in itens:
+                linha = {"treino_id": treino_id, "exercicio": exercicio_nome,
+                         "series": series, "repeticoes": repeticoes}
+                chave = (treino_id, exercicio_id, series, repeticoes)
+                if chave in existentes:
+                    linha.update(status="ignorado", mensagem="Já estava no treino.")
+                else:
+                    existentes.add(chave)  # o mesmo item repetido no modelo entra uma vez só
+                    registros.append((treino_id, tipo_treino, exercicio_id, exercicio_nome, series, repeticoes))
+                    linha.update(status="sucesso", mensagem="Exercício adicionado.")
+                linhas.append(linha)
+
+        conn.executemany(
+            "INSERT INTO treino_exercicios (treino_id, treino, exercicio_id, exercicio, series, repeticoes) VALUES (?, ?, ?, ?, ?, ?)",
+            registros,
+        )
+        return linhas
+
+    try:
+        linhas = _escrever(operacao, "treino_exercicios")
+    except EscritaNaoConcluida as e:
+        return {"status": "erro", "mensagem": str(e), "adicionados": 0, "ignorados": 0, "linhas": []}
+    if linhas is None:
+        return {"status": "erro", "mensagem": f"Modelo '{nome_modelo}' não encontrado.",
+                "adicionados": 0, "ignorados": 0, "linhas": []}
+
+    contagem = collections.Counter(linha["status"] for linha in linhas)
+    faltando = [str(linha["treino_id"]) for linha in linhas if linha["status"] == "erro"]
+    mensagem = (f"{contagem['sucesso']} exercícios adicionados em {len(ids) - len(faltando)} treinos; "
+                f"{contagem['ignorado']} já estavam no treino.")
+    if faltando:
+        mensagem += f" Treinos não encontrados: {', '.join(faltando)}."
+    return {
+        "status": "sucesso" if len(faltando) < len(ids) else "erro",
+        "mensagem": mensagem,
+        "adicionados": contagem["sucesso"],
+        "ignorados": contagem["ignorado"],
+        "linhas": linhas,
+    }
 
 # ----------------------------------------KPI EXISTENTES---------------------------------------------------
+@dataclass(frozen=True)
+class KpisDashboard:
+    """Fotografia de todos os indicadores exibidos no Dashboard."""
+    referencia: datetime.date   # dia usado como "hoje" no cálculo
+    total_clientes: int
+    total_planos: int
+    pagamentos_mes: int
+    media_idade: float
+    clientes_ativos: int
+    receita_mes: float
+    novos_30dias: int
+    top1_plano: list            # [(nome_do_plano, qtd_clientes)] ou [] se não houver clientes
+
+# Tabelas lidas pela consulta dos KPIs; uma escrita em qualquer uma delas invalida o cache
+_TABELAS_KPIS = ("clientes", "planos", "pagamentos", "treinos")
+
+def _mesclar_kpis(partes):
+    # KPIs da rede a partir dos de cada unidade (chamado no escopo REDE)
+    total_clientes = sum(k.total_clientes for k in partes)
+    planos = set()
+    for nome in _unidades:
+        planos.update(_na_unidade(nome, lambda: catalogo().nomes("planos")))
+    por_plano = clientes_por_plano()
+    top = por_plano.nlargest(1, "total")
+    return KpisDashboard(
+        referencia=partes[0].referencia,
+        total_clientes=total_clientes,
+        total_planos=len(planos),
+        pagamentos_mes=sum(k.pagamentos_mes for k in partes),
+        media_idade=sum(k.media_idade * k.total_clientes for k in partes) / total_clientes if total_clientes else 0.0,
+        clientes_ativos=sum(k.clientes_ativos for k in partes),
+        receita_mes=sum(k.receita_mes for k in partes),
+        novos_30dias=sum(k.novos_30dias for k in partes),
+        top1_plano=[(linha.plano, int(linha.total)) for linha in top.itertuples()],
+    )
+
+@em_cache(*_TABELAS_KPIS)
+@federada(_mesclar_kpis)
+def _consultar_kpis(hoje):
+    """
+    Calcula todos os KPIs em uma única consulta (uma ida ao banco), em vez de
+    uma conexão e uma consulta por indicador.
+    """
+    query = """
+        WITH
+        cli AS (
+            SELECT COUNT(*) AS total, AVG(idade) AS media_idade
+            FROM clientes
+        ),
+        pag AS (
+            SELECT IFNULL(SUM(quantidade), 0) AS quantidade, IFNULL(SUM(total), 0) AS receita
+            FROM receita_cubo
+            WHERE mes = :mes
+        ),
+        ativos AS (
+            SELECT COUNT(DISTINCT cliente_id) AS total
+            FROM treinos
+            WHERE data_fim >= :hoje
+        ),
+        novos AS (
+            SELECT COUNT(DISTINCT cliente_id) AS total
+            FROM treinos
+            WHERE data_inicio >= :corte_novos
+        ),
+        top AS (
+            SELECT p.nome AS plano, SUM(por_plano.total) AS total_clientes
+            FROM (
+                SELECT plano_id, COUNT(*) AS total
+                FROM clientes
+                GROUP BY plano_id
+            ) AS por_plano
+            JOIN planos p ON por_plano.plano_id = p.id
+            GROUP BY p.nome
+            ORDER BY total_clientes DESC
+            LIMIT 1
+        )
+        SELECT
+            cli.total,
+            (SELECT COUNT(*) FROM planos),
+            pag.quantidade,
+            cli.media_idade,
+            ativos.total,
+            pag.receita,
+            novos.total,
+            top.plano,
+            top.total_clientes
+        FROM cli, pag, ativos, novos
+        LEFT JOIN top ON 1 = 1
+    """
+    # Datas passadas como limites de intervalo (as colunas são 'YYYY-MM-DD'), para que
+    # cada subconsulta seja uma busca por faixa no índice em vez de varrer a tabela;
+    # pagamentos e receita do mês vêm do cubo de receita
+    params = {
+        "mes": hoje.strftime("%Y-%m"),
+        "hoje": hoje.isoformat(),
+        "corte_novos": (hoje - datetime.timedelta(days=30)).isoformat(),
+    }
+    with _leitura() as conn:
+        linha = conn.execute(query, params).fetchone()
+
+    (total_clientes, total_planos, pagamentos_mes, media_idade,
+     ativos, receita, novos, top_plano, top_total) = linha
+    return KpisDashboard(
+        referencia=hoje,
+        total_clientes=total_clientes,
+        total_planos=total_planos,
+        pagamentos_mes=pagamentos_mes,
+        media_idade=float(media_idade or 0.0),
+        clientes_ativos=ativos or 0,
+        receita_mes=float(receita or 0.0),
+        novos_30dias=novos or 0,
+        top1_plano=[(top_plano, top_total)] if top_plano is not None else [],
+    )
+
+def get_kpis_dashboard():
+    """
+    Retorna um KpisDashboard com todos os indicadores do Dashboard.
+    O resultado fica em cache até o dia mudar ou alguma escrita alterar
+    clientes, planos, pagamentos ou treinos.
+    """
+    return _consultar_kpis(datetime.date.today())  # A data faz parte da chave do cache
+
+# Os getters individuais continuam disponíveis e leem da mesma fotografia em cache
 # Retorna o total de clientes cadastrados no banco
 def get_total_clientes():
-    conn = sqlite3.connect("academia_db.db", check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM clientes")
-    total = cursor.fetchone()[0]
-    conn.close()
-    return total
+    return get_kpis_dashboard().total_clientes
 
 # Retorna o total de planos disponíveis no sistema
 def get_total_planos():
-    conn = sqlite3.connect("academia_db.db", check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM planos")
-    total = cursor.fetchone()[0]
-    conn.close()
-    return total
+    return get_kpis_dashboard().total_planos
 
 # Retorna o total de pagamentos realizados no mês atual
 def get_total_pagamentos_mes():
-    df_pag = carregar_pagamentos()
-    if df_pag.empty:
-        return 0
-    hoje = pd.to_datetime(datetime.datetime.now())
-    
-    # Filtra os pagamentos do mês e ano atuais
-    filt = (
-        (df_pag["data_pagamento"].dt.month == hoje.month) &
-        (df_pag["data_pagamento"].dt.year  == hoje.year)
-    )
-    return int(df_pag.loc[filt].shape[0])
+    return get_kpis_dashboard().pagamentos_mes
 
 # Calcula a média
 def get_media_idade_clientes():
-    conn = sqlite3.connect("academia_db.db", check_same_thread=False)
-    df_idade = pd.read_sql_query("SELECT idade FROM clientes", conn)
-    conn.close()
-    if df_idade.empty:
-        return 0.0
-    return float(df_idade["idade"].mean())
+    return get_kpis_dashboard().media_idade
 
 # Retorna o número de clientes ativos
 def get_clientes_ativos():
     """
     Conta quantos clientes têm pelo menos um treino cujo data_fim >= hoje.
     """
-    conn = sqlite3.connect("academia_db.db", check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT COUNT(DISTINCT cliente_id)
-        FROM treinos
-        WHERE date(data_fim) >= date('now');
-    """)
-    total = cursor.fetchone()[0] or 0
-    conn.close()
-    return total
+    return get_kpis_dashboard().clientes_ativos
 
 # Retorna a receita total recebida no mês atual
 def get_receita_mes_atual():
     """
     Soma todos os valores_pago de pagamentos cujo data_pagamento está no mês/ano atuais.
     """
-    conn = sqlite3.connect("academia_db.db", check_same_thread=False)
-    query = """
-        SELECT IFNULL(SUM(valor_pago), 0)
-        FROM pagamentos
-        WHERE strftime('%Y', data_pagamento) = strftime('%Y', 'now')
-          AND strftime('%m', data_pagamento) = strftime('%m', 'now');
-    """
-    cursor = conn.cursor()
-    cursor.execute(query)
-    total = cursor.fetchone()[0] or 0.0
-    conn.close()
-    return float(total)
+    return get_kpis_dashboard().receita_mes
 
 # Retorna o número de novos clientes nos últimos 30 dias
 def get_novos_clientes_30dias():
@@ -872,35 +3393,15 @@ def get_novos_clientes_30dias():
     Conta quantos clientes iniciaram treino nos últimos 30 dias
     (considera-se que cada cliente tem pelo menos um registro em treinos).
     """
-    conn = sqlite3.connect("academia_db.db", check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT COUNT(DISTINCT cliente_id)
-        FROM treinos
-        WHERE date(data_inicio) >= date('now', '-30 day');
-    """)
-    total = cursor.fetchone()[0] or 0
-    conn.close()
-    return total
+    return get_kpis_dashboard().novos_30dias
 
 # Retorna o plano com maior número de clientes (top 1)
 def get_top1_plano():
     """
     Retorna uma lista contendo exatamente um tupla: (nome_do_plano, qtd_clientes).
     """
-    conn = sqlite3.connect("academia_db.db", check_same_thread=False)
-    query = """
-        SELECT p.nome AS plano, COUNT(*) AS total_clientes
-        FROM clientes c
-        JOIN planos p ON c.plano_id = p.id
-        GROUP BY p.nome
-        ORDER BY total_clientes DESC
-        LIMIT 1;
-    """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
     # Exemplo de retorno: [("Premium", 132)]
-    return list(df.itertuples(index=False, name=None))
+    return list(get_kpis_dashboard().top1_plano)
 
 def get_receita_por_mes():
     """
@@ -909,15 +3410,853 @@ def get_receita_por_mes():
       - total (soma de valor_pago)
     agrupado por mês, ordenado de forma crescente.
     """
-    conn = sqlite3.connect("academia_db.db", check_same_thread=False)
+    return receita_cubo(["mes"])[["mes", "total"]]
+
+# ----------------------------------------CUBO DE RECEITA---------------------------------------------------
+# Dimensões aceitas por receita_cubo() e a expressão SQL de cada uma
+_DIMENSOES_CUBO = {
+    "mes":       "r.mes",
+    "plano":     "IFNULL(p.nome, 'Sem plano')",
+    "instrutor": "IFNULL(i.nome, 'Sem instrutor')",
+}
+
+@em_cache("receita_cubo", "planos", "instrutores")
+@federada(_somar_partes("total", "quantidade"))
+def receita_cubo(por=("mes",), mes_inicio=None, mes_fim=None, plano=None, instrutor=None):
+    """
+    Consulta de drill-down no cubo de receita (nunca lê a tabela pagamentos).
+    - por: dimensões de agrupamento, entre "mes", "plano" e "instrutor"
+    - mes_inicio / mes_fim: faixa de meses 'YYYY-MM' (inclusiva)
+    - plano / instrutor: filtra por nome
+    Retorna um DataFrame com as dimensões pedidas + total e quantidade, ordenado
+    pelas dimensões.
+    """
+    por = list(por)
+    invalidas = set(por) - set(_DIMENSOES_CUBO)
+    if invalidas:
+        raise ValueError(f"Dimensões inválidas: {', '.join(sorted(invalidas))}")
+
+    filtros, params = [], []
+    for condicao, valor in (("r.mes >= ?", mes_inicio), ("r.mes <= ?", mes_fim),
+                            ("p.nome = ?", plano), ("i.nome = ?", instrutor)):
+        if valor is not None:
+            filtros.append(condicao)
+            params.append(valor)
+
+    colunas = [f"{_DIMENSOES_CUBO[d]} AS {d}" for d in por]
+    query = f"""
+        SELECT {", ".join(colunas + ["SUM(r.total) AS total", "SUM(r.quantidade) AS quantidade"])}
+        FROM receita_cubo r
+        LEFT JOIN planos p      ON p.id = r.plano_id
+        LEFT JOIN instrutores i ON i.id = r.instrutor_id
+        {"WHERE " + " AND ".join(filtros) if filtros else ""}
+        {"GROUP BY " + ", ".join(por) if por else ""}
+        {"ORDER BY " + ", ".join(por) if por else ""}
+    """
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+    df["total"] = df["total"].fillna(0.0)
+    df["quantidade"] = df["quantidade"].fillna(0).astype(int)
+    return df
+
+# ----------------------------------------COORTES DE RETENÇÃO---------------------------------------------------
+# Cada cliente entra na coorte do mês do seu primeiro pagamento (ou do primeiro
+# treino) e a matriz conta, para cada coorte, quantos clientes ainda pagaram N
+# meses depois. O SQLite devolve os pares (cliente, mês) numa única string, que
+# o NumPy converte de uma vez (bem mais rápido que milhões de tuplas do fetchall),
+# e a matriz inteira sai de ordenações + np.bincount, sem laço em Python.
+ORIGENS_COORTE = {
+    "pagamentos": ("pagamentos", "data_pagamento"),
+    "treinos":    ("treinos", "data_inicio"),
+}
+
+def _ler_inteiros(query, colunas, params=()):
+    # A consulta devolve uma única string "a b c a b c ..." (group_concat), convertida de uma vez pelo NumPy
+    with _leitura() as conn:
+        texto = conn.execute(query, params).fetchone()[0]
+    return np.fromstring(texto or "", dtype=np.int64, sep=" ").reshape(-1, colunas)
+
+def _inicios_de_grupo(*colunas):
+    # Em arrays já ordenados: True onde alguma das colunas muda em relação à linha anterior
+    novos = np.zeros(len(colunas[0]), dtype=bool)
+    novos[:1] = True
+    for coluna in colunas:
+        novos[1:] |= coluna[1:] != coluna[:-1]
+    return novos
+
+def _meses_por_cliente(tabela, coluna):
+    # Mês como inteiro contínuo (ano * 12 + mês - 1), para a diferença entre meses ser uma subtração
+    pares = _ler_inteiros(f"""
+        SELECT group_concat(cliente_id || ' ' || (CAST(substr({coluna}, 1, 4) AS INTEGER) * 12
+                                                 + CAST(substr({coluna}, 6, 2) AS INTEGER) - 1), ' ')
+        FROM {tabela}
+        WHERE cliente_id IS NOT NULL AND {coluna} IS NOT NULL
+    """, 2)
+    return pares[:, 0], pares[:, 1]
+
+def _primeiro_mes(clientes, meses):
+    # Pares (cliente, mês) distintos, ordenados por cliente e mês, e o primeiro mês de cada cliente
+    base = meses.min()
+    largura = meses.max() - base + 1
+    chaves = np.sort(clientes * largura + (meses - base))
+    chaves = chaves[_inicios_de_grupo(chaves)]  # sort + vizinhos diferentes: bem mais rápido que np.unique
+    clientes, meses = chaves // largura, chaves % largura + base
+    inicio = _inicios_de_grupo(clientes)
+    return clientes, meses, clientes[inicio], meses[inicio]
+
+def _rotulo_mes(indice):
+    return f"{indice // 12:04d}-{indice % 12 + 1:02d}"
+
+@analitica
+@em_cache(TABELA_COPIA)
+def retencao_coortes(origem="pagamentos", mes_inicio=None, mes_fim=None, max_meses=None, percentual=True):
+    """
+    Matriz de retenção mensal por coorte.
+    - origem: "pagamentos" (coorte = mês do primeiro pagamento) ou "treinos"
+      (coorte = mês do primeiro treino.data_inicio)
+    - mes_inicio / mes_fim: faixa de coortes 'YYYY-MM' (inclusiva)
+    - max_meses: limita as colunas aos primeiros N meses após a entrada
+    - percentual: True devolve % da coorte; False, a quantidade de clientes
+    Retorna um DataFrame indexado pela coorte ('YYYY-MM'), com a coluna "clientes"
+    (tamanho da coorte) e uma coluna por mês desde a entrada (0, 1, 2, ...) com
+    os clientes que pagaram naquele mês. Meses que ainda não aconteceram ficam NaN.
+    """
+    if origem not in ORIGENS_COORTE:
+        raise ValueError(f"Origem inválida: '{origem}'. Use 'pagamentos' ou 'treinos'.")
+
+    pag_clientes, pag_meses = _meses_por_cliente(*ORIGENS_COORTE["pagamentos"])
+    ent_clientes, ent_meses = pag_clientes, pag_meses
+    if origem == "treinos":
+        ent_clientes, ent_meses = _meses_por_cliente(*ORIGENS_COORTE["treinos"])
+    if not len(pag_meses) or not len(ent_meses):
+        return pd.DataFrame(columns=["clientes"]).rename_axis("coorte")
+    ultimo_mes = int(max(pag_meses.max(), ent_meses.max()))
+
+    # Coorte de cada cliente e, para cada pagamento distinto (cliente, mês), a coorte do cliente
+    pag_clientes, pag_meses, coorte_clientes, coorte_meses = _primeiro_mes(pag_clientes, pag_meses)
+    if origem == "treinos":
+        _, _, coorte_clientes, coorte_meses = _primeiro_mes(ent_clientes, ent_meses)
+    posicao = np.searchsorted(coorte_clientes, pag_clientes).clip(max=len(coorte_clientes) - 1)
+    tem_coorte = coorte_clientes[posicao] == pag_clientes
+    coortes = coorte_meses[posicao[tem_coorte]]
+    deslocamentos = pag_meses[tem_coorte] - coortes
+    validos = deslocamentos >= 0  # Pagamentos anteriores ao primeiro treino não contam
+    coortes, deslocamentos = coortes[validos], deslocamentos[validos]
+
+    primeira = int(coorte_meses.min())
+    n_coortes = ultimo_mes - primeira + 1
+    n_meses = n_coortes if max_meses is None else min(n_coortes, max_meses + 1)
+    dentro = deslocamentos < n_meses
+    matriz = np.bincount(
+        (coortes[dentro] - primeira) * n_meses + deslocamentos[dentro], minlength=n_coortes * n_meses
+    ).reshape(n_coortes, n_meses).astype(float)
+    tamanhos = np.bincount(coorte_meses - primeira, minlength=n_coortes)
+
+    # Coorte + deslocamento depois do último mês com dados: ainda não observável
+    futuro = np.arange(n_coortes)[:, None] + np.arange(n_meses)[None, :] > ultimo_mes - primeira
+    matriz[futuro] = np.nan
+    if percentual:
+        matriz = matriz / np.maximum(tamanhos, 1)[:, None] * 100
+
+    df = pd.DataFrame(matriz, columns=range(n_meses),
+                      index=pd.Index([_rotulo_mes(primeira + i) for i in range(n_coortes)], name="coorte"))
+    df.insert(0, "clientes", tamanhos)
+    df = df[df["clientes"] > 0]
+    if mes_inicio is not None:
+        df = df[df.index >= mes_inicio]
+    if mes_fim is not None:
+        df = df[df.index <= mes_fim]
+    return df
+
+def grafico_retencao(origem="pagamentos", ultimas_coortes=24):
+    df = retencao_coortes(origem, max_meses=ultimas_coortes - 1).tail(ultimas_coortes)
+    if df.empty:
+        return "Sem dados para exibir."
+    valores = df.drop(columns="clientes")
+
+    plt = _plt()
+    fig, ax = plt.subplots(figsize=(12, max(4, 0.35 * len(df))))
+    imagem = ax.imshow(valores.to_numpy(), cmap="YlGn", vmin=0, vmax=100, aspect="auto")
+    ax.set_xticks(range(valores.shape[1]), valores.columns)
+    ax.set_yticks(range(len(df)), [f"{coorte} ({n})" for coorte, n in df["clientes"].items()])
+    ax.set_xlabel("Meses desde a entrada")
+    ax.set_ylabel("Coorte (clientes)")
+    ax.set_title("Retenção por Coorte (% que ainda paga)")
+    fig.colorbar(imagem, ax=ax, label="%")
+    return fig
+
+# ----------------------------------------CLIENTES ATIVOS POR DIA---------------------------------------------------
+# Um cliente está ativo no dia d se tem algum treino com data_inicio <= d <= data_fim
+# (treino sem data_fim: ativo até hoje). Em vez de uma consulta por dia, os intervalos
+# de cada cliente são unidos (treinos sobrepostos contam o cliente uma vez) e a série
+# inteira sai de uma varredura: +1 no início de cada intervalo, -1 no dia seguinte ao
+# fim, soma acumulada. Custa O(n log n) pela ordenação, para qualquer período.
+# Datas circulam como dias desde 1970-01-01 (datetime64[D]).
+DIMENSOES_ATIVOS = {
+    "plano":     ("plano_id", "planos"),
+    "instrutor": ("instrutor_id", "instrutores"),
+}
+
+def _dia(data):
+    return np.datetime64(pd.Timestamp(data).date(), "D").astype(np.int64)
+
+class LinhaAtivos:
+    """
+    Intervalos de atividade já unidos por (grupo, cliente), com inícios e fins
+    ordenados por grupo. O grupo é o id do plano/instrutor do treino, ou 0
+    quando não há divisão. serie() faz a varredura num período; ativos_em() é
+    uma busca binária nos eventos.
+    """
+
+    def __init__(self, grupos, clientes, inicios, fins):
+        # Ordena por grupo, cliente e início e une os intervalos que se tocam ou sobrepõem:
+        # o fim acumulado (máximo corrido) recomeça a cada cliente porque cada par
+        # (grupo, cliente) ganha um deslocamento maior que qualquer data
+        ordem = np.lexsort((inicios, clientes, grupos))
+        grupos, clientes, inicios, fins = grupos[ordem], clientes[ordem], inicios[ordem], fins[ordem]
+        base = min(inicios.min(), fins.min()) if len(inicios) else 0
+        largura = (max(inicios.max(), fins.max()) - base + 2) if len(inicios) else 1
+        deslocamento = (np.cumsum(_inicios_de_grupo(grupos, clientes)) - 1) * largura
+        fim_corrido = np.maximum.accumulate(fins - base + deslocamento)
+        novo = np.ones(len(inicios), dtype=bool)
+        novo[1:] = inicios[1:] - base + deslocamento[1:] > fim_corrido[:-1] + 1
+        ultimo = np.flatnonzero(np.r_[novo[1:], True])[:novo.sum()]  # Última linha de cada intervalo unido
+
+        self.grupos = grupos[novo]
+        self.inicios = inicios[novo]
+        self.fins = fim_corrido[ultimo] - deslocamento[ultimo] + base
+        self.valores = self.grupos[_inicios_de_grupo(self.grupos)] if len(self.grupos) else self.grupos
+        # Por grupo: inícios e dias seguintes aos fins, ordenados, para as buscas binárias
+        self._eventos = {}
+        for valor in self.valores.tolist():
+            do_grupo = self.grupos == valor
+            self._eventos[valor] = (np.sort(self.inicios[do_grupo]), np.sort(self.fins[do_grupo] + 1))
+
+    def ativos_em(self, dia, grupo=0):
+        if grupo not in self._eventos:
+            return 0
+        inicios, saidas = self._eventos[grupo]
+        return int(np.searchsorted(inicios, dia, "right") - np.searchsorted(saidas, dia, "right"))
+
+    def serie(self, primeiro, ultimo):
+        """Matriz (grupos x dias) com os ativos de cada dia de primeiro a ultimo (inclusive)."""
+        n_dias = ultimo - primeiro + 1
+        linha = np.searchsorted(self.valores, self.grupos)
+        no_periodo = (self.inicios <= ultimo) & (self.fins >= primeiro)
+        entradas = (self.inicios[no_periodo] - primeiro).clip(0, n_dias)
+        saidas = (self.fins[no_periodo] + 1 - primeiro).clip(0, n_dias)
+        linha = linha[no_periodo] * (n_dias + 1)
+        tamanho = len(self.valores) * (n_dias + 1)
+        eventos = (np.bincount(linha + entradas, minlength=tamanho)
+                   - np.bincount(linha + saidas, minlength=tamanho))
+        return eventos.reshape(len(self.valores), n_dias + 1)[:, :n_dias].cumsum(axis=1)
+
+# Uma linha do tempo por banco e dimensão, refeita só quando a tabela treinos muda
+_linhas_ativos = {}
+
+@analitica
+def linha_ativos(por=None):
+    """
+    Retorna a LinhaAtivos da dimensão `por` (None, "plano" ou "instrutor"),
+    montada a partir da tabela treinos da cópia analítica e guardada até a
+    próxima cópia.
+    """
+    if por is not None and por not in DIMENSOES_ATIVOS:
+        raise ValueError(f"Dimensão inválida: '{por}'. Use 'plano' ou 'instrutor'.")
+    hoje = _dia(datetime.date.today())
+    versao = (_versao_tabelas(TABELA_COPIA), hoje)  # Treinos sem data_fim mudam de fim a cada dia
+    guardada = _linhas_ativos.get((_caminho_banco(), por))
+    if guardada is not None and guardada[0] == versao:
+        return guardada[1]
+
+    grupo = "0" if por is None else f"IFNULL({DIMENSOES_ATIVOS[por][0]}, 0)"
+    linhas = _ler_inteiros(f"""
+        SELECT group_concat({grupo} || ' ' || cliente_id
+                            || ' ' || CAST(julianday(data_inicio) - 2440587.5 AS INTEGER)
+                            || ' ' || IFNULL(CAST(julianday(data_fim) - 2440587.5 AS INTEGER), :hoje), ' ')
+        FROM treinos
+        WHERE cliente_id IS NOT NULL AND julianday(data_inicio) IS NOT NULL
+    """, 4, {"hoje": int(hoje)})
+    linhas = linhas[linhas[:, 3] >= linhas[:, 2]]  # Treino que termina antes de começar não conta
+    linha = LinhaAtivos(linhas[:, 0], linhas[:, 1], linhas[:, 2], linhas[:, 3])
+    _linhas_ativos[_caminho_banco(), por] = (versao, linha)
+    return linha
+
+def _nomes_grupos(por, valores):
+    if por is None:
+        return ["ativos"]
+    nomes = {r["id"]: r["nome"] for r in catalogo().registros(DIMENSOES_ATIVOS[por][1])}
+    return [nomes.get(v, f"Sem {por}") for v in valores]
+
+def ativos_por_dia(data_inicio, data_fim, por=None):
+    """
+    Série diária de clientes ativos entre data_inicio e data_fim (inclusive).
+    Retorna um DataFrame indexado pela data, com a coluna "ativos" ou, com
+    por="plano"/"instrutor", uma coluna por plano/instrutor (um cliente com
+    treinos em dois planos no mesmo dia conta nos dois).
+    """
+    primeiro, ultimo = _dia(data_inicio), _dia(data_fim)
+    if ultimo < primeiro:
+        raise ValueError("A data final deve ser igual ou posterior à inicial.")
+    linha = linha_ativos(por)
+    dias = pd.DatetimeIndex(np.arange(primeiro, ultimo + 1).astype("datetime64[D]"), name="data")
+    if not len(linha.valores):
+        return pd.DataFrame({nome: 0 for nome in _nomes_grupos(por, [])}, index=dias)
+    return pd.DataFrame(linha.serie(primeiro, ultimo).T, index=dias,
+                        columns=_nomes_grupos(por, linha.valores.tolist()))
+
+def clientes_ativos_em(data, por=None):
+    """
+    Quantos clientes estavam ativos na data (busca binária, sem consultar o banco
+    enquanto treinos não mudar). Com por="plano"/"instrutor" retorna {nome: quantidade}.
+    """
+    linha, dia = linha_ativos(por), _dia(data)
+    if por is None:
+        return linha.ativos_em(dia)
+    valores = linha.valores.tolist()
+    return dict(zip(_nomes_grupos(por, valores), (linha.ativos_em(dia, v) for v in valores)))
+
+# ----------------------------------------INADIMPLÊNCIA---------------------------------------------------
+# Cada cliente deve uma mensalidade (planos.preco_mensal) por mês a partir do
+# primeiro pagamento, com vencimento no mesmo dia do mês (ou no último dia, em
+# meses mais curtos). Um contrato dura planos.duracao_meses: passado o fim, nada
+# mais é cobrado até o cliente renovar (pagar além do contrato abre o seguinte).
+# Uma única consulta agrega os pagamentos por cliente (índice cliente_id,
+# data_pagamento) já com o plano; o resto é aritmética de datas vetorizada.
+ORDENACOES_INADIMPLENCIA = ("dias_atraso", "saldo_devedor", "pagamentos_pendentes", "ultimo_pagamento", "cliente_nome")
+
+def _vencimentos(meses_inicio, dias_inicio, parcela):
+    # Data de vencimento da parcela (0 = primeira) de cada cliente, em datetime64[D]
+    mes = meses_inicio + parcela.astype("timedelta64[M]")
+    primeiro_dia = mes.astype("datetime64[D]")
+    dias_no_mes = ((mes + 1).astype("datetime64[D]") - primeiro_dia).astype(np.int64)
+    return primeiro_dia + np.minimum(dias_inicio, dias_no_mes - 1).astype("timedelta64[D]")
+
+@analitica
+@em_cache(TABELA_COPIA)
+def _calcular_inadimplencia(hoje):
     query = """
-        SELECT 
-            strftime('%Y-%m', data_pagamento) AS mes,
-            IFNULL(SUM(valor_pago), 0)       AS total
-        FROM pagamentos
-        GROUP BY mes
-        ORDER BY mes;
+        SELECT c.id AS cliente_id, c.nome AS cliente_nome, p.nome AS plano,
+               p.preco_mensal, p.duracao_meses,
+               pg.inicio, pg.ultimo_pagamento,
+               IFNULL(pg.quantidade, 0) AS pagamentos_recebidos,
+               IFNULL(pg.total, 0) AS total_pago
+        FROM clientes c
+        JOIN planos p ON p.id = c.plano_id
+        LEFT JOIN (
+            SELECT cliente_id, MIN(data_pagamento) AS inicio, MAX(data_pagamento) AS ultimo_pagamento,
+                   COUNT(*) AS quantidade, SUM(valor_pago) AS total
+            FROM pagamentos
+            GROUP BY cliente_id
+        ) AS pg ON pg.cliente_id = c.id
+        ORDER BY c.id
+    """
+    with _leitura() as conn:
+        df = pd.read_sql_query(query, conn)
+    df["inicio"] = pd.to_datetime(df["inicio"], errors="coerce")
+    df["ultimo_pagamento"] = pd.to_datetime(df["ultimo_pagamento"], errors="coerce")
+
+    hoje = np.datetime64(hoje, "D")
+    inicio = df["inicio"].to_numpy().astype("datetime64[D]")
+    com_pagamento = ~np.isnat(inicio)
+    inicio = np.where(com_pagamento, inicio, hoje)  # Sem pagamento: nada vencido ainda
+    meses_inicio = inicio.astype("datetime64[M]")
+    dias_inicio = (inicio - meses_inicio.astype("datetime64[D]")).astype(np.int64)
+    recebidos = df["pagamentos_recebidos"].to_numpy()
+    duracao = np.maximum(df["duracao_meses"].to_numpy(), 1)
+
+    # Parcelas vencidas até hoje, limitadas ao fim do contrato atual (nenhuma se o
+    # primeiro pagamento tem data futura)
+    meses_decorridos = (hoje.astype("datetime64[M]") - meses_inicio).astype(np.int64)
+    vencidas = np.maximum(meses_decorridos + (_vencimentos(meses_inicio, dias_inicio, meses_decorridos) <= hoje), 0)
+    contratos = np.maximum(1, -(-recebidos // duracao))
+    esperados = np.where(com_pagamento, np.minimum(vencidas, contratos * duracao), 0)
+    pendentes = np.maximum(esperados - recebidos, 0)
+
+    # O atraso conta a partir do vencimento da primeira parcela não paga
+    primeira_em_aberto = _vencimentos(meses_inicio, dias_inicio, recebidos)
+    atraso = (hoje - primeira_em_aberto).astype(np.int64)
+
+    df["pagamentos_esperados"] = esperados
+    df["pagamentos_pendentes"] = pendentes
+    df["dias_atraso"] = np.where(pendentes > 0, atraso, 0)
+    df["saldo_devedor"] = pendentes * df["preco_mensal"].to_numpy()
+    return df
+
+def situacao_pagamentos():
+    """
+    Retorna um DataFrame com todos os clientes e, para cada um: plano, início
+    (primeiro pagamento), último pagamento, pagamentos_esperados até hoje,
+    pagamentos_recebidos, total_pago, pagamentos_pendentes, dias_atraso e
+    saldo_devedor. Lido da cópia analítica (até IDADE_MAXIMA_COPIA_SEG de
+    defasagem) e guardado em cache até o dia mudar ou a cópia ser refeita.
+    """
+    return _calcular_inadimplencia(datetime.date.today())
+
+def inadimplentes(ordenar_por="dias_atraso", decrescente=True, dias_minimos=1, limite=None):
+    """
+    Clientes com pelo menos `dias_minimos` dias de atraso, ordenados pela coluna
+    escolhida (uma de ORDENACOES_INADIMPLENCIA). Retorna (DataFrame, resumo), em
+    que resumo traz a quantidade de inadimplentes e o saldo devedor total do filtro
+    (o DataFrame é cortado em `limite` linhas, o resumo não).
+    """
+    if ordenar_por not in ORDENACOES_INADIMPLENCIA:
+        raise ValueError(f"Ordenação inválida: '{ordenar_por}'.")
+    df = situacao_pagamentos()
+    df = df[df["dias_atraso"] >= max(dias_minimos, 1)]
+    resumo = {"clientes": len(df), "saldo_devedor": float(df["saldo_devedor"].sum())}
+    if limite is not None and ordenar_por != "cliente_nome":
+        # Só as `limite` maiores/menores: evita ordenar a lista inteira
+        escolher = df.nlargest if decrescente else df.nsmallest
+        df = escolher(limite, ordenar_por, keep="first")
+    else:
+        df = df.sort_values(ordenar_por, ascending=not decrescente, kind="stable")
+        if limite is not None:
+            df = df.head(limite)
+    return df.reset_index(drop=True), resumo
+
+# ----------------------------------------SNAPSHOT ANALÍTICO (PARQUET)---------------------------------------------------
+# Relatórios pesados podem ler uma cópia colunar das tabelas de fatos em vez do
+# SQLite: exportar_snapshot() grava pagamentos, treinos e treino_exercicios em
+# Parquet particionado por mês (pasta/tabela.<versão>/mes=AAAA-MM/*.parquet, com
+# a versão em uso de cada tabela no manifesto) e ler_snapshot() lê esses arquivos
+# por memory-map, só com as colunas pedidas e pulando os meses fora do filtro. A primeira exportação grava tudo; as seguintes
+# regravam só os meses marcados em snapshot_pendente pelos gatilhos (inserções,
+# alterações e exclusões). A leitura usa conexões somente leitura (WAL): não
+# bloqueia os cadastros. Datas que não são AAAA-MM-DD viram nulas no Parquet e
+# ficam listadas no manifesto (datas_invalidas_snapshot()), sem parar a exportação.
+# Precisa do pyarrow, que é opcional: sem ele o resto do backend funciona igual.
+PASTA_SNAPSHOT = os.environ.get("ACADEMIA_SNAPSHOT", "snapshot_analitico")
+
+# tabela -> (SELECT com as colunas exportadas e o mês da partição, coluna de data
+# indexada que define o mês, {coluna: tipo arrow})
+_FATOS_SNAPSHOT = {
+    "pagamentos": (
+        """SELECT id, cliente_id, plano_id, valor_pago, data_pagamento,
+                  COALESCE(substr(data_pagamento, 1, 7), 'sem-data') AS mes
+           FROM pagamentos""",
+        "data_pagamento",
+        {"id": "int64", "cliente_id": "int64", "plano_id": "int64", "valor_pago": "float64",
+         "data_pagamento": "date32", "mes": "string"},
+    ),
+    "treinos": (
+        """SELECT id, cliente_id, instrutor_id, plano_id, data_inicio, data_fim,
+                  COALESCE(substr(data_inicio, 1, 7), 'sem-data') AS mes
+           FROM treinos""",
+        "data_inicio",
+        {"id": "int64", "cliente_id": "int64", "instrutor_id": "int64", "plano_id": "int64",
+         "data_inicio": "date32", "data_fim": "date32", "mes": "string"},
+    ),
+    # Sem data própria: herda o mês do treino, para os dois serem lidos com o mesmo filtro
+    "treino_exercicios": (
+        """SELECT te.id, te.treino_id, te.exercicio_id, te.series, te.repeticoes,
+                  COALESCE(substr(t.data_inicio, 1, 7), 'sem-data') AS mes
+           FROM treino_exercicios te LEFT JOIN treinos t ON t.id = te.treino_id""",
+        "t.data_inicio",
+        {"id": "int64", "treino_id": "int64", "exercicio_id": "int64", "series": "int64",
+         "repeticoes": "int64", "mes": "string"},
+    ),
+}
+_ARQUIVO_MANIFESTO = "_manifesto.json"
+_ARQUIVO_PARTICAO = "parte-0.parquet"
+
+def _pyarrow():
+    # pyarrow é importado só quando o snapshot é usado (e só é exigido nesse caso)
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.fs
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("O snapshot analítico precisa do pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+def _esquema_snapshot(pa, tabela):
+    return pa.schema([(coluna, getattr(pa, tipo)()) for coluna, tipo in _FATOS_SNAPSHOT[tabela][2].items()])
+
+def _pasta_snapshot(pasta):
+    # Cada unidade exporta para uma subpasta com o seu nome
+    if pasta is not None:
+        return Path(pasta)
+    nome = _unidade_atual.get()
+    if nome == REDE:
+        _caminho_banco()  # erro explicando que o snapshot é por unidade
+    return Path(PASTA_SNAPSHOT) / nome if nome else Path(PASTA_SNAPSHOT)
+
+def _ler_manifesto(pasta):
+    caminho = Path(pasta) / _ARQUIVO_MANIFESTO
+    if not caminho.exists():
+        return {}
+    return json.loads(caminho.read_text(encoding="utf-8"))
+
+def _gravar_manifesto(pasta, manifesto):
+    caminho = Path(pasta) / _ARQUIVO_MANIFESTO
+    temporario = caminho.with_suffix(".tmp")
+    temporario.write_text(json.dumps(manifesto, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(temporario, caminho)  # troca atômica: o manifesto nunca fica pela metade
+
+def _datas_do_lote(df, esquema):
+    """
+    Converte as colunas date32 do lote de texto AAAA-MM-DD para datas; o que não
+    converte vira nulo e volta como lista de {id, coluna, valor} para o manifesto.
+    """
+    invalidas = []
+    for campo in esquema:
+        if str(campo.type) != "date32[day]":
+            continue
+        convertidas = pd.to_datetime(df[campo.name], errors="coerce", format="%Y-%m-%d")
+        falhas = convertidas.isna() & df[campo.name].notna()
+        invalidas += [{"id": int(i), "coluna": campo.name, "valor": str(valor)}
+                      for i, valor in zip(df.loc[falhas, "id"], df.loc[falhas, campo.name])]
+        df[campo.name] = convertidas
+    return invalidas
+
+def _consultas_meses(select, coluna, meses):
+    """
+    Uma consulta por mês pedido, por faixa na coluna de data (que tem índice) em
+    vez de comparar o mês calculado linha a linha: 'AAAA-MM' vai de 'AAAA-MM' até
+    o prefixo seguinte ('AAAA-MN'), e o substr() repetido só descarta, dentro da
+    faixa, textos mais curtos que o mês (datas malformadas). 'sem-data' vira IS
+    NULL. Consultas separadas (e não um OR) deixam o SQLite usar o índice também
+    através do LEFT JOIN dos itens de treino.
+    """
+    for mes in meses:
+        if mes == "sem-data":
+            yield f"SELECT * FROM ({select} WHERE {coluna} IS NULL) ORDER BY id", ()
+        else:
+            yield (f"SELECT * FROM ({select} WHERE {coluna} >= ? AND {coluna} < ? "
+                   f"AND substr({coluna}, 1, 7) = ?) ORDER BY id", (mes, mes[:-1] + chr(ord(mes[-1]) + 1), mes))
+
+def _trocar_particao(pasta_mes, temporario):
+    # O arquivo novo (com "_" na frente, que o dataset ignora) substitui os antigos do mês
+    for antigo in pasta_mes.glob("*.parquet"):
+        if antigo != temporario and antigo.name != _ARQUIVO_PARTICAO:
+            antigo.unlink()
+    os.replace(temporario, pasta_mes / _ARQUIVO_PARTICAO)
+
+def exportar_snapshot(tabelas=tuple(_FATOS_SNAPSHOT), pasta=None, tamanho_lote=TAMANHO_LOTE_CARGA):
+    """
+    Exporta para Parquet as tabelas de fatos, um arquivo por mês. Na primeira vez
+    (ou com um manifesto de versão antiga) grava todos os meses; depois regrava só
+    os meses com inserções, alterações ou exclusões desde a exportação anterior e
+    apaga os que ficaram vazios. As linhas são lidas em lotes de `tamanho_lote` e
+    cada mês é trocado de uma vez, com o manifesto gravado ao fim de cada tabela
+    (uma exportação interrompida é refeita na próxima). A exportação completa é
+    gravada numa pasta nova e só passa a ser lida quando o manifesto é trocado:
+    até lá, ler_snapshot() continua vendo a anterior inteira. Retorna {tabela:
+    linhas exportadas agora}.
+    """
+    pa = _pyarrow()
+    pasta = _pasta_snapshot(pasta)
+    pasta.mkdir(parents=True, exist_ok=True)
+    manifesto = _ler_manifesto(pasta)
+
+    exportadas = {}
+    for tabela in tabelas:
+        select, coluna_data, _ = _FATOS_SNAPSHOT[tabela]
+        esquema = _esquema_snapshot(pa, tabela)
+        estado = manifesto.get(tabela, {})
+        completa = "meses" not in estado
+        anterior = estado.get("pasta", tabela)
+        if completa:
+            # Snapshot novo ou do formato antigo (só com ultimo_id): refeito do zero
+            # numa pasta nova, ao lado da atual, que continua sendo lida até o
+            # manifesto apontar para a nova (restos de exportações interrompidas saem)
+            for resto in pasta.glob(f"{tabela}.*"):
+                if resto.name != anterior:
+                    shutil.rmtree(resto, ignore_errors=True)
+            nova = f"{tabela}.{datetime.datetime.now():%Y%m%d%H%M%S%f}"
+            estado = manifesto[tabela] = {"linhas": 0, "meses": {}, "datas_invalidas": {}, "pasta": nova}
+        destino = pasta / estado.get("pasta", tabela)
+
+        with _leitura(ao_vivo=True) as conn:
+            # As pendências são lidas antes das linhas: o que mudar daqui em diante
+            # fica com versão maior e continua pendente para a próxima exportação
+            pendentes = dict(conn.execute(
+                "SELECT mes, versao FROM snapshot_pendente WHERE tabela = ?", (tabela,)).fetchall())
+            meses = None if completa else sorted(pendentes)
+            exportadas[tabela] = 0
+            if meses == []:
+                continue
+
+            consultas = [(f"SELECT * FROM ({select}) ORDER BY mes, id", ())]
+            if meses is not None:
+                consultas = _consultas_meses(select, coluna_data, meses)
+            regravados = {}  # mês -> (linhas, datas inválidas)
+            escritor = mes_atual = None
+            lotes = (df for sql, parametros in consultas
+                     for df in pd.read_sql_query(sql, conn, params=parametros, chunksize=tamanho_lote))
+            for df in lotes:
+                for mes, parte in df.groupby("mes", sort=False):
+                    if mes != mes_atual:
+                        if escritor is not None:
+                            escritor.close()
+                            _trocar_particao(destino / f"mes={mes_atual}", temporario)
+                        mes_atual = mes
+                        (destino / f"mes={mes}").mkdir(parents=True, exist_ok=True)
+                        temporario = destino / f"mes={mes}" / f"_{_ARQUIVO_PARTICAO}"
+                        escritor = pa.parquet.ParquetWriter(temporario, esquema.remove(esquema.get_field_index("mes")))
+                        regravados[mes] = (0, [])
+                    parte = parte.drop(columns="mes")
+                    invalidas = _datas_do_lote(parte, esquema)
+                    escritor.write_table(pa.Table.from_pandas(parte, preserve_index=False).cast(escritor.schema))
+                    linhas, anteriores = regravados[mes]
+                    regravados[mes] = (linhas + len(parte), anteriores + invalidas)
+            if escritor is not None:
+                escritor.close()
+                _trocar_particao(destino / f"mes={mes_atual}", temporario)
+
+        # Meses pendentes sem nenhuma linha agora: tudo foi apagado ou mudou de mês
+        for mes in (meses or ()):
+            if mes not in regravados:
+                shutil.rmtree(destino / f"mes={mes}", ignore_errors=True)
+                estado["meses"].pop(mes, None)
+                estado["datas_invalidas"].pop(mes, None)
+        for mes, (linhas, invalidas) in regravados.items():
+            estado["meses"][mes] = linhas
+            if invalidas:
+                estado["datas_invalidas"][mes] = invalidas
+            else:
+                estado["datas_invalidas"].pop(mes, None)
+        estado["linhas"] = sum(estado["meses"].values())
+        estado["atualizado_em"] = datetime.datetime.now().isoformat(timespec="seconds")
+        _gravar_manifesto(pasta, manifesto)
+        if completa and anterior != estado["pasta"]:
+            shutil.rmtree(pasta / anterior, ignore_errors=True)
+        exportadas[tabela] = sum(linhas for linhas, _ in regravados.values())
+
+        # Baixa só nas pendências que não mudaram enquanto a exportação rodava
+        with _transacao() as conn:
+            conn.executemany(
+                "DELETE FROM snapshot_pendente WHERE tabela = ? AND mes = ? AND versao = ?",
+                [(tabela, mes, versao) for mes, versao in pendentes.items()],
+            )
+    return exportadas
+
+def estado_snapshot(pasta=None):
+    """
+    Resumo do manifesto do snapshot: {tabela: {linhas, meses, datas_invalidas,
+    atualizado_em}} ({} se nunca exportado).
+    """
+    return {
+        tabela: {
+            "linhas": estado.get("linhas", 0),
+            "meses": len(estado.get("meses", {})),
+            "datas_invalidas": sum(map(len, estado.get("datas_invalidas", {}).values())),
+            "atualizado_em": estado.get("atualizado_em"),
+        }
+        for tabela, estado in _ler_manifesto(_pasta_snapshot(pasta)).items()
+    }
+
+def datas_invalidas_snapshot(pasta=None):
+    """
+    Linhas exportadas com data fora do formato AAAA-MM-DD (gravadas como nulas no
+    Parquet): DataFrame com as colunas [tabela, mes, id, coluna, valor].
+    """
+    linhas = [
+        {"tabela": tabela, "mes": mes, **invalida}
+        for tabela, estado in _ler_manifesto(_pasta_snapshot(pasta)).items()
+        for mes, invalidas in estado.get("datas_invalidas", {}).items()
+        for invalida in invalidas
+    ]
+    return pd.DataFrame(linhas, columns=["tabela", "mes", "id", "coluna", "valor"])
+
+def ler_snapshot(tabela, colunas=None, mes_inicio=None, mes_fim=None, filtro=None, pasta=None, como_arrow=False):
+    """
+    Lê uma tabela do snapshot. `colunas` limita o que é lido do disco; mes_inicio
+    e mes_fim ("AAAA-MM") descartam partições inteiras sem abri-las; `filtro` é
+    uma expressão do pyarrow.dataset (ex.: pc.field("valor_pago") > 100) aplicada
+    com as estatísticas do Parquet. Retorna DataFrame (ou pyarrow.Table).
+    """
+    pa = _pyarrow()
+    if tabela not in _FATOS_SNAPSHOT:
+        raise ValueError(f"Tabela '{tabela}' não faz parte do snapshot.")
+    pasta = _pasta_snapshot(pasta)
+    pasta = pasta / _ler_manifesto(pasta).get(tabela, {}).get("pasta", tabela)
+    esquema = _esquema_snapshot(pa, tabela)
+    if not pasta.exists():
+        vazio = esquema.empty_table() if colunas is None else esquema.empty_table().select(colunas)
+        return vazio if como_arrow else vazio.to_pandas()
+
+    dataset = pa.dataset.dataset(
+        pasta, format="parquet", schema=esquema,
+        partitioning=pa.dataset.partitioning(pa.schema([("mes", pa.string())]), flavor="hive"),
+        filesystem=pa.fs.LocalFileSystem(use_mmap=True),
+    )
+    condicao = filtro
+    for trecho in (pa.dataset.field("mes") >= mes_inicio if mes_inicio else None,
+                   pa.dataset.field("mes") <= mes_fim if mes_fim else None):
+        if trecho is not None:
+            condicao = trecho if condicao is None else condicao & trecho
+
+    resultado = dataset.to_table(columns=colunas, filter=condicao)
+    return resultado if como_arrow else resultado.to_pandas()
+
+def carregar_pagamentos_analitico(mes_inicio=None, mes_fim=None):
+    """Mesmas colunas de carregar_pagamentos(), lidas do snapshot Parquet."""
+    df = ler_snapshot("pagamentos", ["cliente_id", "data_pagamento", "valor_pago", "plano_id"],
+                      mes_inicio, mes_fim)
+    df["data_pagamento"] = pd.to_datetime(df["data_pagamento"])
+    return df
+
+def listar_treinos_com_exercicios_analitico(mes_inicio=None, mes_fim=None):
+    """
+    Mesmo resultado de listar_treinos_com_exercicios(), montado a partir do
+    snapshot (fatos) e do catálogo em memória (nomes), sem tocar nas tabelas grandes.
+    """
+    treinos = ler_snapshot("treinos", ["id", "cliente_id", "instrutor_id", "data_inicio", "data_fim"],
+                           mes_inicio, mes_fim)
+    itens = ler_snapshot("treino_exercicios", ["id", "treino_id", "exercicio_id", "series", "repeticoes"],
+                         mes_inicio, mes_fim)
+
+    def nomes(tabela, colunas):
+        return pd.DataFrame(catalogo().registros(tabela), columns=["id"] + colunas)
+
+    df = (
+        itens.rename(columns={"id": "_item"})
+        .merge(treinos.rename(columns={"id": "treino_id"}), on="treino_id")
+        .merge(nomes("clientes", ["nome"]).rename(columns={"id": "cliente_id", "nome": "Cliente"}), on="cliente_id")
+        .merge(nomes("instrutores", ["nome"]).rename(columns={"id": "instrutor_id", "nome": "Instrutor"}), on="instrutor_id")
+        .merge(nomes("exercicios", ["nome", "grupo_muscular"]).rename(
+            columns={"id": "exercicio_id", "nome": "Exercicio", "grupo_muscular": "Grupo_Muscular"}), on="exercicio_id")
+    )
+    df["data_inicio"] = pd.to_datetime(df["data_inicio"])
+    df["data_fim"] = pd.to_datetime(df["data_fim"])
+    df = df.sort_values(["Cliente", "data_inicio"], kind="stable", ignore_index=True)
+    return df.rename(columns={"treino_id": "Treino_ID"})[
+        ["Treino_ID", "Cliente", "Instrutor", "data_inicio", "data_fim",
+         "Exercicio", "Grupo_Muscular", "series", "repeticoes"]]
+
+# ----------------------------------------CACHE DE GRÁFICOS---------------------------------------------------
+# Os gráficos são renderizados uma vez e guardados como bytes (PNG/SVG), com chave
+# (gráfico, formato, versão das tabelas que ele lê). A figura do matplotlib é fechada
+# logo após a rasterização, e o cache descarta as entradas menos usadas (LRU).
+TAMANHO_CACHE_GRAFICOS = 32
+
+# nome -> (função que gera a figura, tabelas das quais o gráfico depende)
+_GRAFICOS = {
+    "pagamentos":          (grafico_pagamentos,          ("receita_cubo", "planos", "instrutores")),
+    "instrutores":         (grafico_instrutores,         ("clientes", "instrutores")),
+    "treinos_por_cliente": (grafico_treinos_por_cliente, ("treino_exercicios", "exercicios")),
+    "clientes_por_plano":  (grafico_clientes_por_plano,  ("clientes", "planos")),
+    "retencao":            (grafico_retencao,            (TABELA_COPIA,)),
+    "retencao_treinos":    (functools.partial(grafico_retencao, "treinos"), (TABELA_COPIA,)),
+}
+
+_cache_graficos = OrderedDict()
+_lock_graficos = threading.Lock()
+_lock_desenho = threading.Lock()
+
+def _rasterizar(fig, formato):
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format=formato, bbox_inches="tight", facecolor=fig.get_facecolor())
+    finally:
+        _plt().close(fig)  # Libera a memória da figura na hora
+    return buffer.getvalue()
+
+def grafico_imagem(nome, formato="png"):
+    """
+    Retorna o gráfico `nome` (uma das chaves de _GRAFICOS) já renderizado, como
+    bytes no formato pedido ("png" ou "svg"), ou uma str com o aviso quando não
+    há dados. Só renderiza de novo se alguma tabela usada pelo gráfico mudou.
     """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
\ No newline at end of file
+    if nome not in _GRAFICOS:
+        raise ValueError(f"Gráfico desconhecido: '{nome}'.")
+    gerar, tabelas = _GRAFICOS[nome]
+    chave = (nome, formato, _escopo_banco(), _versao_tabelas(*tabelas))
+
+    with _lock_graficos:
+        if chave in _cache_graficos:
+            _cache_graficos.move_to_end(chave)
+            return _cache_graficos[chave]
+
+    # O pyplot guarda estado global: com carregar_em_paralelo, um gráfico por vez
+    with _lock_desenho:
+        fig = gerar()
+        imagem = fig if isinstance(fig, str) else _rasterizar(fig, formato)
+
+    with _lock_graficos:
+        # Versões antigas do mesmo gráfico nunca mais serão pedidas
+        for antiga in [c for c in _cache_graficos if c[:3] == chave[:3]]:
+            del _cache_graficos[antiga]
+        _cache_graficos[chave] = imagem
+        while len(_cache_graficos) > TAMANHO_CACHE_GRAFICOS:
+            _cache_graficos.popitem(last=False)
+    return imagem
+
+# ----------------------------------------CARGA PARALELA DAS PÁGINAS---------------------------------------------------
+# Cada página declara as consultas independentes de que precisa e elas rodam ao
+# mesmo tempo, cada uma com sua conexão somente leitura do pool: a página passa a
+# esperar pela consulta mais lenta, não pela soma de todas. O sqlite3 libera o GIL
+# enquanto o SQLite executa, então as threads realmente se sobrepõem.
+THREADS_CARGA = TAMANHO_POOL_LEITURA  # Mais threads que conexões de leitura só esperariam no pool
+
+_executores = {}  # nome -> ThreadPoolExecutor
+_lock_executores = threading.Lock()
+_dentro_da_carga = contextvars.ContextVar("dentro_da_carga", default=False)
+
+def _executor(nome="carga_pagina", threads=THREADS_CARGA):
+    import concurrent.futures  # só quando a primeira página carrega em paralelo (~15 ms no import)
+    executor = _executores.get(nome)
+    if executor is None:
+        with _lock_executores:
+            executor = _executores.get(nome)
+            if executor is None:
+                executor = _executores[nome] = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=threads, thread_name_prefix=nome)
+    return executor
+
+def _executar_tarefa(tarefa):
+    _dentro_da_carga.set(True)
+    return tarefa()
+
+def carregar_em_paralelo(tarefas):
+    """
+    Recebe {nome: função sem argumentos} (use lambda/functools.partial para os
+    parâmetros), roda as funções em paralelo e devolve {nome: resultado} quando
+    todas terminarem. Se alguma falhar, a primeira exceção (na ordem do dict) é
+    relançada depois que as outras acabarem. A página instrumentada do chamador
+    (pagina_instrumentada) vale dentro das threads. Chamado de dentro de uma
+    tarefa, roda em série, para não esperar por threads do próprio executor.
+    """
+    if len(tarefas) <= 1 or _dentro_da_carga.get():
+        return {nome: tarefa() for nome, tarefa in tarefas.items()}
+
+    futuros = {
+        nome: _executor().submit(contextvars.copy_context().run, _executar_tarefa, tarefa)
+        for nome, tarefa in tarefas.items()
+    }
+    for futuro in futuros.values():
+        futuro.exception()  # espera todas, inclusive as que falharam
+    return {nome: futuro.result() for nome, futuro in futuros.items()}
+
+# ----------------------------------------DATAFRAMES DO MÓDULO---------------------------------------------------
+# Os DataFrames que antes eram montados no import (bk.df_planos, bk.df_resumo, ...)
+# agora são carregados na primeira vez que alguém os acessa e ficam guardados no módulo.
+_CARREGADORES_DO_MODULO = {
+    "df_planos":             lambda: pd.DataFrame(catalogo().registros("planos")),
+    "df_exercicios":         lambda: _ler_csv('exercicios.csv'),
+    "df_treinos":            lambda: _ler_csv('treinos.csv'),
+    "df_treino_exercicios":  lambda: _ler_csv('treino_exercicios.csv'),
+    "df_clientes":           carregar_clientes,
+    "df_pagamentos":         _pagamentos_com_ano_mes,
+    "df_resumo":             lambda: calcular_resumo_pagamentos(carregar_pagamentos(), carregar_clientes()),
+    "df_pagamentos_por_mes": _calcular_pagamentos_por_mes,
+    "df_instrutores":        clientes_por_instrutor_com_vazios,
+}
+
+# Recalculados a cada acesso (leitura barata do cubo / do catálogo), para nunca ficarem defasados
+_SEMPRE_ATUAIS = {"df_pagamentos_por_mes", "df_planos"}
+
+def __getattr__(nome):
+    carregador = _CARREGADORES_DO_MODULO.get(nome)
+    if carregador is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+    valor = carregador()
+    if nome not in _SEMPRE_ATUAIS:
+        globals()[nome] = valor
+    return valor
+
+if __name__ == "__main__":
+    inicializar_banco()
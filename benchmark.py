@@ -0,0 +1,406 @@
+"""
+Medições de desempenho do backend, com saída em JSON.
+
+Uso:
+    python benchmark.py startup [--repeticoes N]
+    python benchmark.py gerar --clientes N [--saida bench_N.db] [--semente S] [--substituir]
+    python benchmark.py suite --banco ARQUIVO [--repeticoes N] [--saida resultados.json]
+    python benchmark.py comparar ANTES.json DEPOIS.json
+
+`gerar` cria um banco sintético determinístico (mesma semente e mesma data de
+referência -> mesmo banco) com treinos, exercícios de treino e pagamentos
+proporcionais ao número de clientes. `suite` cronometra as funções públicas do
+backend numa cópia desse banco (os escritores não alteram o original) e
+`comparar` mostra a razão entre as medianas de duas execuções.
+"""
+import argparse
+import datetime
+import importlib
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PASTA = Path(__file__).resolve().parent
+
+_CODIGO_IMPORT = (
+    "import time; t = time.perf_counter(); import backend; "
+    "print(time.perf_counter() - t)"
+)
+
+def medir_startup(repeticoes=5):
+    """
+    Mede o tempo de `import backend` em um processo novo (partida a frio) e o
+    tempo de importlib.reload (o que o Streamlit faz quando o script muda).
+    """
+    frio = []
+    for _ in range(repeticoes):
+        saida = subprocess.run(
+            [sys.executable, "-c", _CODIGO_IMPORT],
+            capture_output=True, text=True, check=True,
+        )
+        frio.append(float(saida.stdout.strip().splitlines()[-1]))
+
+    import backend
+    reload = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        importlib.reload(backend)
+        reload.append(time.perf_counter() - inicio)
+
+    return {
+        "import_frio_ms": _resumo_ms(frio),
+        "reload_ms": _resumo_ms(reload),
+    }
+
+def _resumo_ms(tempos):
+    return {
+        "mediana": round(statistics.median(tempos) * 1000, 2),
+        "min": round(min(tempos) * 1000, 2),
+        "max": round(max(tempos) * 1000, 2),
+        "n": len(tempos),
+    }
+
+# ----------------------------------------GERADOR SINTÉTICO---------------------------------------------------
+PRIMEIROS_NOMES = ["Ana", "João", "Maria", "José", "Lúcia", "Pedro", "Carla", "Rafael", "Beatriz",
+                   "Lucas", "Juliana", "Gabriel", "Fernanda", "Mateus", "Camila", "Bruno", "Larissa",
+                   "Thiago", "Patrícia", "Gustavo", "Aline", "Felipe", "Sofia", "Enzo"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Pereira", "Fogaça", "Lima", "Costa", "Rodrigues",
+              "Almeida", "Nascimento", "Araújo", "Ribeiro", "Carvalho", "Gomes", "Martins", "Rocha"]
+DOMINIOS = ["gmail.com", "hotmail.com", "yahoo.com.br", "outlook.com", "uol.com.br"]
+
+# Banco que o app usa (o mesmo padrão do backend): o gerador nunca escreve nele
+BANCO_DO_APP = os.environ.get("ACADEMIA_DB", "academia_db.db")
+
+# Arquivos de referência (poucas linhas) que vêm do próprio repositório
+CSVS_REFERENCIA = [("instrutores.csv", "instrutores"), ("planos.csv", "planos"), ("exercicios.csv", "exercicios")]
+
+
+def _backend_em(caminho):
+    """Importa o backend apontando os pools para `caminho`."""
+    import backend
+    backend.fechar_conexoes()
+    backend.DB_PATH = str(caminho)
+    return backend
+
+
+def _em_lotes(linhas, tamanho):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) == tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def gerar_banco(clientes, saida=None, semente=42, referencia=None,
+                treinos_por_cliente=2, exercicios_por_treino=4, pagamentos_por_cliente=6,
+                substituir=False):
+    """
+    Gera um banco com `clientes` clientes e, em média, `treinos_por_cliente`
+    treinos, `exercicios_por_treino` exercícios por treino e
+    `pagamentos_por_cliente` pagamentos mensais por cliente, com datas nos dois
+    anos anteriores a `referencia` (padrão: hoje). Planos, instrutores e
+    exercícios vêm dos CSVs do repositório. Grava em `saida` (padrão:
+    bench_<clientes>.db) e se recusa a gravar no banco do app. Retorna a
+    contagem de cada tabela.
+    """
+    saida = Path(saida or f"bench_{clientes}.db")
+    if saida.resolve() in {Path(BANCO_DO_APP).resolve(), (PASTA / "academia_db.db").resolve()}:
+        raise SystemExit(f"{saida} é o banco do app; escolha outra --saida para o banco sintético.")
+    if saida.exists():
+        if not substituir:
+            raise SystemExit(f"{saida} já existe; use --substituir para recriá-lo.")
+        for sufixo in ("", "-wal", "-shm"):
+            Path(f"{saida}{sufixo}").unlink(missing_ok=True)
+
+    referencia = referencia or datetime.date.today()
+    rng = random.Random(semente)
+    bk = _backend_em(saida)
+    bk.migrar_banco()
+    for arquivo, tabela in CSVS_REFERENCIA:
+        bk.importar_csv(str(PASTA / arquivo), tabela)
+
+    with bk._leitura() as conn:
+        planos = conn.execute("SELECT id, preco_mensal, duracao_meses FROM planos ORDER BY id").fetchall()
+        instrutores = [linha[0] for linha in conn.execute("SELECT id FROM instrutores ORDER BY id")]
+        exercicios = conn.execute("SELECT id, nome FROM exercicios ORDER BY id").fetchall()
+
+    # Sorteia tudo de uma vez, na ordem dos clientes, para o resultado só depender da semente
+    inicio_periodo = referencia - datetime.timedelta(days=730)
+    fichas = []  # (plano, instrutor) de cada cliente, na ordem dos ids
+    def linhas_clientes():
+        for i in range(1, clientes + 1):
+            nome = f"{rng.choice(PRIMEIROS_NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+            plano, instrutor = rng.choice(planos), rng.choice(instrutores)
+            fichas.append((plano, instrutor))
+            yield (nome, rng.randint(16, 75), rng.choice(("Masculino", "Feminino")),
+                   f"cliente{i}@{rng.choice(DOMINIOS)}", f"(11) 9{rng.randint(0, 99_999_999):08d}",
+                   plano[0], instrutor)
+
+    def linhas_treinos():
+        for cliente_id, (plano, instrutor) in enumerate(fichas, start=1):
+            quantidade = rng.randint(0, 2 * treinos_por_cliente)
+            for dia in sorted(rng.sample(range(730), quantidade)):
+                data_inicio = inicio_periodo + datetime.timedelta(days=dia)
+                data_fim = bk.relativedelta(months=plano[2]) + data_inicio
+                yield (cliente_id, instrutor, data_inicio.isoformat(), data_fim.isoformat(), plano[0])
+
+    contagem = {}
+    def linhas_treino_exercicios():
+        # O banco é novo, então os treinos têm ids 1..N na ordem em que foram inseridos
+        quantidade = min(exercicios_por_treino, len(exercicios))
+        for treino_id in range(1, contagem["treinos"] + 1):
+            letra = rng.choice("abc")
+            for exercicio_id, nome in rng.sample(exercicios, quantidade):
+                yield (treino_id, letra, exercicio_id, nome, rng.randint(3, 5), rng.choice((8, 10, 12, 15)))
+
+    def linhas_pagamentos():
+        for cliente_id, (plano, _) in enumerate(fichas, start=1):
+            quantidade = rng.randint(1, 2 * pagamentos_por_cliente - 1) if pagamentos_por_cliente else 0
+            primeiro = rng.randint(0, max(0, 24 - quantidade))
+            dia = rng.randint(1, 28)
+            for mes in range(primeiro, primeiro + quantidade):
+                data = inicio_periodo.replace(day=dia) + bk.relativedelta(months=mes)
+                yield (cliente_id, data.isoformat(), float(plano[1]), plano[0])
+
+    cargas = [
+        ("clientes", "INSERT INTO clientes (nome, idade, sexo, email, telefone, plano_id, instrutor_id) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", linhas_clientes),
+        ("treinos", "INSERT INTO treinos (cliente_id, instrutor_id, data_inicio, data_fim, plano_id) "
+                    "VALUES (?, ?, ?, ?, ?)", linhas_treinos),
+        ("treino_exercicios", "INSERT INTO treino_exercicios (treino_id, treino, exercicio_id, exercicio, series, repeticoes) "
+                              "VALUES (?, ?, ?, ?, ?, ?)", linhas_treino_exercicios),
+        ("pagamentos", "INSERT INTO pagamentos (cliente_id, data_pagamento, valor_pago, plano_id) "
+                       "VALUES (?, ?, ?, ?)", linhas_pagamentos),
+    ]
+    for tabela, sql, linhas in cargas:
+        contagem[tabela] = 0
+        for lote in _em_lotes(linhas(), bk.TAMANHO_LOTE_CARGA):
+            with bk._transacao(tabela) as conn:
+                conn.executemany(sql, lote)
+            contagem[tabela] += len(lote)
+
+    with bk._transacao() as conn:
+        conn.execute("ANALYZE")
+    bk.fechar_conexoes()
+    return _contar_tabelas(saida)
+
+
+def _contar_tabelas(caminho):
+    conn = sqlite3.connect(caminho)
+    try:
+        return {tabela: conn.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+                for tabela in ("clientes", "instrutores", "planos", "exercicios",
+                               "treinos", "treino_exercicios", "pagamentos")}
+    finally:
+        conn.close()
+
+# ----------------------------------------SUÍTE---------------------------------------------------
+def _copiar_banco(origem, destino):
+    """Cópia consistente (inclui o que ainda está no WAL) pela API de backup."""
+    fonte, alvo = sqlite3.connect(origem), sqlite3.connect(destino)
+    try:
+        fonte.backup(alvo)
+    finally:
+        fonte.close()
+        alvo.close()
+
+
+def _em_sessoes(chamada, sessoes):
+    """Roda chamada(j) para j em range(sessoes), cada uma numa thread, como sessões simultâneas."""
+    threads = [threading.Thread(target=chamada, args=(j,)) for j in range(sessoes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _casos(bk):
+    """
+    Lista de (nome, chamada, preparar). `chamada(i)` recebe o número da
+    repetição (para os escritores não repetirem dados); `preparar()` roda antes
+    de cada repetição, fora do cronômetro.
+    """
+    invalidar = lambda: bk._marcar_escrita(*bk.TABELAS, bk.TABELA_COPIA)  # mede o caminho sem cache (consultas, KPIs, gráficos)
+    nada = lambda: None
+
+    cat = bk.catalogo()
+    plano = cat.nomes("planos")[0]
+    instrutor = cat.nomes("instrutores")[0]
+    exercicio = cat.nomes("exercicios")[0]
+    cliente = cat.registros("clientes")[0]["nome"]
+    with bk._leitura() as conn:
+        treino_id, treino_data = conn.execute(
+            "SELECT id, data_inicio FROM treinos ORDER BY id LIMIT 1").fetchone()
+        treinos_modelo = [linha[0] for linha in conn.execute("SELECT id FROM treinos ORDER BY id LIMIT 50")]
+    # Cada repetição aplica um modelo com repetições inéditas, para todas as linhas serem novas
+    contador_modelo = itertools.count(3000)
+    exercicios_modelo = cat.nomes("exercicios")[:8]
+    novo_modelo = lambda: bk.salvar_modelo_treino(
+        "Modelo bench", [(nome, 4, next(contador_modelo)) for nome in exercicios_modelo])
+    pagamentos = bk.carregar_pagamentos().head(100_000)
+    pagamentos["data_pagamento"] = pagamentos["data_pagamento"].dt.strftime("%Y-%m-%d")
+    base = datetime.date(2100, 1, 1)
+    dia = lambda i, extra=0: base + datetime.timedelta(days=i * 1000 + extra)
+
+    casos = [
+        ("get_kpis_dashboard", lambda i: bk.get_kpis_dashboard(), invalidar),
+        ("get_kpis_dashboard_cache", lambda i: bk.get_kpis_dashboard(), nada),
+        ("get_receita_por_mes", lambda i: bk.get_receita_por_mes(), invalidar),
+        ("receita_cubo_mes_plano_instrutor", lambda i: bk.receita_cubo(["mes", "plano", "instrutor"]), invalidar),
+        ("listar_treinos_com_exercicios", lambda i: bk.listar_treinos_com_exercicios(), invalidar),
+        ("listar_treinos_paginado", lambda i: bk.listar_treinos_paginado(), invalidar),
+        ("carregar_pagamentos", lambda i: bk.carregar_pagamentos(), invalidar),
+        ("calcular_resumo_pagamentos",
+         lambda i: bk.calcular_resumo_pagamentos(bk.carregar_pagamentos(), bk.get_clientes()), invalidar),
+        ("resumo_pagamentos_paginado", lambda i: bk.resumo_pagamentos_paginado(), invalidar),
+        ("carregar_clientes", lambda i: bk.carregar_clientes(), invalidar),
+        ("get_clientes", lambda i: bk.get_clientes(), invalidar),
+        ("clientes_planos", lambda i: bk.clientes_planos(plano), invalidar),
+        ("clientes_planos_cache", lambda i: bk.clientes_planos(plano), nada),
+        ("clientes_instrutor", lambda i: bk.clientes_instrutor(instrutor), invalidar),
+        ("clientes_por_instrutor_com_vazios", lambda i: bk.clientes_por_instrutor_com_vazios(), invalidar),
+        ("get_treinos_por_cliente", lambda i: bk.get_treinos_por_cliente(cliente), invalidar),
+        ("catalogo_recarga", lambda i: [cat.registros(t) for t in cat._CONSULTAS], invalidar),
+        ("buscar_clientes", lambda i: bk.buscar_clientes("ana sil"), nada),
+        ("buscar_global", lambda i: bk.buscar("ana sil"), nada),
+        ("filter_novos_pagamentos",
+         lambda i: bk.filter_novos(pagamentos, ["cliente_id", "data_pagamento", "valor_pago", "plano_id"], "pagamentos"),
+         nada),
+        ("novo_cliente",
+         lambda i: bk.novo_cliente(f"Bench {i}", 30, "Feminino", f"bench{i}.{time.time_ns()}@exemplo.com",
+                                   "(11) 90000-0000", plano, instrutor), nada),
+        ("novo_pagamento", lambda i: bk.novo_pagamento(cliente, plano, dia(i)), nada),
+        ("registrar_pagamentos_lote_100",
+         lambda i: bk.registrar_pagamentos_lote([(cliente, plano, dia(i, 1 + j)) for j in range(100)]), nada),
+        ("novo_pagamento_50_sessoes",
+         lambda i: _em_sessoes(lambda j: bk.novo_pagamento(cliente, plano, dia(i, 200 + j)), 50), nada),
+        ("novo_treino", lambda i: bk.novo_treino(cliente, dia(i)), nada),
+        ("novo_exercicio", lambda i: bk.novo_exercicio(f"Exercício bench {i} {time.time_ns()}", "Peito"), nada),
+        ("novo_treino_exercicio",
+         lambda i: bk.novo_treino_exercicio(treino_data, "a", exercicio, 3, 1000 + i), nada),
+        ("adicionar_exercicio_treino",
+         lambda i: bk.adicionar_exercicio_treino(treino_id, exercicio, 4, 2000 + i), nada),
+        ("aplicar_modelo_treino_50", lambda i: bk.aplicar_modelo_treino("Modelo bench", treinos_modelo), novo_modelo),
+    ]
+    casos += [(f"grafico_{nome}", (lambda nome: lambda i: bk.grafico_imagem(nome))(nome), invalidar)
+              for nome in bk._GRAFICOS]
+    return casos
+
+
+def rodar_suite(banco, repeticoes=5, filtro=None):
+    """
+    Cronometra cada caso `repeticoes` vezes numa cópia temporária de `banco` e
+    retorna {meta, resultados}; os tempos vêm em ms (mediana, min, max, n).
+    """
+    with tempfile.TemporaryDirectory() as pasta:
+        copia = Path(pasta) / "bench.db"
+        _copiar_banco(banco, copia)
+        bk = _backend_em(copia)
+        bk.migrar_banco()
+
+        resultados = {}
+        for nome, chamada, preparar in _casos(bk):
+            if filtro and filtro not in nome:
+                continue
+            tempos, falhas = [], 0
+            for i in range(repeticoes):
+                preparar()
+                inicio = time.perf_counter()
+                retorno = chamada(i)
+                tempos.append(time.perf_counter() - inicio)
+                # Escritor que devolveu erro mediu o caminho errado: fica registrado no JSON
+                falhas += isinstance(retorno, dict) and retorno.get("status") in ("erro", "error")
+            resultados[nome] = _resumo_ms(tempos)
+            if falhas:
+                resultados[nome]["falhas"] = falhas
+        bk.fechar_conexoes()
+
+    return {
+        "meta": {
+            "banco": str(banco),
+            "tabelas": _contar_tabelas(banco),
+            "repeticoes": repeticoes,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform(),
+            "data": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+        "resultados": resultados,
+    }
+
+
+def comparar(antes, depois):
+    """Razão depois/antes das medianas de cada caso presente nos dois arquivos."""
+    a = json.loads(Path(antes).read_text(encoding="utf-8"))["resultados"]
+    b = json.loads(Path(depois).read_text(encoding="utf-8"))["resultados"]
+    return {
+        nome: {
+            "antes_ms": a[nome]["mediana"],
+            "depois_ms": b[nome]["mediana"],
+            "razao": round(b[nome]["mediana"] / a[nome]["mediana"], 3) if a[nome]["mediana"] else None,
+        }
+        for nome in a if nome in b
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_startup = sub.add_parser("startup", help="tempo de import/reload do backend")
+    p_startup.add_argument("--repeticoes", type=int, default=5)
+
+    p_gerar = sub.add_parser("gerar", help="gera um banco sintético")
+    p_gerar.add_argument("--clientes", type=int, required=True)
+    p_gerar.add_argument("--saida", help="arquivo do banco gerado (padrão: bench_<clientes>.db)")
+    p_gerar.add_argument("--semente", type=int, default=42)
+    p_gerar.add_argument("--referencia", type=datetime.date.fromisoformat, default=None,
+                         help="data AAAA-MM-DD em torno da qual as datas são geradas (padrão: hoje)")
+    p_gerar.add_argument("--treinos-por-cliente", type=int, default=2)
+    p_gerar.add_argument("--exercicios-por-treino", type=int, default=4)
+    p_gerar.add_argument("--pagamentos-por-cliente", type=int, default=6)
+    p_gerar.add_argument("--substituir", action="store_true", help="apaga a saída se já existir")
+
+    p_suite = sub.add_parser("suite", help="cronometra as funções públicas do backend")
+    p_suite.add_argument("--banco", default=os.environ.get("ACADEMIA_DB", "academia_db.db"))
+    p_suite.add_argument("--repeticoes", type=int, default=5)
+    p_suite.add_argument("--filtro", help="só os casos cujo nome contém este texto")
+    p_suite.add_argument("--saida", help="grava o JSON neste arquivo além de imprimir")
+
+    p_comparar = sub.add_parser("comparar", help="compara dois JSON gerados por `suite`")
+    p_comparar.add_argument("antes")
+    p_comparar.add_argument("depois")
+    args = parser.parse_args(argv)
+
+    if args.comando == "startup":
+        resultado = medir_startup(args.repeticoes)
+    elif args.comando == "gerar":
+        inicio = time.perf_counter()
+        tabelas = gerar_banco(args.clientes, args.saida, args.semente, args.referencia,
+                              args.treinos_por_cliente, args.exercicios_por_treino,
+                              args.pagamentos_por_cliente, args.substituir)
+        resultado = {"saida": args.saida or f"bench_{args.clientes}.db", "tabelas": tabelas,
+                     "segundos": round(time.perf_counter() - inicio, 2)}
+    elif args.comando == "suite":
+        resultado = rodar_suite(args.banco, args.repeticoes, args.filtro)
+    else:
+        resultado = comparar(args.antes, args.depois)
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if getattr(args, "saida", None) and args.comando == "suite":
+        Path(args.saida).write_text(texto, encoding="utf-8")
+    print(texto)
+
+if __name__ == "__main__":
+    main()
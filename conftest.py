@@ -0,0 +1,19 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+import backend as bk
+
+PASTA = Path(__file__).resolve().parent
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Cópia migrada do banco de exemplo, usada como DB_PATH durante o teste."""
+    caminho = tmp_path / "academia_db.db"
+    shutil.copy(PASTA / "academia_db.db", caminho)
+    monkeypatch.setattr(bk, "DB_PATH", str(caminho))
+    bk.migrar_banco()
+    yield str(caminho)
+    bk.fechar_conexoes()
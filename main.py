@@ -1,3 +1,4 @@
+import datetime
 import streamlit as st
 import pandas as pd
 import backend as bk  
@@ -5,37 +6,118 @@ import backend as bk
 # Configuração inicial da página Streamlit
 st.set_page_config(page_title="Sistema de Academia Senai", layout="wide")
 
+# Cria as tabelas e importa os CSVs uma única vez por processo do servidor
+# (o import do backend não faz mais nada disso)
+@st.cache_resource
+def inicializar_backend():
+    bk.inicializar_banco()
+    bk.inicializar_unidades()  # Bancos das unidades (filiais), quando configuradas
+
+inicializar_backend()
+
+# Exibe um gráfico já renderizado pelo backend (em cache até os dados mudarem);
+# `imagem` é o resultado de bk.grafico_imagem, quando já veio da carga da página
+def exibir_grafico(nome, imagem=None):
+    if imagem is None:
+        imagem = bk.grafico_imagem(nome)
+    if isinstance(imagem, str):
+        st.warning(imagem)
+    else:
+        st.image(imagem)
+
+# Tabela paginada no servidor: a sessão guarda a pilha de cursores (chave da
+# última linha de cada página) e recomeça quando os filtros mudam.
+# cursor_paginado devolve o `apos` da página atual; exibir_pagina mostra a página buscada
+def cursor_paginado(chave, **filtros):
+    estado = st.session_state.get(chave)
+    if estado is None or estado["filtros"] != filtros:
+        estado = st.session_state[chave] = {"filtros": filtros, "cursores": [None]}
+    return estado["cursores"][-1]
+
+def exibir_pagina(chave, pagina):
+    cursores = st.session_state[chave]["cursores"]
+    st.dataframe(pagina.dados, use_container_width=True)
+
+    inicio = (len(cursores) - 1) * bk.TAMANHO_PAGINA
+    col1, col2, col3 = st.columns([1, 2, 1])
+    if col1.button("⬅️ Anterior", key=f"{chave}_anterior", disabled=len(cursores) == 1):
+        cursores.pop()
+        st.rerun()
+    col2.caption(f"Linhas {min(inicio + 1, pagina.total)}–{inicio + len(pagina.dados)} de {pagina.total}")
+    if col3.button("Próxima ➡️", key=f"{chave}_proxima", disabled=pagina.proximo is None):
+        cursores.append(pagina.proximo)
+        st.rerun()
+
+# Seletor de cliente com busca no backend: mostra só os melhores resultados
+# para o texto digitado (nome, email ou telefone) em vez da lista inteira.
+# Retorna o id escolhido, ou None ("Todos" / nenhum resultado)
+def selecionar_cliente(rotulo, chave, permitir_todos=False):
+    busca = st.text_input(f"Buscar {rotulo.rstrip(':').lower()}", key=f"{chave}_busca",
+                          placeholder="Nome, email ou telefone")
+    if busca.strip():
+        ids = [c["id"] for c in bk.buscar_clientes(busca)]
+    else:
+        ids = [c["id"] for c in bk.catalogo().registros("clientes")[:bk.LIMITE_BUSCA_CLIENTES]]
+    rotulos = bk.rotulos_clientes()
+    if permitir_todos:
+        ids = [None] + ids
+    elif not ids:
+        st.warning("Nenhum cliente encontrado.")
+        return None
+    return st.selectbox(rotulo, ids, key=chave,
+                        format_func=lambda id_cliente: "Todos" if id_cliente is None else rotulos[id_cliente])
+
+# Converte o valor de um st.date_input de período em (início, fim), ou (None, None)
+def periodo_escolhido(valor):
+    if isinstance(valor, (list, tuple)) and len(valor) == 2:
+        return valor[0], valor[1]
+    return None, None
+
+# Legenda dos relatórios lidos da cópia analítica: de quando são os dados
+def legenda_copia_analitica():
+    estado = bk.estado_copia_analitica()
+    if estado is not None:
+        st.caption(f"Dados de {estado['criada_as']:%H:%M:%S} (atualizados em até {estado['limite_seg']} s).")
+
 # Configuração inicial da página Streamlit
 def pagina_dashboard():
     st.title("💪 Sistema de Academia Senai")
     st.subheader(f"Bem-vindo {st.session_state.username} ao sistema de gestão de academia!")
     st.divider()
 
-    # Dados
-    total_clientes        = bk.get_total_clientes()
-    total_planos          = bk.get_total_planos()
-    total_pagamentos      = bk.get_total_pagamentos_mes()
-    media_idade_clientes  = bk.get_media_idade_clientes()
-    clientes_ativos_reais = bk.get_clientes_ativos()
-    receita_mes_atual     = bk.get_receita_mes_atual()
-    novos_30dias          = bk.get_novos_clientes_30dias()
-    top1_plano_list       = bk.get_top1_plano()
+    # Dados da página, carregados em paralelo — os KPIs vêm de uma única consulta
+    # (em cache no backend) e o detalhamento da receita já vem nas duas dimensões.
+    # Na visão da rede, KPIs, receita e clientes por plano juntam todas as unidades
+    rede = bk.unidade_atual() == bk.REDE
+    tarefas = {
+        "kpis": bk.get_kpis_dashboard,
+        "receita_mes": bk.get_receita_por_mes,
+        "plano": lambda: bk.receita_cubo(["mes", "plano"]),
+        "instrutor": lambda: bk.receita_cubo(["mes", "instrutor"]),
+    }
+    if rede:
+        tarefas["clientes_por_plano"] = lambda: bk.grafico_imagem("clientes_por_plano")
+    else:
+        tarefas["retencao"] = lambda: bk.grafico_imagem("retencao")
+        tarefas["linha_ativos"] = bk.linha_ativos  # Só deixa pronta (em cache) a linha do tempo de ativos
+    dados = bk.carregar_em_paralelo(tarefas)
+    kpis = dados["kpis"]
 
     # Layout com 4 colunas para mostrar métricas em cards
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Clientes Ativos",       f"{total_clientes}")
-    col2.metric("Planos Ativos",         f"{total_planos}")
-    col3.metric("Novos (Últimos 30 dias)", f"{novos_30dias}")
-    col4.metric("Clientes c/ Treino Ativo", f"{clientes_ativos_reais}")
+    col1.metric("Clientes Ativos",       f"{kpis.total_clientes}")
+    col2.metric("Planos Ativos",         f"{kpis.total_planos}")
+    col3.metric("Novos (Últimos 30 dias)", f"{kpis.novos_30dias}")
+    col4.metric("Clientes c/ Treino Ativo", f"{kpis.clientes_ativos}")
 
     col5, col6, col7, col8 = st.columns(4)
-    col5.metric("Média de Idade",        f"{media_idade_clientes:.1f}")
-    col6.metric("Receita em Jun/2025",   f"R$ {receita_mes_atual:,.2f}")
-    col7.metric("Pagamentos Neste Mês",  f"{total_pagamentos}")
+    col5.metric("Média de Idade",        f"{kpis.media_idade:.1f}")
+    col6.metric(f"Receita em {kpis.referencia:%m/%Y}", f"R$ {kpis.receita_mes:,.2f}")
+    col7.metric("Pagamentos Neste Mês",  f"{kpis.pagamentos_mes}")
     
     # Se existe um plano mais usado, mostra o nome, senão um traço
-    if top1_plano_list:
-        nome_plano_mais, _ = top1_plano_list[0]
+    if kpis.top1_plano:
+        nome_plano_mais, _ = kpis.top1_plano[0]
         col8.metric("Plano mais utilizado", nome_plano_mais)
     else:
         col8.metric("Plano mais utilizado", "—")
@@ -43,17 +125,55 @@ def pagina_dashboard():
     st.divider()
 
     # Carrega dados para gráfico de receita por mês
-    df_receita_mes = bk.get_receita_por_mes()
+    df_receita_mes = dados["receita_mes"]
     if not df_receita_mes.empty:
         df_receita_mes["mes"] = pd.to_datetime(df_receita_mes["mes"], format="%Y-%m")
         df_receita_mes = df_receita_mes.set_index("mes")
         st.subheader("📈 Evolução da Receita Mensal")
         st.line_chart(df_receita_mes["total"])
+
+        # Detalhamento da receita pelo cubo (mês x plano x instrutor)
+        dimensao = st.radio("Detalhar receita por:", ["Plano", "Instrutor"], horizontal=True)
+        df_detalhe = dados[dimensao.lower()]
+        df_detalhe = df_detalhe.pivot(index="mes", columns=dimensao.lower(), values="total").fillna(0)
+        st.bar_chart(df_detalhe)
     else:
         st.write("Ainda não há dados de pagamentos para gerar o gráfico de receita.")
 
     st.divider()
 
+    if rede:
+        st.subheader("🏷️ Clientes por Plano na Rede")
+        exibir_grafico("clientes_por_plano", dados["clientes_por_plano"])
+        st.info("Clientes ativos por dia e retenção por coorte são exibidos por unidade.")
+        return
+
+    # Clientes ativos por dia no período escolhido (todos os dias saem de uma única varredura no backend)
+    st.subheader("📅 Clientes Ativos por Dia")
+    hoje = datetime.date.today()
+    col_periodo, col_divisao = st.columns([2, 1])
+    inicio, fim = periodo_escolhido(col_periodo.date_input(
+        "Período:", (hoje - datetime.timedelta(days=365), hoje), key="periodo_ativos"))
+    divisao = col_divisao.radio("Dividir por:", ["Total", "Plano", "Instrutor"], horizontal=True, key="divisao_ativos")
+    if inicio is not None:
+        st.line_chart(bk.ativos_por_dia(inicio, fim, None if divisao == "Total" else divisao.lower()))
+        legenda_copia_analitica()
+
+    st.divider()
+
+    # Retenção por coorte: % dos clientes de cada mês de entrada que ainda pagam N meses depois
+    st.subheader("🔁 Retenção por Coorte")
+    origem = st.radio("Coorte pelo primeiro:", ["Pagamento", "Treino"], horizontal=True, key="origem_coorte")
+    if origem == "Pagamento":
+        exibir_grafico("retencao", dados["retencao"])
+    else:
+        exibir_grafico("retencao_treinos")
+    if st.checkbox("Ver matriz de retenção"):  # Só calcula a matriz quando pedida
+        st.dataframe(bk.retencao_coortes("pagamentos" if origem == "Pagamento" else "treinos").round(1),
+                     use_container_width=True)
+
+    st.divider()
+
 # Função que renderiza a página de Clientes filtrados por Plano
 def pagina_clientes_por_plano():
     st.title("🏋️‍♂️ CLIENTES POR PLANO")
@@ -65,17 +185,20 @@ def pagina_clientes_por_plano():
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("VISUALIZAÇÃO TABULAR")
-        plano = st.selectbox('Nome plano:', bk.df_planos['nome']) # Dropdown para escolher plano
-        df_filtro_planos = bk.clientes_planos(plano) # Busca clientes com o plano selecionado
-        st.dataframe(df_filtro_planos) # Exibe a tabela filtrada
+        plano = st.selectbox('Nome plano:', bk.catalogo().nomes("planos")) # Dropdown para escolher plano
+
+    # Clientes do plano e gráfico são buscados ao mesmo tempo
+    dados = bk.carregar_em_paralelo({
+        "clientes": lambda: bk.clientes_planos(plano),
+        "grafico": lambda: bk.grafico_imagem("clientes_por_plano"),
+    })
+
+    with col1:
+        st.dataframe(dados["clientes"]) # Exibe a tabela filtrada
 
     with col2:
         st.subheader("VISUALIZAÇÃO GRÁFICA")
-        fig = bk.grafico_clientes_por_plano() # Gera gráfico pelo backend
-        if isinstance(fig, str):
-            st.warning(fig)
-        else:
-            st.pyplot(fig) # Exibe gráfico
+        exibir_grafico("clientes_por_plano", dados["grafico"]) # Gráfico gerado (e guardado em cache) pelo backend
 
 # Função que exibe página de Treinos e exercícios
 def pagina_treinos():
@@ -88,25 +211,41 @@ def pagina_treinos():
 
     with col1:
         st.subheader("VISUALIZAÇÃO TABULAR")
-        df_treinos_ex = bk.listar_treinos_com_exercicios()
+        catalogo = bk.catalogo()
+        grupos = sorted({ex["grupo_muscular"] for ex in catalogo.registros("exercicios")})
+
+        # Filtros aplicados no banco; a tabela vem página por página
+        f1, f2 = st.columns(2)
+        with f1:
+            cliente_id = selecionar_cliente("Filtrar por cliente:", "filtro_treinos_cliente", permitir_todos=True)
+        instrutor_selecionado = f2.selectbox("Filtrar por instrutor:", ["Todos"] + catalogo.nomes("instrutores"))
+        f3, f4 = st.columns(2)
+        grupo_selecionado = f3.selectbox("Grupo muscular:", ["Todos"] + grupos, key="filtro_treinos_grupo")
+        data_inicio, data_fim = periodo_escolhido(f4.date_input("Início do treino entre:", value=[]))
+
+        instrutor = catalogo.buscar("instrutores", instrutor_selecionado) if instrutor_selecionado != "Todos" else None
+
+        filtros = dict(
+            cliente_id=cliente_id,
+            instrutor_id=instrutor["id"] if instrutor else None,
+            grupo_muscular=grupo_selecionado if grupo_selecionado != "Todos" else None,
+            data_inicio=data_inicio,
+            data_fim=data_fim,
+        )
+        apos = cursor_paginado("paginas_treinos", **filtros)
+
+    # Página da tabela e gráfico são buscados ao mesmo tempo
+    dados = bk.carregar_em_paralelo({
+        "pagina": lambda: bk.listar_treinos_paginado(apos=apos, **filtros),
+        "grafico": lambda: bk.grafico_imagem("treinos_por_cliente"),
+    })
 
-        if df_treinos_ex.empty:
-            st.warning("Nenhum treino com exercício encontrado.")
-        else:
-            clientes = df_treinos_ex['Cliente'].unique().tolist()
-            cliente_selecionado = st.selectbox("Filtrar por cliente:", ["Todos"] + clientes)
-
-            # Filtra treinos pelo cliente selecionado ou mostra todos
-            if cliente_selecionado != "Todos":
-                df_filtrado = df_treinos_ex[df_treinos_ex["Cliente"] == cliente_selecionado]
-            else:
-                df_filtrado = df_treinos_ex
+    with col1:
+        exibir_pagina("paginas_treinos", dados["pagina"])
 
-            st.dataframe(df_filtrado, use_container_width=True) # Mostra tabela
-    
     with col2:
         st.subheader("VISUALIZAÇÃO GRÁFICA")
-        st.pyplot(bk.grafico_treinos_por_cliente()) # Gráfico de treinos por cliente
+        exibir_grafico("treinos_por_cliente", dados["grafico"]) # Gráfico de treinos por cliente
 
 # Função que mostra página de Pagamentos
 def pagina_pagamentos():
@@ -114,49 +253,57 @@ def pagina_pagamentos():
     st.subheader('A página Pagamentos exibe a lista de pagamentos e permite filtrar por cliente, mostrando métricas e gráficos de desempenho.')
     st.divider()
 
-    df_pagamentos = bk.carregar_pagamentos()
-    conn = bk.get_connection()
-    df_clientes = bk.get_clientes()
-    conn.close()
-
-    # Cria resumo dos pagamentos juntando dados
-    df_resumo = bk.calcular_resumo_pagamentos(df_pagamentos, df_clientes)
-
-    df_para_exibir = df_resumo.copy()
-    df_para_exibir["ultimo_pagamento"] = (
-        df_para_exibir["ultimo_pagamento"]
-        .dt.strftime("%d/%m/%Y")
-        .fillna("")
-    )
+    catalogo = bk.catalogo()
 
     st.subheader("🔍 Filtrar por Cliente")
 
-    # Dropdown para escolher cliente pelo id, mostrando o nome no menu
-    cliente_id = st.selectbox(
-        "Selecione o Cliente",
-        df_resumo["cliente_id"],
-        format_func=lambda x: df_resumo[df_resumo["cliente_id"] == x]["cliente_nome"].values[0]
-    )
+    # Busca o cliente pelo índice do backend (id no valor, nome de exibição no menu)
+    cliente_id = selecionar_cliente("Selecione o Cliente", "pagamentos_cliente")
 
-    cliente = df_resumo[df_resumo["cliente_id"] == cliente_id].iloc[0]
-
-    # Exibe métricas do cliente selecionado
-    col1, col2, col3, col4 = st.columns(4)
-    col1.metric(label="Nome", value=cliente["cliente_nome"])
-    col2.metric(label="Cliente ID", value=str(cliente_id))
-    col3.metric(label="Total Pago", value=f"R$ {cliente['total_pago']:,.2f}")
-    # Verifica se existe data de último pagamento para exibir
-    if pd.isna(cliente["ultimo_pagamento"]):
-        col4.metric(label="Último Pagamento", value="—")
-    else:
-        data_str = cliente["ultimo_pagamento"].date().strftime("%d/%m/%Y")
-        col4.metric(label="Último Pagamento", value=data_str)
+    area_metricas = st.container()  # preenchida depois que os dados chegarem
 
     st.subheader("📋 Pagamentos por Cliente")
-    st.dataframe(df_para_exibir.sort_values("cliente_id"), use_container_width=True)
+    f1, f2 = st.columns(2)
+    instrutor_selecionado = f1.selectbox("Instrutor:", ["Todos"] + catalogo.nomes("instrutores"))
+    data_inicio, data_fim = periodo_escolhido(f2.date_input("Pagamentos entre:", value=[]))
+    instrutor = catalogo.buscar("instrutores", instrutor_selecionado) if instrutor_selecionado != "Todos" else None
+
+    filtros = dict(
+        instrutor_id=instrutor["id"] if instrutor else None,
+        data_inicio=data_inicio,
+        data_fim=data_fim,
+    )
+    apos = cursor_paginado("paginas_resumo_pagamentos", **filtros)
+
+    # Resumo do cliente, página da tabela e gráfico são buscados ao mesmo tempo
+    tarefas = {
+        "pagina": lambda: bk.resumo_pagamentos_paginado(apos=apos, **filtros),
+        "grafico": lambda: bk.grafico_imagem("pagamentos"),
+    }
+    if cliente_id is not None:
+        # Resumo só do cliente escolhido (uma linha, direto do banco)
+        tarefas["cliente"] = lambda: bk.resumo_pagamentos_paginado(cliente_id=cliente_id, tamanho=1)
+    dados = bk.carregar_em_paralelo(tarefas)
+
+    if cliente_id is not None:
+        cliente = dados["cliente"].dados.iloc[0]
+
+        # Exibe métricas do cliente selecionado
+        col1, col2, col3, col4 = area_metricas.columns(4)
+        col1.metric(label="Nome", value=cliente["cliente_nome"])
+        col2.metric(label="Cliente ID", value=str(cliente_id))
+        col3.metric(label="Total Pago", value=f"R$ {cliente['total_pago']:,.2f}")
+        # Verifica se existe data de último pagamento para exibir
+        if pd.isna(cliente["ultimo_pagamento"]):
+            col4.metric(label="Último Pagamento", value="—")
+        else:
+            data_str = cliente["ultimo_pagamento"].date().strftime("%d/%m/%Y")
+            col4.metric(label="Último Pagamento", value=data_str)
+
+    exibir_pagina("paginas_resumo_pagamentos", dados["pagina"])
 
     st.title("Total de Pagamentos por Mês")
-    st.pyplot(bk.grafico_pagamentos()) # Exibe gráfico de pagamentos por mês
+    exibir_grafico("pagamentos", dados["grafico"]) # Exibe gráfico de pagamentos por mês
 
 # Função que mostra página dos Instrutores e seus clientes
 def pagina_instrutores():
@@ -168,15 +315,67 @@ def pagina_instrutores():
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("VISUALIZAÇÃO TABULAR")
-        df_instrutores = bk.carregar_instrutores()
-        nome_instrutor = st.selectbox('Nome instrutor:', df_instrutores['nome'])
-        df_filtro_instrutor = bk.clientes_instrutor(nome_instrutor)
-        st.dataframe(df_filtro_instrutor)
+        nome_instrutor = st.selectbox('Nome instrutor:', bk.catalogo().nomes("instrutores"), key="instrutor_nome")
+
+    # Clientes do instrutor e gráfico são buscados ao mesmo tempo
+    dados = bk.carregar_em_paralelo({
+        "clientes": lambda: bk.clientes_instrutor(nome_instrutor),
+        "grafico": lambda: bk.grafico_imagem("instrutores"),
+    })
+
+    with col1:
+        st.dataframe(dados["clientes"])
 
     with col2:
         st.subheader("VISUALIZAÇÃO GRÁFICA")
-        st.pyplot(bk.grafico_instrutores())
+        exibir_grafico("instrutores", dados["grafico"])
+
 
+# Página de inadimplência: clientes com mensalidades vencidas e não pagas, em relação ao plano
+def pagina_inadimplentes():
+    st.title("⏰ INADIMPLENTES")
+    st.subheader("A página Inadimplentes lista os clientes com mensalidades em atraso, calculadas a partir do plano e do histórico de pagamentos.")
+    st.divider()
+
+    rotulos_ordem = {
+        "Dias de atraso": "dias_atraso",
+        "Saldo devedor": "saldo_devedor",
+        "Mensalidades pendentes": "pagamentos_pendentes",
+        "Último pagamento": "ultimo_pagamento",
+        "Nome": "cliente_nome",
+    }
+    f1, f2, f3, f4 = st.columns(4)
+    ordem = f1.selectbox("Ordenar por:", list(rotulos_ordem))
+    decrescente = f2.radio("Ordem:", ["Decrescente", "Crescente"], horizontal=True) == "Decrescente"
+    dias_minimos = f3.number_input("Atraso mínimo (dias):", min_value=1, value=1, step=1)
+    limite = f4.selectbox("Mostrar:", [100, 500, 1000, 5000])
+
+    df, resumo = bk.inadimplentes(rotulos_ordem[ordem], decrescente, int(dias_minimos), limite)
+    legenda_copia_analitica()
+
+    col1, col2 = st.columns(2)
+    col1.metric("Clientes em atraso", f"{resumo['clientes']}")
+    col2.metric("Saldo devedor total", f"R$ {resumo['saldo_devedor']:,.2f}")
+
+    st.dataframe(
+        df[["cliente_id", "cliente_nome", "plano", "ultimo_pagamento", "pagamentos_esperados",
+            "pagamentos_recebidos", "pagamentos_pendentes", "dias_atraso", "saldo_devedor"]],
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "cliente_id": "ID",
+            "cliente_nome": "Cliente",
+            "plano": "Plano",
+            "ultimo_pagamento": st.column_config.DateColumn("Último pagamento", format="DD/MM/YYYY"),
+            "pagamentos_esperados": "Esperados",
+            "pagamentos_recebidos": "Recebidos",
+            "pagamentos_pendentes": "Pendentes",
+            "dias_atraso": "Dias de atraso",
+            "saldo_devedor": st.column_config.NumberColumn("Saldo devedor", format="R$ %.2f"),
+        },
+    )
+    if resumo["clientes"] > len(df):
+        st.caption(f"Mostrando {len(df)} de {resumo['clientes']} clientes em atraso.")
 
 # Função que mostra página de formulários para cadastro e atribuição
 def pagina_formularios():
@@ -190,10 +389,14 @@ def pagina_formularios():
         "💰 Pagamentos",
         "🏋️ Treinos",
         "💪 Exercícios",
-        "📝 Atribuir Exercício"
-
+        "📝 Atribuir Exercício",
+        "📋 Modelos de Treino",
     ])
 
+    # Montada antes da aba "Atribuir Exercício", que pode interromper a página com st.stop()
+    with tabs[5]:
+        formulario_modelos_treino()
+
     # Formulário para novo cliente
     with tabs[0]:
         st.subheader("Cliente")
@@ -204,8 +407,8 @@ def pagina_formularios():
             genero = st.selectbox("Gênero", ["Masculino", "Feminino"])
             email = st.text_input("Email")
             telefone = st.text_input("Telefone")
-            plano_option = st.selectbox("Plano", bk.df_planos['nome'].tolist())
-            instrutor_option = st.selectbox("Instrutor", bk.carregar_instrutores()['nome'].tolist())
+            plano_option = st.selectbox("Plano", bk.catalogo().nomes("planos"))
+            instrutor_option = st.selectbox("Instrutor", bk.catalogo().nomes("instrutores"))
             submit_cliente = st.form_submit_button("Registrar Cliente")    
         if submit_cliente:
             resposta = bk.novo_cliente(
@@ -221,33 +424,82 @@ def pagina_formularios():
     with tabs[1]:
         st.subheader("Pagamentos")
         st.write("Aqui você pode registrar um novo pagamento.")
+        # A busca do cliente fica fora do form para os resultados atualizarem ao digitar
+        id_pagamento = selecionar_cliente("Cliente", "form_pagamento_cliente")
         with st.form("form_novo_pagamento"):
-            clientes_atualizados = bk.get_clientes()['nome'].tolist()
-            cliente_pagamento = st.selectbox("Cliente", clientes_atualizados)
-            plano_pagamento = st.selectbox("Plano", bk.df_planos['nome'].tolist())
+            plano_pagamento = st.selectbox("Plano", bk.catalogo().nomes("planos"))
             data_pagamento = st.date_input("Data do Pagamento")
             submit_pagamento = st.form_submit_button("Registrar Pagamento")
         if submit_pagamento:
-            if submit_pagamento:
-                resposta = bk.novo_pagamento(cliente_pagamento, plano_pagamento, data_pagamento)
+            if id_pagamento is None:
+                st.warning("Selecione um cliente.")
+            else:
+                resposta = bk.novo_pagamento(None, plano_pagamento, data_pagamento, cliente_id=id_pagamento)
 
                 if resposta["status"] == "sucesso":
                     st.rerun() # Recarrega página para atualizar dados
                     st.success(resposta["mensagem"])
                 else:
                     st.warning(resposta["mensagem"])
-                   
+
+        # Vários pagamentos de uma vez (ex.: início do mês) — uma linha por pagamento
+        st.divider()
+        st.write("Ou registre vários pagamentos de uma vez:")
+        # Os clientes entram na lista pela busca (por id, que distingue homônimos);
+        # a tabela só edita plano e data e pode remover linhas
+        lote = st.session_state.setdefault("pagamentos_lote", [])
+        id_lote = selecionar_cliente("Cliente do lote", "lote_pagamento_cliente")
+        if st.button("Adicionar à lista", disabled=id_lote is None):
+            if id_lote not in {linha["cliente_id"] for linha in lote}:
+                cliente = bk.catalogo().por_id("clientes", id_lote)
+                plano = bk.catalogo().por_id("planos", cliente["plano_id"])
+                lote.append({"cliente_id": id_lote, "cliente": bk.rotulos_clientes()[id_lote],
+                             "plano": plano["nome"] if plano else None, "data": datetime.date.today()})
+        with st.form("form_pagamentos_lote"):
+            df_lote = st.data_editor(
+                pd.DataFrame(lote, columns=["cliente_id", "cliente", "plano", "data"]),
+                num_rows="dynamic",
+                use_container_width=True,
+                hide_index=True,
+                disabled=["cliente"],
+                column_config={
+                    "cliente_id": None,  # oculta: é o que vai para o backend
+                    "cliente": st.column_config.TextColumn("Cliente"),
+                    "plano": st.column_config.SelectboxColumn("Plano", options=bk.catalogo().nomes("planos"), required=True),
+                    "data": st.column_config.DateColumn("Data do Pagamento", format="DD/MM/YYYY", required=True),
+                },
+            )
+            submit_lote = st.form_submit_button("Registrar Pagamentos")
+        if submit_lote:
+            entradas = [
+                {"cliente_id": None if pd.isna(linha["cliente_id"]) else int(linha["cliente_id"]),
+                 "cliente": linha["cliente"], "plano": linha["plano"],
+                 "data": None if pd.isna(linha["data"]) else pd.Timestamp(linha["data"]).date()}
+                for linha in df_lote.dropna(how="all").to_dict("records")
+            ]
+            if not entradas:
+                st.warning("Nenhum pagamento informado.")
+            else:
+                resposta = bk.registrar_pagamentos_lote(entradas)
+                if resposta["status"] == "sucesso":
+                    st.session_state["pagamentos_lote"] = []
+                    st.success(resposta["mensagem"])
+                else:
+                    st.warning(resposta["mensagem"])
+                st.dataframe(pd.DataFrame(resposta["linhas"])[["cliente", "plano", "data", "status", "mensagem"]])
+
     # Aba treinos — formulário para cadastrar trein
     with tabs[2]:
         st.subheader("Treinos")
         st.write("Aqui você pode registrar um novo treino.")
+        id_treino = selecionar_cliente("Cliente", "form_treino_cliente")
         with st.form("form_novo_treino"):
-            clientes_atualizados = bk.get_clientes()['nome'].tolist()
-            cliente_treino = st.selectbox("Cliente", clientes_atualizados)
             data_treino = st.date_input("Data do Treino")
             submit_treino = st.form_submit_button("Registrar Treino")
-        if submit_treino:
-            novo_treino = bk.novo_treino(cliente_treino, data_treino)
+        if submit_treino and id_treino is None:
+            st.warning("Selecione um cliente.")
+        elif submit_treino:
+            novo_treino = bk.novo_treino(None, data_treino, cliente_id=id_treino)
             if novo_treino['status'] == 'success':
                 st.success("Treino registrado com sucesso!")
             else:
@@ -277,17 +529,16 @@ def pagina_formularios():
         st.subheader("Treinos")
         st.write("Aqui você pode atribuir exercícios aos treinos já cadastrados de um cliente.")
 
-        with st.form("form_atribuir_exercicio"):
-            df_clientes = bk.get_clientes() 
-            lista_clientes = df_clientes["nome"].tolist()
+        # Cliente escolhido fora do form, para a lista de treinos acompanhar a escolha
+        id_atribuir = selecionar_cliente("Selecione o Cliente", "form_atribuir_cliente")
 
-            # Se não há clientes, avisa e para a execução
-            if not lista_clientes:
-                st.warning("Não há clientes cadastrados.")
-                st.stop() 
-            cliente_selecionado = st.selectbox("Selecione o Cliente", lista_clientes)
+        # Se não há clientes, avisa e para a execução
+        if id_atribuir is None:
+            st.stop()
+        cliente_selecionado = bk.catalogo().por_id("clientes", id_atribuir)["nome"]
 
-            df_treinos = bk.get_treinos_por_cliente(cliente_selecionado)
+        with st.form("form_atribuir_exercicio"):
+            df_treinos = bk.get_treinos_por_cliente(cliente_selecionado, cliente_id=id_atribuir)
             if df_treinos.empty:
                 st.warning(f"O cliente '{cliente_selecionado}' não possui treinos cadastrados.")
                 st.stop()
@@ -299,8 +550,7 @@ def pagina_formularios():
             idx = opcoes_treinos.index(treino_escolhido)
             treino_id = int(df_treinos.iloc[idx]["id"])
 
-            df_exs = bk.get_exercicios()
-            lista_exs = df_exs["nome"].tolist()
+            lista_exs = bk.catalogo().nomes("exercicios")
             if not lista_exs:
                 st.warning("Não há exercícios cadastrados.")
                 st.stop()
@@ -318,6 +568,200 @@ def pagina_formularios():
         else:
             st.error(resposta["mensagem"])
 
+# Aba de modelos de treino: monta/edita a lista de exercícios de um modelo e
+# aplica o modelo de uma vez aos treinos em andamento (de um instrutor ou de todos)
+def formulario_modelos_treino():
+    st.subheader("Modelos de Treino")
+    st.write("Aqui você pode montar uma rotina de exercícios e aplicá-la a vários treinos de uma vez.")
+
+    modelos = bk.listar_modelos_treino()
+    nomes_modelos = list(dict.fromkeys(modelos["modelo"]))
+    lista_exs = bk.catalogo().nomes("exercicios")
+
+    escolhido = st.selectbox("Modelo", ["➕ Novo modelo"] + nomes_modelos, key="modelo_editado")
+    novo = escolhido not in nomes_modelos
+    itens = modelos.loc[modelos["modelo"] == escolhido, ["exercicio", "series", "repeticoes"]].dropna()
+    if novo:
+        itens = pd.DataFrame({"exercicio": pd.Series(dtype=object), "series": pd.Series(dtype="Int64"),
+                              "repeticoes": pd.Series(dtype="Int64")})
+
+    with st.form(f"form_modelo_{escolhido}"):
+        nome_modelo = st.text_input("Nome do modelo", value="" if novo else escolhido)
+        editados = st.data_editor(
+            itens.reset_index(drop=True), num_rows="dynamic", use_container_width=True, hide_index=True,
+            column_config={
+                "exercicio": st.column_config.SelectboxColumn("Exercício", options=lista_exs, required=True),
+                "series": st.column_config.NumberColumn("Séries", min_value=1, step=1, default=3, required=True),
+                "repeticoes": st.column_config.NumberColumn("Repetições", min_value=1, step=1, default=10, required=True),
+            },
+        )
+        c1, c2 = st.columns(2)
+        salvar = c1.form_submit_button("Salvar modelo")
+        excluir = c2.form_submit_button("Excluir modelo", disabled=novo)
+    if salvar:
+        resposta = bk.salvar_modelo_treino(nome_modelo, editados.dropna(how="all").to_dict("records"))
+        if resposta["status"] == "sucesso":
+            st.success(resposta["mensagem"])
+        else:
+            st.error(resposta["mensagem"])
+    elif excluir:
+        resposta = bk.excluir_modelo_treino(escolhido)
+        if resposta["status"] == "sucesso":
+            st.success(resposta["mensagem"])
+        else:
+            st.error(resposta["mensagem"])
+
+    if not nomes_modelos:
+        return
+    st.divider()
+    st.write("Aplicar um modelo aos treinos em andamento:")
+    catalogo = bk.catalogo()
+    f1, f2, f3 = st.columns(3)
+    modelo_aplicado = f1.selectbox("Modelo a aplicar", nomes_modelos, key="modelo_aplicado")
+    instrutor_selecionado = f2.selectbox("Instrutor:", ["Todos"] + catalogo.nomes("instrutores"), key="modelo_instrutor")
+    data_vigencia = f3.date_input("Treinos em andamento em:", key="modelo_data")
+    instrutor = catalogo.buscar("instrutores", instrutor_selecionado) if instrutor_selecionado != "Todos" else None
+
+    treinos = bk.treinos_vigentes(data_vigencia, instrutor["id"] if instrutor else None)
+    if treinos.empty:
+        st.info("Nenhum treino em andamento nessa data.")
+        return
+    rotulos = {linha.id: f"{linha.cliente} — {linha.data_inicio} a {linha.data_fim}" for linha in treinos.itertuples()}
+    with st.form("form_aplicar_modelo"):
+        selecionados = st.multiselect("Treinos", list(rotulos), default=list(rotulos), format_func=rotulos.get)
+        tipo_treino = st.text_input("Tipo de treino (opcional)", placeholder="Ex.: A, B, Superiores")
+        aplicar = st.form_submit_button(f"Aplicar '{modelo_aplicado}'")
+    if aplicar:
+        resposta = bk.aplicar_modelo_treino(modelo_aplicado, selecionados, tipo_treino)
+        if resposta["status"] == "sucesso":
+            st.success(resposta["mensagem"])
+        else:
+            st.error(resposta["mensagem"])
+        if resposta["linhas"]:
+            st.dataframe(pd.DataFrame(resposta["linhas"]), use_container_width=True, hide_index=True)
+
+# Página administrativa: latência das consultas SQL medidas pelo backend
+def pagina_diagnostico():
+    st.title("🩺 DIAGNÓSTICO")
+    st.subheader("Tempo das consultas SQL do backend, por consulta e por página.")
+    st.divider()
+
+    col1, col2, col3 = st.columns([2, 2, 1])
+    ativa = col1.toggle("Medir consultas", value=bk.instrumentacao_ativa())
+    trace = col2.text_input("Arquivo de trace (JSONL, opcional)", value="")
+    if ativa != bk.instrumentacao_ativa():
+        if ativa:
+            bk.ativar_instrumentacao(trace.strip() or None)
+        else:
+            bk.desativar_instrumentacao()
+        st.rerun()
+    if col3.button("Limpar estatísticas"):
+        bk.limpar_estatisticas()
+        st.rerun()
+
+    if not bk.instrumentacao_ativa():
+        st.info("A medição está desligada. Ligue-a e navegue pelas páginas para coletar dados.")
+
+    st.subheader("⏱️ Totais por página")
+    st.dataframe(bk.totais_por_pagina(), use_container_width=True)
+
+    st.subheader("🐢 Consultas mais lentas")
+    st.dataframe(bk.consultas_mais_lentas(20), use_container_width=True)
+
+    st.subheader("📊 Percentis por consulta")
+    st.dataframe(bk.estatisticas_consultas(), use_container_width=True)
+
+    st.divider()
+    st.subheader("🧠 Cache de consultas")
+    uso = bk.estatisticas_cache_consultas()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Entradas", f"{uso['entradas']} / {bk.TAMANHO_CACHE_CONSULTAS}")
+    c2.metric("Memória", f"{uso['memoria_mb']} MB")
+    c3.metric("Taxa de acerto", f"{uso['taxa_acerto']}%")
+    c4.metric("Acertos / faltas", f"{uso['acertos']} / {uso['faltas']}")
+    if st.button("Esvaziar cache"):
+        bk.limpar_cache_consultas()
+        st.rerun()
+
+    st.divider()
+    st.subheader("✍️ Fila de escrita")
+    if bk.ESCRITA_AGRUPADA:
+        st.caption("Os cadastros de todas as sessões entram numa fila por banco e são gravados em grupos, "
+                   f"com um commit por grupo (até {bk.MAXIMO_POR_GRUPO} operações).")
+        escrita = bk.estatisticas_escrita()
+        if escrita.empty:
+            st.info("Nenhum cadastro feito desde que o servidor subiu.")
+        else:
+            st.dataframe(escrita, use_container_width=True, hide_index=True)
+    else:
+        st.info("Escrita agrupada desligada (ACADEMIA_ESCRITA_AGRUPADA=0): cada cadastro faz o seu commit.")
+
+    if bk.unidade_atual() != bk.REDE:
+        st.divider()
+        st.subheader("📸 Cópia analítica")
+        st.caption("Cópia somente leitura (backup online do SQLite) usada pelos relatórios pesados, "
+                   f"refeita a cada {bk.INTERVALO_COPIA_SEG} s se houve escrita ou após {bk.ESCRITAS_POR_COPIA} escritas.")
+        if st.button("Atualizar cópia agora"):
+            bk.atualizar_copia_analitica()
+        estado = bk.estado_copia_analitica()
+        if estado:
+            st.dataframe(pd.DataFrame([estado]).astype(str), use_container_width=True, hide_index=True)
+        else:
+            st.info("A cópia é criada no primeiro relatório aberto.")
+
+    st.divider()
+    st.subheader("🗄️ Snapshot analítico (Parquet)")
+    if bk.unidade_atual() == bk.REDE:
+        st.info("O snapshot é gerado por unidade: escolha a unidade na barra lateral.")
+        return
+    st.caption("Cópia colunar de pagamentos, treinos e treino_exercicios para relatórios pesados. "
+               "A atualização regrava só os meses com inclusões, alterações ou exclusões.")
+    if st.button("Atualizar snapshot"):
+        try:
+            exportadas = bk.exportar_snapshot()
+            st.success("Linhas exportadas: " + ", ".join(f"{t}: {n}" for t, n in exportadas.items()))
+        except ImportError as e:
+            st.warning(str(e))
+    estado = bk.estado_snapshot()
+    if estado:
+        st.dataframe(pd.DataFrame.from_dict(estado, orient="index"), use_container_width=True)
+        invalidas = bk.datas_invalidas_snapshot()
+        if not invalidas.empty:
+            st.warning(f"{len(invalidas)} linhas com data fora do formato AAAA-MM-DD foram exportadas com a data vazia:")
+            st.dataframe(invalidas, use_container_width=True, hide_index=True)
+    else:
+        st.info("O snapshot ainda não foi gerado.")
+
+# Busca global da barra lateral (clientes, exercícios e instrutores, sem acentos e
+# por início de palavra). Clicar num resultado abre a página dele já filtrada
+ICONES_BUSCA = {"clientes": "👤", "exercicios": "🏋️", "instrutores": "🧑‍🏫"}
+
+def abrir_resultado(resultado):
+    if resultado["tipo"] == "clientes":
+        # O email identifica o cliente na busca do seletor da página de Pagamentos
+        st.session_state.menu_ativo = "Pagamentos"
+        st.session_state["pagamentos_cliente_busca"] = resultado["detalhe"] or resultado["nome"]
+        st.session_state["pagamentos_cliente"] = resultado["id"]
+    elif resultado["tipo"] == "instrutores":
+        st.session_state.menu_ativo = "Clientes por Instrutor"
+        st.session_state["instrutor_nome"] = resultado["nome"]
+    else:
+        st.session_state.menu_ativo = "Treinos"
+        st.session_state["filtro_treinos_grupo"] = resultado["detalhe"]
+    st.session_state["busca_global"] = ""
+
+def busca_global():
+    termo = st.sidebar.text_input("🔎 Buscar", key="busca_global", placeholder="Cliente, exercício ou instrutor")
+    if not termo.strip():
+        return
+    resultados = bk.buscar(termo)
+    if not resultados:
+        st.sidebar.caption("Nenhum resultado.")
+    for resultado in resultados:
+        st.sidebar.button(f"{ICONES_BUSCA[resultado['tipo']]} {resultado['nome']}", help=resultado["detalhe"],
+                          key=f"busca_{resultado['tipo']}_{resultado['id']}", type="tertiary",
+                          on_click=abrir_resultado, args=(resultado,))
+
 def front_end():
     # Cria 5 colunas na sidebar com larguras proporcionais para posicionar a imagem no centro
     col1, col2, col3, col4, col5 = st.sidebar.columns([1, 1, 2, 1, 1])
@@ -330,6 +774,20 @@ def front_end():
 
     st.sidebar.divider()
 
+    # Com várias unidades, todas as páginas leem/gravam no banco da unidade escolhida;
+    # "Toda a rede" junta os indicadores de todas as unidades no Dashboard
+    unidade = None
+    if bk.unidades():
+        unidade = st.sidebar.selectbox("Unidade:", bk.unidades() + [bk.REDE], key="unidade",
+                                       format_func=lambda u: "🌐 Toda a rede" if u == bk.REDE else u)
+        st.sidebar.divider()
+
+    # A busca olha o banco da unidade escolhida ("Toda a rede" não tem busca)
+    if unidade != bk.REDE:
+        with bk.unidade(unidade):
+            busca_global()
+        st.sidebar.divider()
+
     if "menu_ativo" not in st.session_state:
         st.session_state.menu_ativo = "Dashboard"
 
@@ -343,8 +801,12 @@ def front_end():
         st.session_state.menu_ativo = "Pagamentos"
     if st.sidebar.button("Clientes por Instrutor", type='tertiary'):
         st.session_state.menu_ativo = "Clientes por Instrutor"
+    if st.sidebar.button("Inadimplentes", type='tertiary'):
+        st.session_state.menu_ativo = "Inadimplentes"
     if st.sidebar.button("Formulários", type='tertiary'):
         st.session_state.menu_ativo = "Formulários"
+    if bk.usuario_admin(st.session_state.username) and st.sidebar.button("Diagnóstico", type='tertiary'):
+        st.session_state.menu_ativo = "Diagnóstico"
 
 
     col1, col2, col3, col4, col5 = st.sidebar.columns([1, 1, 2, 1, 1])
@@ -354,21 +816,29 @@ def front_end():
         st.rerun()
 
     menu = st.session_state.menu_ativo
-
-    # Renderiza a página correspondente ao menu ativo
-    if menu == "Dashboard":
-        pagina_dashboard()
-    elif menu == "Clientes por Plano":
-        pagina_clientes_por_plano()
-    elif menu == "Treinos":
-        pagina_treinos()
-    elif menu == "Pagamentos":
-        pagina_pagamentos()
-    elif menu == "Clientes por Instrutor":
-        pagina_instrutores()
-    elif menu == "Formulários":
-        pagina_formularios()
-
+    if menu == "Diagnóstico" and not bk.usuario_admin(st.session_state.username):
+        menu = st.session_state.menu_ativo = "Dashboard"
+
+    # Renderiza a página correspondente ao menu ativo (as consultas ficam atribuídas a ela no Diagnóstico)
+    with bk.unidade(unidade), bk.pagina_instrumentada(menu):
+        if unidade == bk.REDE and menu not in ("Dashboard", "Diagnóstico"):
+            st.info("Esta página mostra os dados de uma unidade: escolha a unidade na barra lateral.")
+        elif menu == "Dashboard":
+            pagina_dashboard()
+        elif menu == "Clientes por Plano":
+            pagina_clientes_por_plano()
+        elif menu == "Treinos":
+            pagina_treinos()
+        elif menu == "Pagamentos":
+            pagina_pagamentos()
+        elif menu == "Clientes por Instrutor":
+            pagina_instrutores()
+        elif menu == "Inadimplentes":
+            pagina_inadimplentes()
+        elif menu == "Formulários":
+            pagina_formularios()
+        elif menu == "Diagnóstico":
+            pagina_diagnostico()
 
 def tela_login():
     # Centraliza o formulário de login na tela, usando colunas para layout
@@ -0,0 +1,119 @@
+import datetime
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+from dateutil.relativedelta import relativedelta
+
+import backend as bk
+
+
+@pytest.fixture
+def dados(banco):
+    """Banco de exemplo com treinos e pagamentos aleatórios a mais (sobreposições, sem fim, invertidos)."""
+    aleatorio = np.random.default_rng(7)
+    conn = sqlite3.connect(banco)
+    clientes = [linha[0] for linha in conn.execute("SELECT id FROM clientes")]
+    planos = dict(conn.execute("SELECT id, preco_mensal FROM planos"))
+    instrutores = [linha[0] for linha in conn.execute("SELECT id FROM instrutores")]
+    base = datetime.date(2023, 1, 1)
+    for _ in range(400):
+        inicio = base + datetime.timedelta(days=int(aleatorio.integers(0, 1100)))
+        fim = inicio + datetime.timedelta(days=int(aleatorio.integers(-5, 200)))
+        conn.execute(
+            "INSERT OR IGNORE INTO treinos (cliente_id, instrutor_id, data_inicio, data_fim, plano_id) VALUES (?, ?, ?, ?, ?)",
+            (int(aleatorio.choice(clientes)), int(aleatorio.choice(instrutores)), str(inicio),
+             None if aleatorio.random() < 0.05 else str(fim), int(aleatorio.choice(list(planos)))))
+    for _ in range(1500):
+        cliente, plano = int(aleatorio.choice(clientes)), int(aleatorio.choice(list(planos)))
+        data = base + datetime.timedelta(days=int(aleatorio.integers(0, 1200)))
+        conn.execute(
+            "INSERT OR IGNORE INTO pagamentos (cliente_id, plano_id, valor_pago, data_pagamento) VALUES (?, ?, ?, ?)",
+            (cliente, plano, planos[plano], str(data)))
+    conn.commit()
+    conn.close()
+    bk.atualizar_copia_analitica()
+    return banco
+
+
+def _ler(banco, sql):
+    conn = sqlite3.connect(banco)
+    try:
+        return pd.read_sql_query(sql, conn)
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("origem, tabela, coluna", [("pagamentos", "pagamentos", "data_pagamento"),
+                                                    ("treinos", "treinos", "data_inicio")])
+def test_coortes_iguais_a_referencia_em_pandas(dados, origem, tabela, coluna):
+    pagamentos = _ler(dados, "SELECT cliente_id, data_pagamento FROM pagamentos")
+    pagamentos["mes"] = pd.to_datetime(pagamentos["data_pagamento"]).dt.to_period("M")
+    entradas = _ler(dados, f"SELECT cliente_id, {coluna} AS data FROM {tabela} WHERE {coluna} IS NOT NULL")
+    coorte = pd.to_datetime(entradas["data"]).dt.to_period("M").groupby(entradas["cliente_id"]).min().rename("coorte")
+    pagamentos = pagamentos.join(coorte, on="cliente_id").dropna(subset=["coorte"])
+    pagamentos["k"] = [(m - c).n for m, c in zip(pagamentos["mes"], pagamentos["coorte"])]
+    pagamentos = pagamentos[pagamentos["k"] >= 0]
+    esperado = pagamentos.groupby(["coorte", "k"])["cliente_id"].nunique()
+    tamanhos = coorte.value_counts()
+
+    matriz = bk.retencao_coortes(origem, percentual=False)
+
+    assert {str(c): n for c, n in tamanhos.items()} == matriz["clientes"].to_dict()
+    for (c, k), n in esperado.items():
+        assert matriz.loc[str(c), k] == n
+    valores = matriz.drop(columns="clientes")
+    assert valores.fillna(0).to_numpy().sum() == esperado.sum()
+
+
+def test_ativos_por_dia_iguais_a_contagem_direta(dados):
+    treinos = _ler(dados, "SELECT cliente_id, plano_id, data_inicio, data_fim FROM treinos")
+    hoje = pd.Timestamp(datetime.date.today())
+    treinos["inicio"] = pd.to_datetime(treinos["data_inicio"])
+    treinos["fim"] = pd.to_datetime(treinos["data_fim"]).fillna(hoje)
+    dias = pd.date_range("2023-06-01", "2025-09-30")
+
+    serie = bk.ativos_por_dia(dias[0], dias[-1])
+    por_plano = bk.ativos_por_dia(dias[0], dias[-1], por="plano")
+    nomes = {r["id"]: r["nome"] for r in bk.catalogo().registros("planos")}
+    for dia in dias[::17]:
+        no_dia = treinos[(treinos["inicio"] <= dia) & (treinos["fim"] >= dia)]
+        assert serie.loc[dia, "ativos"] == no_dia["cliente_id"].nunique()
+        assert bk.clientes_ativos_em(dia) == no_dia["cliente_id"].nunique()
+        for plano_id, grupo in no_dia.groupby("plano_id"):
+            assert por_plano.loc[dia, nomes[plano_id]] == grupo["cliente_id"].nunique()
+
+
+def _inadimplencia_de_referencia(banco, hoje):
+    clientes = _ler(banco, """
+        SELECT c.id, p.preco_mensal, p.duracao_meses FROM clientes c JOIN planos p ON p.id = c.plano_id ORDER BY c.id
+    """)
+    pagamentos = _ler(banco, "SELECT cliente_id, data_pagamento FROM pagamentos")
+    datas = pd.to_datetime(pagamentos["data_pagamento"]).dt.date.groupby(pagamentos["cliente_id"])
+    linhas = []
+    for cliente in clientes.itertuples():
+        if cliente.id not in datas.groups:
+            linhas.append((cliente.id, 0, 0, 0, 0.0))
+            continue
+        do_cliente = datas.get_group(cliente.id)
+        inicio, recebidos, duracao = do_cliente.min(), len(do_cliente), max(cliente.duracao_meses, 1)
+        vencimento = lambda parcela: inicio + relativedelta(months=parcela)
+        vencidas = 0
+        while vencimento(vencidas) <= hoje:
+            vencidas += 1
+        contratos = max(1, -(-recebidos // duracao))
+        esperados = min(vencidas, contratos * duracao)
+        pendentes = max(esperados - recebidos, 0)
+        atraso = (hoje - vencimento(recebidos)).days if pendentes else 0
+        linhas.append((cliente.id, esperados, pendentes, atraso, pendentes * cliente.preco_mensal))
+    return pd.DataFrame(linhas, columns=["cliente_id", "pagamentos_esperados", "pagamentos_pendentes",
+                                         "dias_atraso", "saldo_devedor"])
+
+
+@pytest.mark.parametrize("hoje", [datetime.date(2023, 3, 10), datetime.date(2024, 2, 29), datetime.date(2025, 1, 31), datetime.date(2026, 3, 15)])
+def test_inadimplencia_igual_ao_calculo_parcela_a_parcela(dados, hoje):
+    esperado = _inadimplencia_de_referencia(dados, hoje)
+    obtido = bk._calcular_inadimplencia(hoje)[esperado.columns]
+    pd.testing.assert_frame_equal(obtido.reset_index(drop=True), esperado, check_dtype=False)
+
@@ -0,0 +1,50 @@
+import sqlite3
+
+import backend as bk
+
+
+def _executar(banco, *comandos):
+    conn = sqlite3.connect(banco)
+    for sql, parametros in comandos:
+        conn.execute(sql, parametros)
+    conn.commit()
+    conn.close()
+
+
+def _novo_cliente(nome, email, telefone="1"):
+    cat = bk.catalogo()
+    resposta = bk.novo_cliente(nome, 30, "F", email, telefone, cat.nomes("planos")[0], cat.nomes("instrutores")[0])
+    assert resposta["status"] == "sucesso"
+    return cat.buscar("clientes", nome)["id"]
+
+
+def _ids(termo):
+    return [r["id"] for r in bk.buscar(termo) if r["tipo"] == "clientes"]
+
+
+def test_indice_acompanha_alteracao_e_exclusao(banco):
+    cliente_id = _novo_cliente("Quitéria Zanoni", "quiteria@exemplo.com", "(11) 98765-4321")
+    assert _ids("quiteria") == [cliente_id]
+    assert _ids("987654321") == [cliente_id]
+
+    _executar(banco, ("UPDATE clientes SET nome = 'Quitéria Vasconcelos', telefone = '5555' WHERE id = ?", (cliente_id,)))
+    assert _ids("zanoni") == []
+    assert _ids("vasconcelos") == [cliente_id]
+    assert _ids("987654321") == []
+
+    _executar(banco, ("DELETE FROM clientes WHERE id = ?", (cliente_id,)))
+    assert _ids("quiteria") == []
+    conn = sqlite3.connect(banco)
+    assert conn.execute("SELECT COUNT(*) FROM busca_clientes").fetchone() == conn.execute(
+        "SELECT COUNT(*) FROM clientes").fetchone()
+    conn.close()
+
+
+def test_busca_ampla_traz_os_mais_relevantes(banco, monkeypatch):
+    # Muitos resultados pelo e-mail, cadastrados antes; o que tem o termo no nome vem por último
+    for i in range(5):
+        _novo_cliente(f"Cliente {i}", f"xisto{i}@exemplo.com")
+    pelo_nome = _novo_cliente("Xisto Pereira", "pereira@exemplo.com")
+    monkeypatch.setattr(bk, "CANDIDATOS_BUSCA", 2)
+
+    assert _ids("xisto")[0] == pelo_nome
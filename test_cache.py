@@ -0,0 +1,79 @@
+import sqlite3
+import subprocess
+import sys
+
+import backend as bk
+from conftest import PASTA
+
+
+def _inserir_cliente_por_fora(caminho, nome, email):
+    # Conexão que não passa pelo backend, como a de outro processo
+    conn = sqlite3.connect(caminho)
+    plano_id, instrutor_id = conn.execute("SELECT plano_id, instrutor_id FROM clientes LIMIT 1").fetchone()
+    conn.execute(
+        "INSERT INTO clientes (nome, idade, sexo, email, telefone, plano_id, instrutor_id) VALUES (?, 30, 'F', ?, '1', ?, ?)",
+        (nome, email, plano_id, instrutor_id),
+    )
+    conn.commit()
+    conn.close()
+    return plano_id
+
+
+def test_escrita_de_outra_conexao_invalida_o_cache(banco):
+    antes = len(bk.get_clientes())
+    kpis_antes = bk.get_kpis_dashboard().total_clientes
+    plano_id = _inserir_cliente_por_fora(banco, "Cliente Externo", "externo@exemplo.com")
+    plano = bk.catalogo().por_id("planos", plano_id)["nome"]
+
+    assert len(bk.get_clientes()) == antes + 1
+    assert bk.get_kpis_dashboard().total_clientes == kpis_antes + 1
+    assert "Cliente Externo" in set(bk.clientes_planos(plano)["Cliente"])
+    assert bk.catalogo().buscar("clientes", "Cliente Externo") is not None
+
+
+def test_escrita_de_outro_processo_invalida_o_cache(banco):
+    antes = len(bk.get_clientes())
+    codigo = (
+        "import backend as bk; "
+        "cat = bk.catalogo(); "
+        "print(bk.novo_cliente('Cliente Processo', 40, 'M', 'processo@exemplo.com', '1', "
+        "cat.nomes('planos')[0], cat.nomes('instrutores')[0])['status'])"
+    )
+    saida = subprocess.run([sys.executable, "-c", codigo], cwd=PASTA, capture_output=True, text=True,
+                           env={"ACADEMIA_DB": banco, "PATH": ""}, check=True)
+    assert saida.stdout.strip() == "sucesso"
+    assert len(bk.get_clientes()) == antes + 1
+
+
+def test_escrita_em_uma_tabela_nao_invalida_as_outras(banco):
+    clientes, planos = bk._versao_tabelas("clientes"), bk._versao_tabelas("planos")
+    conn = sqlite3.connect(banco)
+    conn.execute("UPDATE planos SET preco_mensal = preco_mensal WHERE id = 1")
+    conn.commit()
+    conn.close()
+    assert bk._versao_tabelas("clientes") == clientes
+    assert bk._versao_tabelas("planos") != planos
+
+
+def test_grafico_renderizado_de_novo_apos_escrita_externa(banco):
+    primeiro = bk.grafico_imagem("clientes_por_plano")
+    assert bk.grafico_imagem("clientes_por_plano") is primeiro
+    _inserir_cliente_por_fora(banco, "Cliente Gráfico", "grafico@exemplo.com")
+    assert bk.grafico_imagem("clientes_por_plano") is not primeiro
+
+
+def test_catalogo_so_recarrega_quando_a_tabela_muda(banco, monkeypatch):
+    cat = bk.catalogo()
+    cat.nomes("clientes")
+    carregar, cargas = bk.CatalogoReferencia._carregar, []
+    monkeypatch.setattr(bk.CatalogoReferencia, "_carregar",
+                        lambda self, tabela: cargas.append(tabela) or carregar(self, tabela))
+
+    for _ in range(3):
+        assert cat.buscar("clientes", "Ninguém Com Esse Nome") is None
+        assert cat.por_id("clientes", 10 ** 9) is None
+    assert cargas == []
+
+    _inserir_cliente_por_fora(banco, "Ninguém Com Esse Nome", "ninguem@exemplo.com")
+    assert cat.buscar("clientes", "Ninguém Com Esse Nome") is not None
+    assert cargas == ["clientes"]
@@ -0,0 +1,161 @@
+import concurrent.futures
+import datetime
+import sqlite3
+
+import backend as bk
+
+
+def _homonimos(banco, nome="Maria Homônima"):
+    """Dois clientes com o mesmo nome (ex.: vindos de uma importação), com ids em ordem."""
+    conn = sqlite3.connect(banco)
+    plano_id, instrutor_id = conn.execute("SELECT plano_id, instrutor_id FROM clientes LIMIT 1").fetchone()
+    ids = [
+        conn.execute(
+            "INSERT INTO clientes (nome, idade, sexo, email, telefone, plano_id, instrutor_id) "
+            "VALUES (?, 30, 'F', ?, '1', ?, ?) RETURNING id",
+            (nome, f"homonima{i}@exemplo.com", plano_id, instrutor_id),
+        ).fetchone()[0]
+        for i in range(2)
+    ]
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def _consultar(banco, sql, parametros=()):
+    conn = sqlite3.connect(banco)
+    try:
+        return conn.execute(sql, parametros).fetchall()
+    finally:
+        conn.close()
+
+
+def test_pagamento_e_treino_vao_para_o_cliente_escolhido_pelo_id(banco):
+    _, segundo = _homonimos(banco)
+    plano = bk.catalogo().nomes("planos")[0]
+    data = datetime.date(2031, 3, 1)
+
+    assert bk.novo_pagamento(None, plano, data, cliente_id=segundo)["status"] == "sucesso"
+    assert bk.novo_treino(None, data, cliente_id=segundo)["status"] == "success"
+
+    assert _consultar(banco, "SELECT cliente_id FROM pagamentos WHERE data_pagamento = ?", (str(data),)) == [(segundo,)]
+    treinos = _consultar(banco, "SELECT id, cliente_id FROM treinos WHERE data_inicio = ?", (str(data),))
+    assert [cliente_id for _, cliente_id in treinos] == [segundo]
+    assert bk.get_treinos_por_cliente("Maria Homônima", cliente_id=segundo)["id"].tolist() == [treinos[0][0]]
+
+
+def test_cliente_id_inexistente_vira_erro(banco):
+    resposta = bk.novo_pagamento(None, bk.catalogo().nomes("planos")[0], "2031-03-01", cliente_id=10 ** 9)
+    assert resposta["status"] == "erro"
+    assert bk.novo_treino(None, datetime.date(2031, 3, 1), cliente_id=10 ** 9)["status"] == "error"
+
+
+def test_lote_de_pagamentos_por_id_distingue_homonimos(banco):
+    primeiro, segundo = _homonimos(banco)
+    plano = bk.catalogo().nomes("planos")[0]
+    resposta = bk.registrar_pagamentos_lote([
+        {"cliente_id": primeiro, "cliente": "Maria Homônima — homonima0@exemplo.com", "plano": plano, "data": "2031-04-01"},
+        {"cliente_id": segundo, "cliente": "Maria Homônima — homonima1@exemplo.com", "plano": plano, "data": "2031-04-01"},
+        {"cliente_id": segundo, "plano": plano, "data": "2031-04-01"},
+        {"plano": plano, "data": "2031-04-01"},
+    ])
+
+    assert [linha["status"] for linha in resposta["linhas"]] == ["sucesso", "sucesso", "erro", "erro"]
+    assert resposta["linhas"][2]["mensagem"].startswith("Pagamento repetido no lote")
+    assert resposta["linhas"][3]["mensagem"] == "Cliente não informado."
+    assert sorted(_consultar(banco, "SELECT cliente_id FROM pagamentos WHERE data_pagamento = '2031-04-01'")) == [
+        (primeiro,), (segundo,)]
+
+
+class _ContaLeituras(dict):
+    def __init__(self, dados):
+        super().__init__(dados)
+        self.leituras = 0
+
+    def __getitem__(self, chave):
+        self.leituras += 1
+        return super().__getitem__(chave)
+
+
+def _clientes_sinteticos(quantidade):
+    nomes, sobrenomes = ["Ana", "Bruno", "Célia", "Davi", "Élida"], ["Silva", "Souza", "Lima", "Araújo"]
+    return [{"id": i, "nome": f"{nomes[i % 5]} {sobrenomes[i % 4]} {sobrenomes[i // 5 % 4]}",
+             "email": f"cliente{i}@exemplo.com", "telefone": f"(11) 9{i:08d}"} for i in range(1, quantidade + 1)]
+
+
+def test_busca_de_clientes_so_olha_quem_casa(banco):
+    registros = _clientes_sinteticos(5000)
+    indice = bk.IndiceClientes(registros)
+    indice._nomes = _ContaLeituras(indice._nomes)
+
+    resultado = indice.buscar("celia ara", limite=5)
+
+    esperados = [r for r in registros if {"celia", "araujo"} <= set(bk._normalizar_busca(r["nome"]).split())]
+    ordem = sorted(esperados, key=lambda r: (not r["nome"].startswith("Célia Araújo"), bk._normalizar_busca(r["nome"]), r["id"]))
+    assert [r["id"] for r in resultado] == [r["id"] for r in ordem[:5]]
+    assert indice._nomes.leituras == len(esperados) <= len(registros) // 10
+    # Telefone sem o DDD e email pelo começo
+    assert [r["id"] for r in indice.buscar("900001234")] == [1234]
+    assert [r["id"] for r in indice.buscar("cliente4321@")] == [4321]
+
+
+def test_indice_de_clientes_atualizado_igual_ao_refeito(banco):
+    registros = _clientes_sinteticos(300)
+    indice = bk.IndiceClientes(registros)
+    novos = [dict(r) for r in registros if r["id"] != 7]
+    novos[10]["nome"] = "Zuleica Nova"
+    novos.append({"id": 301, "nome": "Ana Recém Chegada", "email": "", "telefone": None})
+
+    atualizado, refeito = indice.atualizado(novos), bk.IndiceClientes(novos)
+
+    assert atualizado._palavras == refeito._palavras
+    assert [sorted(set(ids)) for ids in atualizado._ids] == [sorted(set(ids)) for ids in refeito._ids]
+    assert atualizado.rotulos == refeito.rotulos
+    assert [r["id"] for r in atualizado.buscar("zul")] == [novos[10]["id"]]
+    assert indice.buscar("zul") == []  # o índice anterior não muda
+
+
+def test_busca_de_clientes_acompanha_cadastro(banco):
+    assert bk.buscar_clientes("zuleica") == []
+    plano, instrutor = bk.catalogo().nomes("planos")[0], bk.catalogo().nomes("instrutores")[0]
+    assert bk.novo_cliente("Zuleica Teste", 30, "F", "zuleica@exemplo.com", "(11) 91111-2222",
+                           plano, instrutor)["status"] == "sucesso"
+    assert [r["nome"] for r in bk.buscar_clientes("zuleica")] == ["Zuleica Teste"]
+    assert [r["nome"] for r in bk.buscar_clientes("911112222")] == ["Zuleica Teste"]
+
+
+def _novo_cliente(nome, email):
+    cat = bk.catalogo()
+    return bk.novo_cliente(nome, 30, "F", email, "(11) 90000-0000", cat.nomes("planos")[0], cat.nomes("instrutores")[0])
+
+
+def test_cadastro_de_cliente_repetido_diz_o_que_repetiu(banco):
+    assert _novo_cliente("Quitéria Única", "quiteria@exemplo.com")["status"] == "sucesso"
+
+    por_nome = _novo_cliente("Quitéria Única", "outra@exemplo.com")
+    por_email = _novo_cliente("Outra Pessoa", "quiteria@exemplo.com")
+    ambos = _novo_cliente("Quitéria Única", "quiteria@exemplo.com")
+
+    assert por_nome == {"status": "erro", "mensagem": "Erro: já existe um cliente com o mesmo nome ('Quitéria Única')."}
+    assert por_email == {"status": "erro", "mensagem": "Erro: já existe um cliente com o mesmo e-mail ('quiteria@exemplo.com')."}
+    assert ambos["mensagem"] == "Erro: já existe um cliente com o mesmo nome ('Quitéria Única') e e-mail ('quiteria@exemplo.com')."
+    assert _consultar(banco, "SELECT COUNT(*) FROM clientes WHERE nome = 'Quitéria Única' OR email = 'quiteria@exemplo.com'") == [(1,)]
+
+
+def test_cadastros_iguais_ao_mesmo_tempo_entram_uma_vez(banco):
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        respostas = list(executor.map(lambda i: _novo_cliente("Corrida Paralela", f"corrida{i}@exemplo.com"), range(4)))
+    assert sorted(r["status"] for r in respostas) == ["erro"] * 3 + ["sucesso"]
+    assert _consultar(banco, "SELECT COUNT(*) FROM clientes WHERE nome = 'Corrida Paralela'") == [(1,)]
+
+
+def test_treino_repetido_nas_mesmas_datas_e_barrado(banco):
+    cliente = bk.catalogo().registros("clientes")[0]
+    data = datetime.date(2031, 7, 1)
+    assert bk.novo_treino(None, data, cliente_id=cliente["id"])["status"] == "success"
+
+    repetido = bk.novo_treino(None, data, cliente_id=cliente["id"])
+
+    assert repetido == {"status": "error", "message": "Erro: Um treino com a mesma data já existe para esse cliente."}
+    assert _consultar(banco, "SELECT COUNT(*) FROM treinos WHERE cliente_id = ? AND data_inicio = ?",
+                      (cliente["id"], str(data))) == [(1,)]
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+import backend as bk
+
+
+def test_tarefas_rodam_ao_mesmo_tempo():
+    juntas = threading.Barrier(3, timeout=10)  # só passa se as três estiverem rodando juntas
+
+    def tarefa(valor):
+        def rodar():
+            juntas.wait()
+            return valor
+        return rodar
+
+    assert bk.carregar_em_paralelo({"a": tarefa(1), "b": tarefa(2), "c": tarefa(3)}) == {"a": 1, "b": 2, "c": 3}
+
+
+def test_primeira_falha_na_ordem_do_dict_e_relancada_depois_das_outras():
+    terminou = []
+
+    def falha_tardia():
+        time.sleep(0.2)
+        raise KeyError("primeira na ordem")
+
+    def falha_imediata():
+        raise ValueError("primeira no tempo")
+
+    def lenta():
+        time.sleep(0.3)
+        terminou.append("lenta")
+        return "ok"
+
+    with pytest.raises(KeyError, match="primeira na ordem"):
+        bk.carregar_em_paralelo({"tardia": falha_tardia, "imediata": falha_imediata, "lenta": lenta})
+    assert terminou == ["lenta"]  # não ficou rodando solta depois do erro
+
+    # O executor continua atendendo depois da falha
+    assert bk.carregar_em_paralelo({"x": lambda: 1, "y": lambda: 2}) == {"x": 1, "y": 2}
+
+
+def test_escopo_do_chamador_vale_nas_threads(banco):
+    with bk.pagina_instrumentada("Dashboard"):
+        resultado = bk.carregar_em_paralelo({
+            "pagina": lambda: bk._pagina_atual.get(),
+            "banco": lambda: bk._caminho_banco(),
+            "clientes": bk.get_clientes,
+        })
+    assert resultado["pagina"] == "Dashboard"
+    assert resultado["banco"] == banco
+    assert len(resultado["clientes"]) == len(bk.catalogo().registros("clientes"))
+
+
+def test_carga_dentro_de_uma_tarefa_roda_em_serie():
+    threads_da_carga = []
+
+    def interna():
+        threads_da_carga.append(threading.current_thread().name)
+        return bk.carregar_em_paralelo({"x": lambda: threading.current_thread().name, "y": lambda: 2})
+
+    resultado = bk.carregar_em_paralelo({"interna": interna, "outra": lambda: 0})
+
+    assert resultado["interna"] == {"x": threads_da_carga[0], "y": 2}  # na mesma thread da tarefa
@@ -0,0 +1,89 @@
+import sqlite3
+import threading
+
+import pytest
+
+import backend as bk
+
+
+def test_leituras_seguidas_reusam_a_mesma_conexao(banco):
+    with bk._leitura() as primeira:
+        pass
+    with bk._leitura() as segunda:
+        assert segunda is primeira
+    assert bk._pool(somente_leitura=True)._abertas == 1
+
+
+def test_pool_esgotado_espera_e_depois_desiste(banco, monkeypatch):
+    monkeypatch.setattr(bk, "ESPERA_POOL_SEG", 0.2)
+    pool = bk._PoolConexoes(banco, somente_leitura=True, tamanho=2)
+    try:
+        with pool.conexao() as a, pool.conexao() as b:
+            assert a is not b
+            with pytest.raises(sqlite3.OperationalError, match="Nenhuma conexão livre"):
+                with pool.conexao():
+                    pass
+        assert pool._abertas == 2
+    finally:
+        pool.encerrar()
+
+
+def test_pool_esgotado_entrega_a_conexao_devolvida(banco, monkeypatch):
+    monkeypatch.setattr(bk, "ESPERA_POOL_SEG", 10)
+    pool = bk._PoolConexoes(banco, somente_leitura=True, tamanho=1)
+    recebida, esperando = [], threading.Event()
+
+    def esperar():
+        esperando.set()
+        with pool.conexao() as conn:
+            recebida.append(conn)
+
+    try:
+        with pool.conexao() as emprestada:
+            outra = threading.Thread(target=esperar)
+            outra.start()
+            esperando.wait(10)
+        outra.join(10)
+        assert recebida == [emprestada]
+        assert pool._abertas == 1
+    finally:
+        pool.encerrar()
+
+
+def test_conexao_volta_ao_pool_sem_transacao_aberta(banco):
+    pool = bk._PoolConexoes(banco, somente_leitura=False, tamanho=1)
+    try:
+        with pool.conexao() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM pagamentos")
+        with pool.conexao() as mesma:
+            assert mesma is conn and not mesma.in_transaction
+            assert mesma.execute("SELECT COUNT(*) FROM pagamentos").fetchone()[0] > 0
+            assert mesma.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    finally:
+        pool.encerrar()
+
+
+def test_conexao_com_erro_de_banco_e_descartada(banco):
+    pool = bk._PoolConexoes(banco, somente_leitura=True, tamanho=1)
+    try:
+        with pytest.raises(sqlite3.DatabaseError):
+            with pool.conexao() as conn:
+                raise sqlite3.DatabaseError("database disk image is malformed")
+        assert pool._abertas == 0
+        with pool.conexao() as nova:
+            assert nova is not conn
+        # Erros de uso (constraint, SQL inválido) não descartam a conexão
+        with pytest.raises(sqlite3.OperationalError):
+            with pool.conexao() as nova:
+                nova.execute("SELECT * FROM tabela_que_nao_existe")
+        with pool.conexao() as de_novo:
+            assert de_novo is nova
+    finally:
+        pool.encerrar()
+
+
+def test_conexao_somente_leitura_nao_grava(banco):
+    with bk._leitura() as conn:
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            conn.execute("DELETE FROM pagamentos")
@@ -0,0 +1,106 @@
+import datetime
+import os
+import sqlite3
+
+import pytest
+
+import backend as bk
+
+
+def _contar(caminho, tabela="pagamentos"):
+    conn = sqlite3.connect(caminho)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _pagar(banco, n=0):
+    conn = sqlite3.connect(banco)
+    cliente_id, nome = conn.execute("SELECT id, nome FROM clientes ORDER BY id LIMIT 1 OFFSET ?", (n,)).fetchone()
+    conn.close()
+    plano = bk.catalogo().nomes("planos")[0]
+    resultado = bk.novo_pagamento(nome, plano, datetime.date.today().isoformat(), cliente_id=cliente_id)
+    assert resultado["status"] == "sucesso"
+
+
+@pytest.fixture
+def copia(banco, monkeypatch):
+    monkeypatch.setattr(bk, "COPIA_ANALITICA", True)
+    bk.atualizar_copia_analitica()
+    yield bk._copias[banco]
+    for arquivo in bk._copias.pop(banco)._arquivos:
+        bk._descartar_copia(arquivo)
+
+
+def test_relatorio_le_a_copia_ate_ela_ser_refeita(banco, copia):
+    antes = len(bk.carregar_pagamentos())
+    assert antes == _contar(banco)
+
+    _pagar(banco)
+    assert _contar(banco) == antes + 1
+    # A escrita não aparece no relatório: ele lê a fotografia (e o cache dela)
+    assert len(bk.carregar_pagamentos()) == antes
+    assert copia.escritas == 1
+
+    geracao = copia.geracao
+    bk.atualizar_copia_analitica()
+    assert copia.geracao == geracao + 1 and copia.escritas == 0
+    # A troca de cópia invalida o cache do relatório
+    assert len(bk.carregar_pagamentos()) == antes + 1
+
+
+def test_copia_e_uma_fotografia_consistente(banco, copia):
+    # Uma transação aberta durante a cópia não entra nela (nem pela metade)
+    with bk._transacao("pagamentos") as conn:
+        conn.execute("DELETE FROM pagamentos")
+        bk.atualizar_copia_analitica()
+    assert _contar(copia.arquivo) > 0
+    for tabela in ("clientes", "pagamentos", "treinos", "receita_cubo"):
+        assert _contar(copia.arquivo, tabela) == _contar(copia._arquivos[0], tabela)
+    # A cópia abre somente leitura, sem -wal
+    assert not os.path.exists(f"{copia.arquivo}-wal")
+    with pytest.raises(sqlite3.OperationalError):
+        uri = f"file:{copia.arquivo}?mode=ro"
+        sqlite3.connect(uri, uri=True).execute("DELETE FROM pagamentos")
+
+
+def test_copias_antigas_sao_descartadas(banco, copia):
+    for _ in range(3):
+        bk.atualizar_copia_analitica()
+    assert len(copia._arquivos) == 2
+    assert all(os.path.exists(arquivo) for arquivo in copia._arquivos)
+    pasta = os.path.dirname(banco)
+    no_disco = [nome for nome in os.listdir(pasta) if ".analitico-" in nome and nome.endswith(".db")]
+    assert sorted(no_disco) == sorted(os.path.basename(arquivo) for arquivo in copia._arquivos)
+
+
+def test_leitura_refaz_copia_defasada_so_se_o_banco_mudou(banco, copia, monkeypatch):
+    bk.carregar_pagamentos()
+    geracao = copia.geracao
+    monkeypatch.setattr(bk, "IDADE_MAXIMA_COPIA_SEG", 0)
+
+    # Banco igual: a cópia só é renovada, sem copiar de novo
+    bk.carregar_pagamentos()
+    assert copia.geracao == geracao
+
+    _pagar(banco)
+    assert len(bk.carregar_pagamentos()) == _contar(banco)
+    assert copia.geracao == geracao + 1
+
+
+def test_escritas_acumuladas_vencem_a_copia(banco, copia, monkeypatch):
+    monkeypatch.setattr(bk, "ESCRITAS_POR_COPIA", 2)
+    assert not copia.vencida()
+    _pagar(banco)
+    assert not copia.vencida()
+    _pagar(banco, 1)
+    assert copia.vencida()
+
+
+def test_sem_copia_analitica_o_relatorio_le_ao_vivo(banco, monkeypatch):
+    monkeypatch.setattr(bk, "COPIA_ANALITICA", False)
+    antes = len(bk.carregar_pagamentos())
+    _pagar(banco)
+    assert len(bk.carregar_pagamentos()) == antes + 1
+    assert banco not in bk._copias
@@ -0,0 +1,77 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import backend as bk
+
+
+def _comparar_cubo_com_pagamentos(banco):
+    conn = sqlite3.connect(banco)
+    cubo = pd.read_sql_query(
+        "SELECT mes, plano_id, instrutor_id, total, quantidade FROM receita_cubo ORDER BY 1, 2, 3", conn)
+    esperado = pd.read_sql_query("""
+        SELECT substr(p.data_pagamento, 1, 7) AS mes, p.plano_id, IFNULL(c.instrutor_id, 0) AS instrutor_id,
+               SUM(p.valor_pago) AS total, COUNT(*) AS quantidade
+        FROM pagamentos p LEFT JOIN clientes c ON c.id = p.cliente_id
+        GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+    """, conn)
+    conn.close()
+    pd.testing.assert_frame_equal(cubo, esperado, check_exact=False, rtol=1e-9)
+
+
+def _executar(banco, *comandos):
+    conn = sqlite3.connect(banco)
+    for sql, parametros in comandos:
+        conn.execute(sql, parametros)
+    conn.commit()
+    conn.close()
+
+
+def test_cubo_igual_ao_group_by_depois_de_troca_de_instrutor_e_exclusoes(banco):
+    _comparar_cubo_com_pagamentos(banco)
+
+    conn = sqlite3.connect(banco)
+    cliente_id, instrutor_id = conn.execute("""
+        SELECT c.id, c.instrutor_id FROM clientes c
+        WHERE (SELECT COUNT(*) FROM pagamentos WHERE cliente_id = c.id) > 1 LIMIT 1
+    """).fetchone()
+    outro_instrutor = conn.execute("SELECT id FROM instrutores WHERE id != ? LIMIT 1", (instrutor_id,)).fetchone()[0]
+    pagamento = conn.execute("SELECT id FROM pagamentos WHERE cliente_id = ? LIMIT 1", (cliente_id,)).fetchone()[0]
+    outro_cliente = conn.execute("""
+        SELECT cliente_id FROM pagamentos WHERE cliente_id != ? GROUP BY cliente_id LIMIT 1
+    """, (cliente_id,)).fetchone()[0]
+    conn.close()
+
+    _executar(banco, ("UPDATE clientes SET instrutor_id = ? WHERE id = ?", (outro_instrutor, cliente_id)))
+    _comparar_cubo_com_pagamentos(banco)
+
+    _executar(banco, ("DELETE FROM pagamentos WHERE id = ?", (pagamento,)))
+    _comparar_cubo_com_pagamentos(banco)
+
+    _executar(banco,
+              ("UPDATE pagamentos SET valor_pago = valor_pago * 2 WHERE cliente_id = ?", (cliente_id,)),
+              ("UPDATE pagamentos SET data_pagamento = '2031-06-01' WHERE id = "
+               "(SELECT MAX(id) FROM pagamentos WHERE cliente_id = ?)", (cliente_id,)))
+    _comparar_cubo_com_pagamentos(banco)
+
+    _executar(banco, ("DELETE FROM clientes WHERE id = ?", (outro_cliente,)))
+    _comparar_cubo_com_pagamentos(banco)
+
+
+def test_receita_por_instrutor_acompanha_a_troca(banco):
+    conn = sqlite3.connect(banco)
+    cliente_id, valor = conn.execute(
+        "SELECT cliente_id, SUM(valor_pago) FROM pagamentos GROUP BY cliente_id LIMIT 1").fetchone()
+    instrutor_id = conn.execute("SELECT instrutor_id FROM clientes WHERE id = ?", (cliente_id,)).fetchone()[0]
+    de, para = (conn.execute("SELECT nome FROM instrutores WHERE id = ?", (i,)).fetchone()[0] for i in (
+        instrutor_id, conn.execute("SELECT id FROM instrutores WHERE id != ? LIMIT 1", (instrutor_id,)).fetchone()[0]))
+    conn.close()
+
+    antes = bk.receita_cubo(por=("instrutor",)).set_index("instrutor")["total"]
+    _executar(banco, ("UPDATE clientes SET instrutor_id = (SELECT id FROM instrutores WHERE nome = ?) WHERE id = ?",
+                      (para, cliente_id)))
+    depois = bk.receita_cubo(por=("instrutor",)).set_index("instrutor")["total"]
+
+    assert depois.get(de, 0.0) == pytest.approx(antes[de] - valor)
+    assert depois[para] == pytest.approx(antes.get(para, 0.0) + valor)
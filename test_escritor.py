@@ -0,0 +1,165 @@
+import sqlite3
+import threading
+
+import pytest
+
+import backend as bk
+
+
+class _ConexaoCommitFalha:
+    """Repassa tudo à conexão real, mas os COMMITs de número em `falhas` falham."""
+
+    def __init__(self, conn, falhas):
+        self._conn = conn
+        self.falhas = falhas
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+        if self.commits in self.falhas:
+            raise sqlite3.OperationalError("disk I/O error")
+        self._conn.commit()
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+
+def _inserir_exercicio(nome):
+    def operacao(conn):
+        conn.execute("INSERT INTO exercicios (nome, grupo_muscular) VALUES (?, 'Teste')", (nome,))
+        return nome
+    return operacao
+
+
+def _exercicios(banco):
+    conn = sqlite3.connect(banco)
+    try:
+        return {nome for (nome,) in conn.execute("SELECT nome FROM exercicios WHERE grupo_muscular = 'Teste'")}
+    finally:
+        conn.close()
+
+
+def test_escritor_sobrevive_a_commit_que_falha(banco, monkeypatch):
+    abrir = bk._abrir_conexao
+
+    def abrir_com_falha(caminho, somente_leitura=False, instrumentada=False):
+        conn = abrir(caminho, somente_leitura, instrumentada)
+        # Falha o commit do segundo grupo e o da primeira operação refeita sozinha
+        return conn if somente_leitura else _ConexaoCommitFalha(conn, {2, 3})
+
+    monkeypatch.setattr(bk, "_abrir_conexao", abrir_com_falha)
+    bk.fechar_conexoes()  # a conexão de escrita da migração é reaberta já com a falha
+    escritor = bk._escritor(banco)
+    comecou, liberar = threading.Event(), threading.Event()
+    bloqueio = escritor.enviar(lambda conn: comecou.set() or liberar.wait(10), ())
+    comecou.wait(10)  # as cinco chegam enquanto o primeiro grupo grava e formam o segundo
+    futuros = [escritor.enviar(_inserir_exercicio(f"Commit {i}"), ("exercicios",)) for i in range(5)]
+    liberar.set()
+    bloqueio.result(timeout=10)
+
+    # O grupo das cinco é refeito operação a operação: só a que falhou de novo recebe o erro
+    with pytest.raises(sqlite3.OperationalError, match="I/O"):
+        futuros[0].result(timeout=10)
+    assert [futuro.result(timeout=10) for futuro in futuros[1:]] == [f"Commit {i}" for i in range(1, 5)]
+    assert _exercicios(banco) == {f"Commit {i}" for i in range(1, 5)}
+
+    assert bk.novo_exercicio("Depois do commit", "Teste") == "Exercício 'Depois do commit' inserido com sucesso!"
+
+
+def test_operacao_que_desfaz_a_transacao_nao_derruba_o_grupo(banco):
+    def operacao_ruim(conn):
+        conn.execute("ROLLBACK")  # como o SQLite faz sozinho após SQLITE_FULL ou interrupt()
+        raise sqlite3.OperationalError("database or disk is full")
+
+    escritor = bk._escritor(banco)
+    boa = escritor.enviar(_inserir_exercicio("Antes"), ("exercicios",))
+    ruim = escritor.enviar(operacao_ruim, ("exercicios",))
+    outra = escritor.enviar(_inserir_exercicio("Depois"), ("exercicios",))
+
+    assert boa.result(timeout=10) == "Antes"
+    with pytest.raises(sqlite3.OperationalError, match="full"):
+        ruim.result(timeout=10)
+    assert outra.result(timeout=10) == "Depois"
+    assert _exercicios(banco) == {"Antes", "Depois"}
+
+
+def test_thread_do_escritor_continua_apos_erro_inesperado(banco, monkeypatch):
+    gravar = bk._EscritorAgrupado._gravar
+    chamadas = []
+
+    def gravar_com_erro(self, grupo):
+        chamadas.append(len(grupo))
+        if len(chamadas) == 1:
+            raise RuntimeError("falha inesperada")
+        return gravar(self, grupo)
+
+    monkeypatch.setattr(bk._EscritorAgrupado, "_gravar", gravar_com_erro)
+    escritor = bk._escritor(banco)
+    with pytest.raises(RuntimeError):
+        escritor.enviar(_inserir_exercicio("Perdido"), ("exercicios",)).result(timeout=10)
+    assert escritor.enviar(_inserir_exercicio("Seguinte"), ("exercicios",)).result(timeout=10) == "Seguinte"
+
+
+def _com_escritor_ocupado(banco, monkeypatch, chamada):
+    """Roda `chamada` com o escritor preso numa operação lenta e a espera reduzida."""
+    monkeypatch.setattr(bk, "ESPERA_ESCRITA_SEG", 0.2)
+    comecou, liberar = threading.Event(), threading.Event()
+
+    def operacao_lenta(conn):
+        comecou.set()
+        liberar.wait(10)
+
+    escritor = bk._escritor(banco)
+    lenta = escritor.enviar(operacao_lenta, ())
+    comecou.wait(10)  # a escrita fica na fila, atrás do grupo que está gravando
+    try:
+        resultado = chamada()
+    finally:
+        liberar.set()
+    lenta.result(timeout=10)
+    # A operação cancelada não roda quando o escritor chega nela
+    escritor.enviar(lambda conn: None, ()).result(timeout=10)
+    return resultado
+
+
+def _contar(banco, sql):
+    conn = sqlite3.connect(banco)
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_espera_esgotada_vira_erro_e_nao_grava(banco, monkeypatch):
+    resultado = _com_escritor_ocupado(banco, monkeypatch, lambda: bk.novo_pagamento(
+        bk.catalogo().nomes("clientes")[0], bk.catalogo().nomes("planos")[0], "2031-01-01"))
+
+    assert resultado["status"] == "erro"
+    assert "nada foi gravado" in resultado["mensagem"]
+    assert _contar(banco, "SELECT COUNT(*) FROM pagamentos WHERE data_pagamento = '2031-01-01'") == 0
+
+
+def test_espera_esgotada_no_lote_mantem_as_linhas(banco, monkeypatch):
+    cliente, plano = bk.catalogo().nomes("clientes")[0], bk.catalogo().nomes("planos")[0]
+    entradas = [(cliente, plano, "2031-02-01"), ("Ninguém", plano, "2031-02-02")]
+    resultado = _com_escritor_ocupado(banco, monkeypatch, lambda: bk.registrar_pagamentos_lote(entradas))
+
+    assert resultado["status"] == "erro"
+    assert resultado["inseridos"] == 0
+    assert [linha["status"] for linha in resultado["linhas"]] == ["erro", "erro"]
+    assert "nada foi gravado" in resultado["linhas"][0]["mensagem"]
+    assert "não encontrado" in resultado["linhas"][1]["mensagem"]
+    assert all("registro" not in linha for linha in resultado["linhas"])
+    assert _contar(banco, "SELECT COUNT(*) FROM pagamentos WHERE data_pagamento LIKE '2031-02-%'") == 0
+
+
+def test_espera_esgotada_em_cadastro_que_devolve_texto(banco, monkeypatch):
+    data = _contar(banco, "SELECT MIN(data_inicio) FROM treinos")
+    exercicio = bk.catalogo().nomes("exercicios")[0]
+    antes = _contar(banco, "SELECT COUNT(*) FROM treino_exercicios")
+    resultado = _com_escritor_ocupado(
+        banco, monkeypatch, lambda: bk.novo_treino_exercicio(data, "A", exercicio, 97, 13))
+
+    assert isinstance(resultado, str)
+    assert "nada foi gravado" in resultado
+    assert _contar(banco, "SELECT COUNT(*) FROM treino_exercicios") == antes
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+
+import pytest
+
+import backend as bk
+
+pytest.importorskip("matplotlib")
+
+
+@pytest.fixture
+def desenhos(banco, monkeypatch):
+    """Conta quantas vezes cada gráfico foi desenhado de fato."""
+    contagem = {}
+    monkeypatch.setattr(bk, "_cache_graficos", OrderedDict())
+    for nome, (gerar, tabelas) in list(bk._GRAFICOS.items()):
+        def contar(nome=nome, gerar=gerar):
+            contagem[nome] = contagem.get(nome, 0) + 1
+            return gerar()
+        monkeypatch.setitem(bk._GRAFICOS, nome, (contar, tabelas))
+    return contagem
+
+
+def _novo_cliente(nome):
+    cat = bk.catalogo()
+    resposta = bk.novo_cliente(nome, 30, "F", f"{nome.split()[0].lower()}@exemplo.com", "1",
+                               cat.nomes("planos")[0], cat.nomes("instrutores")[0])
+    assert resposta["status"] == "sucesso"
+
+
+def test_grafico_repetido_vem_do_cache(desenhos):
+    primeira = bk.grafico_imagem("clientes_por_plano")
+    segunda = bk.grafico_imagem("clientes_por_plano")
+
+    assert primeira is segunda
+    assert primeira.startswith(b"\x89PNG")
+    assert bk.grafico_imagem("clientes_por_plano", "svg").lstrip().startswith(b"<?xml")
+    assert desenhos == {"clientes_por_plano": 2}  # um por formato
+    assert bk._plt().get_fignums() == []  # as figuras foram fechadas depois de rasterizadas
+
+
+def test_escrita_redesenha_so_os_graficos_da_tabela(desenhos):
+    bk.grafico_imagem("clientes_por_plano")
+    bk.grafico_imagem("treinos_por_cliente")
+
+    _novo_cliente("Grafico Novo")
+    bk.grafico_imagem("clientes_por_plano")
+    bk.grafico_imagem("treinos_por_cliente")
+
+    assert desenhos == {"clientes_por_plano": 2, "treinos_por_cliente": 1}
+    # A versão antiga saiu do cache: só uma entrada por gráfico e formato
+    assert sorted(chave[0] for chave in bk._cache_graficos) == ["clientes_por_plano", "treinos_por_cliente"]
+
+
+def test_cache_de_graficos_tem_limite(desenhos, monkeypatch):
+    monkeypatch.setattr(bk, "TAMANHO_CACHE_GRAFICOS", 2)
+    for nome in ("clientes_por_plano", "instrutores", "pagamentos"):
+        bk.grafico_imagem(nome)
+    bk.grafico_imagem("clientes_por_plano")
+
+    assert desenhos["clientes_por_plano"] == 2  # o menos usado saiu primeiro
+    assert len(bk._cache_graficos) == 2
+
+
+def test_grafico_desconhecido(banco):
+    with pytest.raises(ValueError, match="desconhecido"):
+        bk.grafico_imagem("nao_existe")
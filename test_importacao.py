@@ -0,0 +1,79 @@
+import sqlite3
+
+import backend as bk
+from conftest import PASTA
+
+
+def _linha(banco, sql, parametros=()):
+    conn = sqlite3.connect(banco)
+    try:
+        return conn.execute(sql, parametros).fetchone()
+    finally:
+        conn.close()
+
+
+def _contar(banco, sql, parametros=()):
+    return _linha(banco, sql, parametros)[0]
+
+
+def test_banco_novo_carrega_os_csvs_e_a_segunda_carga_nao_repete(tmp_path, monkeypatch):
+    monkeypatch.chdir(PASTA)  # os CSVs iniciais são caminhos relativos
+    monkeypatch.setattr(bk, "DB_PATH", str(tmp_path / "novo.db"))
+    try:
+        primeira = bk.inicializar_banco()
+        segunda = bk.inicializar_banco()
+    finally:
+        bk.fechar_conexoes()
+
+    for resultado in primeira:
+        assert resultado.inseridas + resultado.ignoradas + resultado.rejeitadas == resultado.lidas
+        assert resultado.inseridas > 0, resultado.tabela
+    assert [r.inseridas for r in segunda] == [0] * len(segunda)
+    assert [r.ignoradas for r in segunda] == [r.lidas - r.rejeitadas for r in segunda]
+    for resultado in primeira:
+        assert _contar(str(tmp_path / "novo.db"), f"SELECT COUNT(*) FROM {resultado.tabela}") == resultado.inseridas
+
+
+def test_carga_ignora_repetidos_e_rejeita_invalidos_entre_lotes(banco, tmp_path):
+    existente = _linha(banco, "SELECT cliente_id, plano_id, valor_pago, data_pagamento FROM pagamentos LIMIT 1")
+    arquivo = tmp_path / "pagamentos.csv"
+    arquivo.write_text(
+        "cliente_id,plano_id,valor_pago,data_pagamento\n"
+        "1,1,99.5,2031-01-05\n"
+        "1,1,99.5,2031-01-05T00:00:00\n"    # mesma data em outro formato, no mesmo arquivo
+        f"{existente[0]},{existente[1]},{existente[2]},{existente[3]}\n"  # já está no banco
+        "2,1,99.5,2031-13-40\n"             # data inválida
+        "2,1,,2031-01-06\n"                  # valor obrigatório vazio
+        "2.5,1,99.5,2031-01-06\n"            # id não inteiro
+        "2,1,99.5,2031-01-06\n"
+        "1,1,99.5,2031-01-05\n",            # repetido em outro lote
+        encoding="utf-8",
+    )
+
+    resultado = bk.importar_csv(str(arquivo), "pagamentos", tamanho_lote=3)
+
+    assert (resultado.lidas, resultado.inseridas, resultado.ignoradas, resultado.rejeitadas) == (8, 2, 3, 3)
+    assert _contar(banco, "SELECT COUNT(*) FROM pagamentos WHERE data_pagamento LIKE '2031-%'") == 2
+    assert bk.importar_csv(str(arquivo), "pagamentos").inseridas == 0
+
+
+def test_carga_nao_duplica_chave_com_nulos(banco, tmp_path):
+    arquivo = tmp_path / "treinos.csv"
+    arquivo.write_text("cliente_id,instrutor_id,data_inicio,data_fim,plano_id\n1,1,2031-02-01,,\n",
+                       encoding="utf-8")
+
+    assert bk.importar_csv(str(arquivo), "treinos").inseridas == 1
+    assert bk.importar_csv(str(arquivo), "treinos").ignoradas == 1
+    assert _contar(banco, "SELECT COUNT(*) FROM treinos WHERE data_inicio = '2031-02-01' AND data_fim IS NULL") == 1
+
+
+def test_carga_invalida_o_cache_das_leituras(banco, tmp_path):
+    antes = len(bk.get_clientes())
+    arquivo = tmp_path / "clientes.csv"
+    arquivo.write_text("nome,idade,sexo,email,telefone,plano_id,instrutor_id\n"
+                       "Cliente Importado,40,F,importado@exemplo.com,1,1,1\n", encoding="utf-8")
+
+    bk.importar_csv(str(arquivo), "clientes")
+
+    assert len(bk.get_clientes()) == antes + 1
+    assert bk.catalogo().buscar("clientes", "Cliente Importado") is not None
@@ -0,0 +1,81 @@
+import json
+import random
+import sqlite3
+
+import numpy as np
+import pytest
+
+import backend as bk
+
+
+@pytest.fixture
+def instrumentado(banco, tmp_path):
+    bk.limpar_estatisticas()
+    trace = tmp_path / "trace.jsonl"
+    bk.ativar_instrumentacao(str(trace))
+    yield trace
+    bk.desativar_instrumentacao()
+    bk.limpar_estatisticas()
+
+
+def _medir(funcao, tempos, sql="SELECT 1"):
+    for ms in tempos:
+        bk._registrar_consulta({"funcao": funcao, "pagina": None, "sql": sql, "parametros": "nenhum",
+                                "linhas": 1, "ms": ms, "espera_ms": 0.0})
+
+
+def test_percentis_batem_com_o_numpy(monkeypatch):
+    monkeypatch.setattr(bk, "_instrumentacao", {"ativa": False, "trace": None})
+    bk.limpar_estatisticas()
+    sorteio = random.Random(7)
+    tempos = [round(sorteio.lognormvariate(0, 1), 3) for _ in range(537)]
+    _medir("consulta_teste", tempos)
+
+    linha = bk.estatisticas_consultas().set_index("funcao").loc["consulta_teste"]
+
+    for p in (50, 95, 99):
+        assert linha[f"p{p}_ms"] == np.percentile(tempos, p, method="nearest"), p
+    assert linha["max_ms"] == max(tempos)
+    assert linha["execucoes"] == len(tempos)
+    assert linha["total_ms"] == pytest.approx(sum(tempos), abs=0.01)
+    bk.limpar_estatisticas()
+
+
+def test_percentis_usam_so_a_janela_movel(monkeypatch):
+    monkeypatch.setattr(bk, "_instrumentacao", {"ativa": False, "trace": None})
+    monkeypatch.setattr(bk, "JANELA_PERCENTIS", 100)
+    bk.limpar_estatisticas()
+    _medir("consulta_teste", [1000.0] * 50 + [1.0] * 100)  # as lentas saíram da janela
+
+    linha = bk.estatisticas_consultas().set_index("funcao").loc["consulta_teste"]
+
+    assert (linha["p50_ms"], linha["p99_ms"], linha["max_ms"]) == (1.0, 1.0, 1.0)
+    assert linha["execucoes"] == 150  # os totais contam todas as execuções
+    assert bk.consultas_mais_lentas(1)["ms"].tolist() == [1000.0]
+    bk.limpar_estatisticas()
+
+
+def test_consultas_do_backend_sao_medidas_por_funcao_e_pagina(instrumentado):
+    with bk.pagina_instrumentada("Clientes"):
+        clientes = bk.get_clientes()
+
+    estatisticas = bk.estatisticas_consultas().set_index("funcao")
+    assert estatisticas.loc["get_clientes", "execucoes"] == 1
+    assert estatisticas.loc["get_clientes", "linhas_media"] == len(clientes)
+    paginas = bk.totais_por_pagina().set_index("pagina")
+    assert paginas.loc["Clientes", "consultas"] == estatisticas["execucoes"].sum()
+
+    registros = [json.loads(linha) for linha in instrumentado.read_text(encoding="utf-8").splitlines()]
+    assert {"get_clientes"} <= {registro["funcao"] for registro in registros}
+    assert all(registro["pagina"] == "Clientes" for registro in registros)
+
+
+def test_desativada_as_conexoes_voltam_a_ser_comuns(instrumentado):
+    with bk._leitura() as conn:
+        assert isinstance(conn, bk._ConexaoInstrumentada)
+    bk.desativar_instrumentacao()
+    antes = bk.estatisticas_consultas()["execucoes"].sum()
+    with bk._leitura() as conn:
+        assert type(conn) is sqlite3.Connection
+        conn.execute("SELECT COUNT(*) FROM clientes").fetchone()
+    assert bk.estatisticas_consultas()["execucoes"].sum() == antes
@@ -0,0 +1,68 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import backend as bk
+
+
+def _kpis_como_antes(banco, hoje):
+    """Os oito indicadores pelas consultas separadas de antes (uma conexão cada)."""
+    mes = hoje.strftime("%Y-%m")
+    consultas = {
+        "total_clientes": ("SELECT COUNT(*) FROM clientes", ()),
+        "total_planos": ("SELECT COUNT(*) FROM planos", ()),
+        "pagamentos_mes": ("SELECT COUNT(*) FROM pagamentos WHERE strftime('%Y-%m', data_pagamento) = ?", (mes,)),
+        "media_idade": ("SELECT AVG(idade) FROM clientes", ()),
+        "clientes_ativos": ("SELECT COUNT(DISTINCT cliente_id) FROM treinos WHERE date(data_fim) >= date(?)",
+                            (hoje.isoformat(),)),
+        "receita_mes": ("SELECT IFNULL(SUM(valor_pago), 0) FROM pagamentos WHERE strftime('%Y-%m', data_pagamento) = ?",
+                        (mes,)),
+        "novos_30dias": ("SELECT COUNT(DISTINCT cliente_id) FROM treinos WHERE date(data_inicio) >= date(?, '-30 day')",
+                         (hoje.isoformat(),)),
+    }
+    resultado = {}
+    for nome, (sql, parametros) in consultas.items():
+        conn = sqlite3.connect(banco)
+        resultado[nome] = conn.execute(sql, parametros).fetchone()[0]
+        conn.close()
+    conn = sqlite3.connect(banco)
+    resultado["top1_plano"] = conn.execute("""
+        SELECT p.nome, COUNT(*) AS total FROM clientes c JOIN planos p ON c.plano_id = p.id
+        GROUP BY p.nome ORDER BY total DESC LIMIT 1""").fetchall()
+    conn.close()
+    return resultado
+
+
+def test_kpis_numa_consulta_batem_com_as_consultas_separadas(banco):
+    hoje = datetime.date.today()
+    cat = bk.catalogo()
+    plano = cat.nomes("planos")[0]
+    # Movimento no mês corrente, para os indicadores do mês não darem zero
+    clientes = cat.registros("clientes")[:3]
+    for i, cliente in enumerate(clientes):
+        assert bk.novo_pagamento(None, plano, hoje - datetime.timedelta(days=i), cliente_id=cliente["id"])["status"] == "sucesso"
+    assert bk.novo_treino(None, hoje - datetime.timedelta(days=5), cliente_id=clientes[0]["id"])["status"] == "success"
+
+    kpis = bk.get_kpis_dashboard()
+    antes = _kpis_como_antes(banco, hoje)
+
+    assert kpis.referencia == hoje
+    assert kpis.pagamentos_mes >= 1 and kpis.clientes_ativos >= 1 and kpis.novos_30dias >= 1
+    for nome, valor in antes.items():
+        esperado = pytest.approx(valor) if isinstance(valor, float) else valor
+        assert getattr(kpis, nome) == esperado, nome
+    assert bk.get_top1_plano() == antes["top1_plano"]
+    assert bk.get_receita_mes_atual() == pytest.approx(antes["receita_mes"])
+
+
+def test_kpis_de_banco_vazio(tmp_path, monkeypatch):
+    monkeypatch.setattr(bk, "DB_PATH", str(tmp_path / "vazio.db"))
+    try:
+        bk.migrar_banco()
+        kpis = bk.get_kpis_dashboard()
+    finally:
+        bk.fechar_conexoes()
+
+    assert (kpis.total_clientes, kpis.pagamentos_mes, kpis.clientes_ativos, kpis.novos_30dias) == (0, 0, 0, 0)
+    assert (kpis.media_idade, kpis.receita_mes, kpis.top1_plano) == (0.0, 0.0, [])
@@ -0,0 +1,152 @@
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import backend as bk
+from conftest import PASTA
+
+ULTIMA_VERSAO = bk._MIGRACOES[-1][0]
+
+
+@pytest.fixture
+def banco_sem_migrar(tmp_path, monkeypatch):
+    caminho = tmp_path / "academia_db.db"
+    shutil.copy(PASTA / "academia_db.db", caminho)
+    monkeypatch.setattr(bk, "DB_PATH", str(caminho))
+    yield str(caminho)
+    bk.fechar_conexoes()
+
+
+def _contagens(caminho, tabelas):
+    conn = sqlite3.connect(caminho)
+    try:
+        return {tabela: conn.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0] for tabela in tabelas}
+    finally:
+        conn.close()
+
+
+def test_banco_novo_chega_a_ultima_versao(tmp_path, monkeypatch):
+    monkeypatch.setattr(bk, "DB_PATH", str(tmp_path / "novo.db"))
+    try:
+        aplicadas = bk.migrar_banco()
+        assert [versao for versao, _ in aplicadas] == [versao for versao, _, _ in bk._MIGRACOES]
+        assert bk.versao_esquema() == ULTIMA_VERSAO
+        assert bk.migrar_banco() == []
+        assert _contagens(bk.DB_PATH, bk.TABELAS) == dict.fromkeys(bk.TABELAS, 0)
+    finally:
+        bk.fechar_conexoes()
+
+
+def test_banco_existente_preserva_os_dados(banco_sem_migrar):
+    originais = ("clientes", "instrutores", "planos", "exercicios", "treinos", "treino_exercicios", "pagamentos")
+    antes = _contagens(banco_sem_migrar, originais)
+    assert bk.versao_esquema() == 0
+
+    bk.migrar_banco()
+
+    assert bk.versao_esquema() == ULTIMA_VERSAO
+    assert _contagens(banco_sem_migrar, originais) == antes
+    conn = sqlite3.connect(banco_sem_migrar)
+    fora_do_formato = conn.execute("""
+        SELECT COUNT(*) FROM pagamentos
+        WHERE data_pagamento IS NOT NULL AND data_pagamento NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+    """).fetchone()[0]
+    indices = {nome for (nome,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    gatilhos = {nome for (nome,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    versoes = dict(conn.execute("SELECT tabela, versao FROM versoes"))
+    conn.close()
+    assert fora_do_formato == 0
+    assert {"idx_clientes_nome", "idx_clientes_instrutor", "idx_pagamentos_data", "idx_treinos_data_inicio"} <= indices
+    assert {"trg_receita_cubo_insert", "trg_receita_cubo_cliente_instrutor", "trg_busca_clientes_update",
+            "trg_versao_pagamentos_insert", "trg_snapshot_pagamentos_update"} <= gatilhos
+    assert set(versoes) == set(bk.TABELAS)
+
+
+def test_processos_migrando_ao_mesmo_tempo_aplicam_cada_versao_uma_vez(banco_sem_migrar):
+    codigo = "import backend as bk; print(','.join(str(v) for v, _ in bk.migrar_banco()))"
+    processos = [
+        subprocess.Popen([sys.executable, "-c", codigo], cwd=PASTA, stdout=subprocess.PIPE, text=True,
+                         env={"ACADEMIA_DB": banco_sem_migrar, "PATH": ""})
+        for _ in range(3)
+    ]
+    aplicadas = []
+    for processo in processos:
+        saida, _ = processo.communicate(timeout=60)
+        assert processo.returncode == 0
+        aplicadas += [int(v) for v in saida.strip().split(",") if v]
+
+    assert sorted(aplicadas) == [versao for versao, _, _ in bk._MIGRACOES]
+    assert bk.versao_esquema() == ULTIMA_VERSAO
+
+
+def _semear_colisoes(caminho):
+    """Pagamento e treino já existentes gravados de novo com data e hora; devolve os ids novos."""
+    conn = sqlite3.connect(caminho)
+    pagamento = conn.execute("""
+        INSERT INTO pagamentos (cliente_id, data_pagamento, valor_pago, plano_id)
+        SELECT cliente_id, data_pagamento || ' 00:00:00', valor_pago, plano_id FROM pagamentos WHERE id = 1
+        RETURNING id""").fetchone()[0]
+    treino = conn.execute("""
+        INSERT INTO treinos (cliente_id, instrutor_id, data_inicio, data_fim, plano_id)
+        SELECT cliente_id, instrutor_id, data_inicio || ' 00:00:00', data_fim, plano_id FROM treinos WHERE id = 1
+        RETURNING id""").fetchone()[0]
+    # Um item igual a um do treino original e um que só o duplicado tem
+    conn.execute("INSERT INTO treino_exercicios (treino_id, treino, exercicio_id, exercicio, series, repeticoes) "
+                 "SELECT ?, treino, exercicio_id, exercicio, series, repeticoes FROM treino_exercicios WHERE id = 1",
+                 (treino,))
+    conn.execute("INSERT INTO treino_exercicios (treino_id, treino, exercicio_id, exercicio, series, repeticoes) "
+                 "VALUES (?, 'a', 1, 'agachamento', 5, 5)", (treino,))
+    conn.commit()
+    conn.close()
+    return pagamento, treino
+
+
+def _conferir_colisoes_resolvidas(caminho, pagamento, treino):
+    conn = sqlite3.connect(caminho)
+    try:
+        fora_do_formato = conn.execute("""
+            SELECT (SELECT COUNT(*) FROM pagamentos WHERE data_pagamento <> date(data_pagamento))
+                 + (SELECT COUNT(*) FROM treinos WHERE data_inicio <> date(data_inicio) OR data_fim <> date(data_fim))
+        """).fetchone()[0]
+        assert fora_do_formato == 0
+        assert conn.execute("SELECT COUNT(*) FROM pagamentos WHERE id = ?", (pagamento,)).fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM treinos WHERE id = ?", (treino,)).fetchone()[0] == 0
+        assert conn.execute("SELECT tabela, id, mantido_id FROM datas_duplicadas ORDER BY tabela").fetchall() == [
+            ("pagamentos", pagamento, 1), ("treinos", treino, 1)]
+        # O item que só o duplicado tinha passou para o treino mantido; o repetido saiu
+        assert conn.execute("SELECT COUNT(*) FROM treino_exercicios WHERE treino_id = ?", (treino,)).fetchone()[0] == 0
+        assert conn.execute("SELECT series, repeticoes FROM treino_exercicios WHERE treino_id = 1 AND series = 5"
+                            ).fetchall() == [(5, 5)]
+    finally:
+        conn.close()
+
+
+def test_datas_que_colidem_na_normalizacao_sao_resolvidas(banco_sem_migrar):
+    antes = _contagens(banco_sem_migrar, ("pagamentos", "treinos", "treino_exercicios"))
+    pagamento, treino = _semear_colisoes(banco_sem_migrar)
+
+    bk.migrar_banco()
+
+    _conferir_colisoes_resolvidas(banco_sem_migrar, pagamento, treino)
+    depois = _contagens(banco_sem_migrar, ("pagamentos", "treinos", "treino_exercicios"))
+    assert depois == {**antes, "treino_exercicios": antes["treino_exercicios"] + 1}
+
+
+def test_colisoes_deixadas_pela_normalizacao_antiga_sao_resolvidas(banco):
+    # Banco migrado quando a normalização ainda deixava as colisões para trás
+    pagamento, treino = _semear_colisoes(banco)
+    conn = sqlite3.connect(banco)
+    conn.execute("PRAGMA user_version = 9")
+    conn.close()
+
+    assert [versao for versao, _ in bk.migrar_banco()] == [10]
+    _conferir_colisoes_resolvidas(banco, pagamento, treino)
+    # Os gatilhos tiraram do cubo de receita o pagamento removido
+    conn = sqlite3.connect(banco)
+    cubo, pagamentos = conn.execute(
+        "SELECT (SELECT SUM(total) FROM receita_cubo), (SELECT SUM(valor_pago) FROM pagamentos)").fetchone()
+    conn.close()
+    assert cubo == pytest.approx(pagamentos)
@@ -0,0 +1,113 @@
+import collections
+import sqlite3
+
+import pytest
+
+import backend as bk
+
+
+@pytest.fixture
+def exercicios(banco):
+    return bk.catalogo().nomes("exercicios")[:3]
+
+
+def _id(nome):
+    return bk.catalogo().buscar("exercicios", nome)["id"]
+
+
+def _treinos(banco, quantidade):
+    conn = sqlite3.connect(banco)
+    ids = [linha[0] for linha in conn.execute("SELECT id FROM treinos ORDER BY id LIMIT ?", (quantidade,))]
+    conn.close()
+    return ids
+
+
+def _itens_no_banco(banco, treino_ids):
+    conn = sqlite3.connect(banco)
+    marcadores = ", ".join("?" * len(treino_ids))
+    linhas = conn.execute(f"""
+        SELECT treino_id, exercicio_id, series, repeticoes FROM treino_exercicios
+        WHERE treino_id IN ({marcadores})
+    """, treino_ids).fetchall()
+    conn.close()
+    return collections.Counter(linhas)
+
+
+def test_salvar_listar_substituir_e_excluir(banco, exercicios):
+    a, b, c = exercicios
+    resultado = bk.salvar_modelo_treino("Iniciante", [(a, 3, 12), {"exercicio": b, "series": 4, "repeticoes": 10}])
+    assert resultado["status"] == "sucesso"
+    modelos = bk.listar_modelos_treino()
+    assert modelos[["modelo", "ordem", "exercicio", "series", "repeticoes"]].values.tolist() == [
+        ["Iniciante", 1, a, 3, 12], ["Iniciante", 2, b, 4, 10]]
+
+    # Salvar de novo com o mesmo nome substitui a lista, sem criar outro modelo
+    assert bk.salvar_modelo_treino("Iniciante", [(c, 2, 15)])["status"] == "sucesso"
+    modelos = bk.listar_modelos_treino()
+    assert modelos[["modelo", "exercicio"]].values.tolist() == [["Iniciante", c]]
+
+    assert bk.excluir_modelo_treino("Iniciante")["status"] == "sucesso"
+    assert bk.listar_modelos_treino().empty
+    assert bk.excluir_modelo_treino("Iniciante")["status"] == "erro"
+    conn = sqlite3.connect(banco)
+    assert conn.execute("SELECT COUNT(*) FROM modelo_exercicios").fetchone()[0] == 0
+    conn.close()
+
+
+@pytest.mark.parametrize("itens", [
+    [("Exercício que não existe", 3, 10)],
+    [(None, 3, 10)],
+    [("{a}", 0, 10)],
+    [("{a}", "três", 10)],
+    [],
+])
+def test_salvar_recusa_itens_invalidos_sem_gravar(banco, exercicios, itens):
+    itens = [(nome.format(a=exercicios[0]) if nome else nome, series, repeticoes)
+             for nome, series, repeticoes in itens]
+    assert bk.salvar_modelo_treino("Inválido", itens)["status"] == "erro"
+    assert bk.salvar_modelo_treino("  ", [(exercicios[0], 3, 10)])["status"] == "erro"
+    assert bk.listar_modelos_treino().empty
+
+
+def test_aplicar_adiciona_a_todos_os_treinos_e_ignora_duplicados(banco, exercicios):
+    a, b, _ = exercicios
+    # O mesmo item repetido no modelo entra uma vez só em cada treino
+    assert bk.salvar_modelo_treino("Força", [(a, 3, 12), (b, 4, 10), (a, 3, 12)])["status"] == "sucesso"
+    treinos = _treinos(banco, 3)
+    # Um dos treinos já tem um dos itens do modelo
+    conn = sqlite3.connect(banco)
+    conn.execute("""
+        INSERT OR IGNORE INTO treino_exercicios (treino_id, treino, exercicio_id, exercicio, series, repeticoes)
+        VALUES (?, '', ?, ?, 3, 12)
+    """, (treinos[0], _id(a), a))
+    conn.commit()
+    conn.close()
+    antes = _itens_no_banco(banco, treinos)
+
+    resultado = bk.aplicar_modelo_treino("Força", treinos + [treinos[1]], tipo_treino="A")
+    assert resultado["status"] == "sucesso"
+    assert resultado["adicionados"] == 5  # 2 itens x 3 treinos, menos o que já estava
+    assert resultado["ignorados"] == 1 + 3  # o que já estava + a repetição do modelo em cada treino
+    depois = _itens_no_banco(banco, treinos)
+    for treino_id in treinos:
+        for item in ((treino_id, _id(a), 3, 12), (treino_id, _id(b), 4, 10)):
+            assert depois[item] == 1
+    assert sum(depois.values()) - sum(antes.values()) == 5
+
+    # Aplicar de novo não duplica nada
+    de_novo = bk.aplicar_modelo_treino("Força", treinos)
+    assert de_novo["adicionados"] == 0 and de_novo["ignorados"] == 9
+    assert _itens_no_banco(banco, treinos) == depois
+
+
+def test_aplicar_modelo_ou_treino_inexistente(banco, exercicios):
+    treinos = _treinos(banco, 1)
+    assert bk.aplicar_modelo_treino("Não existe", treinos)["status"] == "erro"
+    assert bk.aplicar_modelo_treino("Não existe", [])["status"] == "erro"
+
+    assert bk.salvar_modelo_treino("Cardio", [(exercicios[0], 1, 20)])["status"] == "sucesso"
+    resultado = bk.aplicar_modelo_treino("Cardio", treinos + [10**9])
+    assert resultado["status"] == "sucesso" and resultado["adicionados"] == 1
+    assert [linha["status"] for linha in resultado["linhas"]] == ["sucesso", "erro"]
+    assert str(10**9) in resultado["mensagem"]
+    assert bk.aplicar_modelo_treino("Cardio", [10**9])["status"] == "erro"
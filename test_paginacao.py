@@ -0,0 +1,83 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import backend as bk
+
+TAMANHO = 3
+
+
+def _paginas(funcao, **filtros):
+    paginas, apos = [], None
+    while True:
+        pagina = funcao(apos=apos, tamanho=TAMANHO, **filtros)
+        paginas.append(pagina.dados)
+        apos = pagina.proximo
+        if apos is None:
+            return paginas, pagina.total
+
+
+def _por_offset(banco, sql, parametros=()):
+    """As mesmas páginas lidas com LIMIT/OFFSET sobre a ordenação completa."""
+    conn = sqlite3.connect(banco)
+    paginas, deslocamento = [], 0
+    while True:
+        pagina = pd.read_sql_query(f"{sql} LIMIT ? OFFSET ?", conn, params=(*parametros, TAMANHO, deslocamento))
+        if pagina.empty:
+            break
+        paginas.append(pagina)
+        deslocamento += TAMANHO
+    conn.close()
+    return paginas
+
+
+def _duplicar_nomes(banco):
+    # Homônimos empatam no primeiro campo da chave (nome do cliente)
+    conn = sqlite3.connect(banco)
+    conn.execute("UPDATE clientes SET nome = (SELECT nome FROM clientes ORDER BY id LIMIT 1) "
+                 "WHERE id IN (SELECT cliente_id FROM treinos GROUP BY cliente_id LIMIT 3)")
+    conn.commit()
+    conn.close()
+
+
+@pytest.mark.parametrize("filtros", [{}, {"grupo_muscular": "Peito"}, {"data_inicio": "2024-06-01"}])
+def test_paginas_de_treinos_iguais_as_de_offset(banco, filtros):
+    _duplicar_nomes(banco)
+    paginas, total = _paginas(bk.listar_treinos_paginado, **filtros)
+    where, parametros = bk._filtros_sql([
+        ("e.grupo_muscular = ?", filtros.get("grupo_muscular")),
+        ("t.data_inicio >= ?", filtros.get("data_inicio")),
+    ])
+    esperadas = _por_offset(banco, f"""
+        SELECT t.id AS Treino_ID, c.nome AS Cliente, te.id AS item
+        FROM treinos t
+        JOIN clientes c ON c.id = t.cliente_id
+        JOIN instrutores i ON i.id = t.instrutor_id
+        JOIN treino_exercicios te ON te.treino_id = t.id
+        JOIN exercicios e ON e.id = te.exercicio_id
+        {where}
+        ORDER BY c.nome, COALESCE(t.data_inicio, ''), te.id
+    """, parametros)
+
+    assert total == sum(map(len, esperadas)) > TAMANHO
+    assert len([p for p in paginas if not p.empty]) == len(esperadas)
+    for pagina, esperada in zip(paginas, esperadas):
+        assert pagina[["Treino_ID", "Cliente"]].values.tolist() == esperada[["Treino_ID", "Cliente"]].values.tolist()
+
+
+def test_paginas_do_resumo_de_pagamentos_iguais_as_de_offset(banco):
+    paginas, total = _paginas(bk.resumo_pagamentos_paginado, data_inicio="2024-01-01")
+    esperadas = _por_offset(banco, """
+        SELECT c.id AS cliente_id,
+               (SELECT COALESCE(SUM(valor_pago), 0.0) FROM pagamentos p
+                WHERE p.cliente_id = c.id AND p.data_pagamento >= '2024-01-01') AS total_pago
+        FROM clientes c ORDER BY c.id
+    """)
+
+    assert total == sum(map(len, esperadas)) > TAMANHO
+    obtido = pd.concat(paginas, ignore_index=True)
+    esperado = pd.concat(esperadas, ignore_index=True)
+    assert obtido["cliente_id"].tolist() == esperado["cliente_id"].tolist()
+    assert obtido["total_pago"].tolist() == pytest.approx(esperado["total_pago"].tolist())
+    assert [len(p) for p in paginas if not p.empty] == [len(p) for p in esperadas]
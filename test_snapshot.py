@@ -0,0 +1,144 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import backend as bk
+
+pytest.importorskip("pyarrow")
+
+
+def _executar(banco, *comandos):
+    conn = sqlite3.connect(banco)
+    for sql, parametros in comandos:
+        conn.execute(sql, parametros)
+    conn.commit()
+    conn.close()
+
+
+def _tabela(banco, tabela, colunas):
+    conn = sqlite3.connect(banco)
+    try:
+        return pd.read_sql_query(f"SELECT {', '.join(colunas)} FROM {tabela} ORDER BY id", conn)
+    finally:
+        conn.close()
+
+
+def _snapshot(pasta, tabela, colunas):
+    df = bk.ler_snapshot(tabela, colunas, pasta=pasta).sort_values("id", ignore_index=True)
+    for coluna in df.columns:
+        if coluna.startswith("data"):
+            df[coluna] = df[coluna].astype(str)
+    return df
+
+
+def test_snapshot_acompanha_alteracoes_e_exclusoes(banco, tmp_path):
+    pasta = tmp_path / "snapshot"
+    colunas = ["id", "cliente_id", "plano_id", "valor_pago", "data_pagamento"]
+    bk.exportar_snapshot(pasta=pasta, tamanho_lote=7)
+    pd.testing.assert_frame_equal(_snapshot(pasta, "pagamentos", colunas),
+                                  _tabela(banco, "pagamentos", colunas), check_dtype=False)
+
+    primeiro, segundo, terceiro = _tabela(banco, "pagamentos", ["id"])["id"].tolist()[:3]
+    _executar(
+        banco,
+        ("UPDATE pagamentos SET valor_pago = valor_pago + 1 WHERE id = ?", (primeiro,)),
+        ("UPDATE pagamentos SET data_pagamento = '2031-05-10' WHERE id = ?", (segundo,)),
+        ("DELETE FROM pagamentos WHERE id = ?", (terceiro,)),
+    )
+    exportadas = bk.exportar_snapshot(pasta=pasta, tamanho_lote=7)
+
+    assert 0 < exportadas["pagamentos"] < len(_tabela(banco, "pagamentos", ["id"]))
+    assert exportadas["treinos"] == 0
+    pd.testing.assert_frame_equal(_snapshot(pasta, "pagamentos", colunas),
+                                  _tabela(banco, "pagamentos", colunas), check_dtype=False)
+    assert bk.estado_snapshot(pasta)["pagamentos"]["linhas"] == len(_tabela(banco, "pagamentos", ["id"]))
+
+    # Nada mudou: nada é regravado
+    assert bk.exportar_snapshot(pasta=pasta) == {tabela: 0 for tabela in bk._FATOS_SNAPSHOT}
+
+
+def test_itens_acompanham_a_data_do_treino(banco, tmp_path):
+    pasta = tmp_path / "snapshot"
+    bk.exportar_snapshot(pasta=pasta)
+    treino_id = int(_tabela(banco, "treino_exercicios", ["id", "treino_id"])["treino_id"].iloc[0])
+    _executar(banco, ("UPDATE treinos SET data_inicio = '2032-01-01' WHERE id = ?", (treino_id,)))
+    bk.exportar_snapshot(pasta=pasta)
+
+    itens = bk.ler_snapshot("treino_exercicios", ["treino_id", "mes"], mes_inicio="2032-01", mes_fim="2032-01", pasta=pasta)
+    esperado = _tabela(banco, "treino_exercicios", ["id", "treino_id"]).query("treino_id == @treino_id")
+    assert len(itens) == len(esperado) > 0
+    assert len(bk.ler_snapshot("treino_exercicios", ["id"], pasta=pasta)) == len(_tabela(banco, "treino_exercicios", ["id"]))
+
+
+def test_data_invalida_vira_nula_e_fica_no_manifesto(banco, tmp_path):
+    pasta = tmp_path / "snapshot"
+    pagamento = int(_tabela(banco, "pagamentos", ["id"])["id"].iloc[0])
+    _executar(banco, ("UPDATE pagamentos SET data_pagamento = '2024-13-45' WHERE id = ?", (pagamento,)))
+
+    bk.exportar_snapshot(pasta=pasta)
+
+    invalidas = bk.datas_invalidas_snapshot(pasta)
+    assert invalidas[["tabela", "id", "coluna", "valor"]].values.tolist() == [
+        ["pagamentos", pagamento, "data_pagamento", "2024-13-45"]]
+    linha = bk.ler_snapshot("pagamentos", ["id", "data_pagamento"], pasta=pasta).query("id == @pagamento")
+    assert linha["data_pagamento"].isna().all()
+    assert bk.estado_snapshot(pasta)["pagamentos"]["datas_invalidas"] == 1
+
+
+def test_exportacao_incremental_busca_os_meses_pelo_indice(banco):
+    conn = sqlite3.connect(banco)
+    try:
+        # Volume de alguns anos, com estatísticas, para o planejador escolher como num banco real
+        cliente_id, instrutor_id, plano_id = conn.execute(
+            "SELECT id, instrutor_id, plano_id FROM clientes LIMIT 1").fetchone()
+        exercicio_id = conn.execute("SELECT id FROM exercicios LIMIT 1").fetchone()[0]
+        for dia in range(3000):
+            data = str(pd.Timestamp("2020-01-01") + pd.Timedelta(days=dia))[:10]
+            treino_id = conn.execute(
+                "INSERT INTO treinos (cliente_id, instrutor_id, data_inicio, data_fim, plano_id) "
+                "VALUES (?, ?, ?, ?, ?) RETURNING id", (cliente_id, instrutor_id, data, data, plano_id)).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO treino_exercicios (treino_id, exercicio_id, series, repeticoes) VALUES (?, ?, ?, 10)",
+                [(treino_id, exercicio_id, series) for series in range(1, 4)])
+            conn.execute("INSERT INTO pagamentos (cliente_id, data_pagamento, valor_pago, plano_id) VALUES (?, ?, 1, ?)",
+                         (cliente_id, data, plano_id))
+        conn.commit()
+        conn.execute("ANALYZE")
+        for tabela, (select, coluna, _) in bk._FATOS_SNAPSHOT.items():
+            for sql, parametros in bk._consultas_meses(select, coluna, ["2024-03", "2024-12"]):
+                plano = " | ".join(linha[3] for linha in conn.execute(f"EXPLAIN QUERY PLAN {sql}", parametros))
+                assert "idx_treinos_data_inicio" in plano or "idx_pagamentos_data" in plano, (tabela, plano)
+                assert "SCAN" not in plano, (tabela, plano)
+    finally:
+        conn.close()
+
+
+def test_exportacao_completa_interrompida_mantem_o_snapshot_anterior(banco, tmp_path, monkeypatch):
+    pasta = tmp_path / "snapshot"
+    colunas = ["id", "cliente_id", "plano_id", "valor_pago", "data_pagamento"]
+    bk.exportar_snapshot(pasta=pasta, tamanho_lote=7)
+    antes = _snapshot(pasta, "pagamentos", colunas)
+
+    # Manifesto sem os meses (formato antigo): a próxima exportação é completa
+    manifesto = bk._ler_manifesto(pasta)
+    del manifesto["pagamentos"]["meses"]
+    bk._gravar_manifesto(pasta, manifesto)
+    datas_do_lote, lotes = bk._datas_do_lote, []
+
+    def falhar_no_terceiro_lote(df, esquema):
+        lotes.append(len(df))
+        if len(lotes) == 3:
+            raise OSError("disco cheio")
+        return datas_do_lote(df, esquema)
+
+    monkeypatch.setattr(bk, "_datas_do_lote", falhar_no_terceiro_lote)
+    with pytest.raises(OSError):
+        bk.exportar_snapshot(("pagamentos",), pasta=pasta, tamanho_lote=7)
+    pd.testing.assert_frame_equal(_snapshot(pasta, "pagamentos", colunas), antes)
+
+    monkeypatch.setattr(bk, "_datas_do_lote", datas_do_lote)
+    bk.exportar_snapshot(("pagamentos",), pasta=pasta, tamanho_lote=7)
+    pd.testing.assert_frame_equal(_snapshot(pasta, "pagamentos", colunas),
+                                  _tabela(banco, "pagamentos", colunas), check_dtype=False)
+    assert [p.name for p in pasta.glob("pagamentos*")] == [bk._ler_manifesto(pasta)["pagamentos"]["pasta"]]
@@ -0,0 +1,104 @@
+import datetime
+import shutil
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import backend as bk
+from conftest import PASTA
+
+
+@pytest.fixture
+def rede(tmp_path, monkeypatch):
+    """Duas unidades: "centro" com os dados de exemplo e "sul" nova, só com os dados de referência."""
+    monkeypatch.setattr(bk, "_unidades", {})
+    monkeypatch.chdir(PASTA)  # os CSVs de referência são caminhos relativos
+    centro = tmp_path / "centro.db"
+    shutil.copy(PASTA / "academia_db.db", centro)
+    bk.registrar_unidade("centro", centro)
+    bk.registrar_unidade("sul", tmp_path / "sul.db")
+    bk.inicializar_unidades()
+
+    conn = sqlite3.connect(tmp_path / "sul.db")
+    conn.execute("INSERT INTO instrutores (nome) VALUES ('Instrutor Sul')")
+    conn.commit()
+    conn.close()
+    with bk.unidade("sul"):
+        plano = bk.catalogo().nomes("planos")[0]
+        assert bk.novo_cliente("Cliente Sul", 30, "F", "sul@example.com", "11999990000",
+                               plano, "Instrutor Sul")["status"] == "sucesso"
+        assert bk.novo_pagamento("Cliente Sul", plano, datetime.date.today().isoformat())["status"] == "sucesso"
+    yield {"centro": str(centro), "sul": str(tmp_path / "sul.db")}
+    bk.fechar_conexoes()
+
+
+def _por_unidade(func, *args, **kwargs):
+    return [_na(nome, func, *args, **kwargs) for nome in bk.unidades()]
+
+
+def _na(nome, func, *args, **kwargs):
+    with bk.unidade(nome):
+        return func(*args, **kwargs)
+
+
+def _somar(partes, chaves, medidas):
+    df = pd.concat(partes, ignore_index=True)
+    return df.groupby(chaves, as_index=False, sort=True)[medidas].sum()
+
+
+def test_agregados_da_rede_somam_os_das_unidades(rede):
+    partes = _por_unidade(bk.clientes_por_plano)
+    with bk.unidade(bk.REDE):
+        rede_df = bk.clientes_por_plano()
+    chaves = [coluna for coluna in rede_df.columns if coluna != "total"]
+    esperado = _somar(partes, chaves, ["total"])
+    pd.testing.assert_frame_equal(rede_df.reset_index(drop=True), esperado, check_dtype=False)
+
+    partes = _por_unidade(bk.receita_cubo, por=("mes", "plano"))
+    with bk.unidade(bk.REDE):
+        rede_df = bk.receita_cubo(por=("mes", "plano"))
+    esperado = _somar(partes, ["mes", "plano"], ["total", "quantidade"])
+    pd.testing.assert_frame_equal(rede_df.reset_index(drop=True), esperado, check_dtype=False)
+    # O pagamento da unidade nova entra na receita do mês da rede
+    mes = datetime.date.today().strftime("%Y-%m")
+    assert rede_df.loc[rede_df["mes"] == mes, "quantidade"].sum() == sum(
+        parte.loc[parte["mes"] == mes, "quantidade"].sum() for parte in partes)
+
+
+def test_kpis_da_rede_juntam_os_das_unidades(rede):
+    partes = _por_unidade(bk.get_kpis_dashboard)
+    with bk.unidade(bk.REDE):
+        kpis = bk.get_kpis_dashboard()
+
+    for campo in ("total_clientes", "pagamentos_mes", "clientes_ativos", "novos_30dias"):
+        assert getattr(kpis, campo) == sum(getattr(parte, campo) for parte in partes)
+    assert kpis.receita_mes == pytest.approx(sum(parte.receita_mes for parte in partes))
+    # Média ponderada pelo número de clientes, não média das médias
+    idades = []
+    for caminho in rede.values():
+        conn = sqlite3.connect(caminho)
+        idades += [idade for (idade,) in conn.execute("SELECT idade FROM clientes")]
+        conn.close()
+    assert kpis.media_idade == pytest.approx(sum(idades) / len(idades))
+    # Os planos são os mesmos nas duas unidades: contam uma vez só
+    assert kpis.total_planos == len(set(_na("centro", lambda: bk.catalogo().nomes("planos"))))
+
+
+def test_escrita_numa_unidade_invalida_o_cache_da_rede(rede):
+    with bk.unidade(bk.REDE):
+        antes = bk.get_kpis_dashboard().total_clientes
+    with bk.unidade("sul"):
+        plano = bk.catalogo().nomes("planos")[0]
+        assert bk.novo_cliente("Outra Sul", 41, "M", "outra.sul@example.com", "11999990001",
+                               plano, "Instrutor Sul")["status"] == "sucesso"
+    with bk.unidade(bk.REDE):
+        assert bk.get_kpis_dashboard().total_clientes == antes + 1
+
+
+def test_operacao_de_uma_unidade_recusa_a_rede(rede):
+    with bk.unidade(bk.REDE), pytest.raises(ValueError):
+        bk.get_clientes()
+    with pytest.raises(ValueError):
+        with bk.unidade("norte"):
+            pass